@@ -14,3 +14,11 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'reel_logger.settings')
 
 application = get_asgi_application()
+
+# like runserver, serve static files while debugging (behind a real web server they come from STATIC_ROOT)
+from django.conf import settings
+
+if settings.DEBUG:
+    from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
+
+    application = ASGIStaticFilesHandler(application)
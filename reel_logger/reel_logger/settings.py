@@ -28,6 +28,8 @@ else:
 
 DJ_CONF = SECRET.get("django", {})
 DB_CONF = SECRET.get("database", {})
+PREVIEW_CONF = SECRET.get("previews", {})
+CACHE_CONF = SECRET.get("cache", {})
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
@@ -46,6 +48,30 @@ MEDIA_URL = "/media/"
 if not os.path.exists(MEDIA_ROOT):
     os.makedirs(MEDIA_ROOT)  # Ensure the directory exists
 
+# Preview generation
+# previews are rendered by `manage.py preview_worker` instead of during the request
+
+PREVIEW_WORKER_CONCURRENCY = PREVIEW_CONF.get('worker_concurrency', 2)
+PREVIEW_MAX_ATTEMPTS = PREVIEW_CONF.get('max_attempts', 3)
+PREVIEW_TMP_DIR = PREVIEW_CONF.get('tmp_dir', None) # None uses the system temp directory
+PREVIEW_SEGMENTED = PREVIEW_CONF.get('segmented', False) # also write HLS segments for video previews
+PREVIEW_SEGMENT_SECONDS = PREVIEW_CONF.get('segment_seconds', 6)
+PREVIEW_PROXY = PREVIEW_CONF.get('proxy', True) # render a quick low resolution proxy before the preview
+
+# Caching
+# the footage list and scene pages cache their query results (see reel_logger_app/cacheHandler.py)
+# the preview worker and the other commands change footage from their own processes,
+# so the default is a cache they share with the server ('file'), local memory is per process
+
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'reel_logger'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', BASE_DIR / 'cache'),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379'), # needs the redis package
+    'dummy': ('django.core.cache.backends.dummy.DummyCache', ''), # turns caching off
+}
+CACHE_TYPE = CACHE_CONF.get('type', 'file')
+CACHE_TIMEOUT = CACHE_CONF.get('timeout', 300) # seconds, bounds how stale a page gets if something is missed
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -107,6 +133,19 @@ DATABASES = {
     },
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHE_BACKEND, CACHE_LOCATION = CACHE_BACKENDS[CACHE_TYPE]
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': CACHE_CONF.get('location', CACHE_LOCATION),
+        'TIMEOUT': CACHE_TIMEOUT,
+        'KEY_PREFIX': 'reel_logger',
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
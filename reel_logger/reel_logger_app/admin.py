@@ -1,9 +1,11 @@
 from django.contrib import admin
 
-from reel_logger_app.models import Footage, Comment, Scene, Shot, Take
+from reel_logger_app.models import Footage, Comment, Scene, Shot, Take, PreviewJob, UploadSession
 
 admin.site.register(Footage)
 admin.site.register(Comment)
 admin.site.register(Scene)
+admin.site.register(PreviewJob)
+admin.site.register(UploadSession)
 #admin.site.register(Shot)
 #admin.site.register(Take)
\ No newline at end of file
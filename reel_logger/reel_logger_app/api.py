@@ -0,0 +1,187 @@
+'''
+This is the read-only JSON API of reel_logger_app.
+It lets other tools (like our dailies scripts) read the catalogue without scraping html.
+
+Every list is paginated with a cursor (keyset pagination): each page ends with a 'next' cursor
+that encodes the primary key of the last row, and the next page starts right after it.
+That stays fast and stable no matter how deep you page, unlike page numbers / offsets.
+
+Query parameters (all optional):
+    limit           rows per page (default 100, at most 1000)
+    cursor          the 'next' value of the previous page
+    fields          comma separated list of fields to return
+    updated_since   ISO date/time, only rows changed since then (for incremental sync)
+footage also takes the same filters as the footage search (scene, shot, take, logged_filter),
+the other lists take the filters listed in RESOURCES.
+'''
+import base64
+import json
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import JsonResponse, Http404
+from django.utils.dateparse import parse_datetime, parse_date
+from django.utils import timezone
+from django.views.decorators.http import require_GET
+
+from reel_logger_app.models import Footage, Take, FootageTake, Scene, Shot, annotate_ratings
+from reel_logger_app.forms import FootageSearch
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+# what each list returns
+#   key     the fields that uniquely identify a row, in the order rows are sorted by
+#   fields  the fields a client may ask for (the default is all of them)
+#   filters query parameter -> field, for simple exact matches
+RESOURCES = {
+    'footage': {
+        'key': ('id',),
+        'fields': ('id', 'path', 'hash', 'original_filename', 'length', 'has_audio', 'has_video',
+                   'video_codec', 'audio_codec', 'width', 'height', 'framerate', 'timecode',
+                   'notes', 'logged', 'preview_status', 'average_rating', 'max_rating', 'updated'),
+        'filters': {},
+    },
+    'takes': {
+        'key': ('shot_scene_id', 'shot_name', 'take_no'),
+        'fields': ('shot_scene_id', 'shot_name', 'take_no', 'marked_scene', 'marked_shot', 'marked_take',
+                   'rating', 'notes', 'updated'),
+        'filters': {'scene': 'shot_scene_id', 'shot': 'shot_name'},
+    },
+    'footage-takes': {
+        'key': ('footage_id', 'take_scene_id', 'take_shot', 'take_no'),
+        'fields': ('footage_id', 'take_scene_id', 'take_shot', 'take_no', 'start_time', 'updated'),
+        'filters': {'footage': 'footage_id', 'scene': 'take_scene_id', 'shot': 'take_shot'},
+    },
+    'scenes': {
+        'key': ('script_number',),
+        'fields': ('script_number', 'title', 'description', 'updated'),
+        'filters': {},
+    },
+    'shots': {
+        'key': ('scene_id', 'shot'),
+        'fields': ('scene_id', 'shot', 'description', 'updated'),
+        'filters': {'scene': 'scene_id'},
+    },
+}
+
+# thrown when the query parameters do not make sense, turned into a 400 response
+class BadRequest(Exception):
+    pass
+
+# the starting queryset of each list
+def _base_queryset(resource, request):
+    if resource == 'footage':
+        footage_list = Footage.objects.all()
+        form = FootageSearch(request.GET)
+        if not form.is_valid():
+            raise BadRequest(form.errors.as_json())
+        return annotate_ratings(form.filter_footage(footage_list))
+    return {
+        'takes': Take.objects.all(),
+        'footage-takes': FootageTake.objects.all(),
+        'scenes': Scene.objects.all(),
+        'shots': Shot.objects.all(),
+    }[resource]
+
+# cursors are the key of the last row as url safe base64 json
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values, cls=DjangoJSONEncoder).encode()).decode().rstrip("=")
+
+# the values are checked against the key fields of the model, so a tampered cursor is a 400 and not a database error
+def decode_cursor(cursor, model, key):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        raise BadRequest("invalid cursor")
+    if not isinstance(values, list) or len(values) != len(key):
+        raise BadRequest("invalid cursor")
+    try:
+        return [model._meta.get_field(field).to_python(value) for field, value in zip(key, values)]
+    except (ValueError, TypeError, ValidationError):
+        raise BadRequest("invalid cursor")
+
+# rows strictly after the cursor in key order
+# (a > x) or (a = x and b > y) or (a = x and b = y and c > z) ...
+def _after(key, values):
+    condition = Q()
+    for i, field in enumerate(key):
+        step = Q(**{f"{field}__gt": values[i]})
+        for previous, value in zip(key[:i], values[:i]):
+            step &= Q(**{previous: value})
+        condition |= step
+    return condition
+
+def _parse_updated_since(value):
+    # (both return None for something that is not a date at all, and raise for a date that does not exist)
+    try:
+        moment = parse_datetime(value)
+        day = parse_date(value) if moment is None else None
+    except ValueError:
+        raise BadRequest("updated_since is not a valid date")
+    if moment is None:
+        if day is None:
+            raise BadRequest("updated_since must be an ISO date or date/time")
+        moment = datetime(day.year, day.month, day.day)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+# builds one page of a list
+def get_page(resource, request):
+    config = RESOURCES[resource]
+    key = config['key']
+    queryset = _base_queryset(resource, request)
+
+    # which fields to return
+    fields = config['fields']
+    if request.GET.get('fields'):
+        fields = tuple(field for field in request.GET['fields'].split(',') if field)
+        unknown = set(fields) - set(config['fields'])
+        if unknown:
+            raise BadRequest(f"unknown fields: {', '.join(sorted(unknown))}")
+
+    # filters
+    for parameter, field in config['filters'].items():
+        if request.GET.get(parameter):
+            try:
+                queryset = queryset.filter(**{field: request.GET[parameter]})
+            except (ValueError, ValidationError):
+                raise BadRequest(f"invalid value for {parameter}")
+    if request.GET.get('updated_since'):
+        queryset = queryset.filter(updated__gte=_parse_updated_since(request.GET['updated_since']))
+
+    try:
+        limit = min(int(request.GET.get('limit', DEFAULT_LIMIT)), MAX_LIMIT)
+    except ValueError:
+        raise BadRequest("limit must be a number")
+    if limit < 1:
+        raise BadRequest("limit must be at least 1")
+
+    if request.GET.get('cursor'):
+        queryset = queryset.filter(_after(key, decode_cursor(request.GET['cursor'], queryset.model, key)))
+
+    # rating annotations are called rating_average / rating_max in the query
+    renamed = {'average_rating': 'rating_average', 'max_rating': 'rating_max'}
+    columns = list(dict.fromkeys([*key, *(renamed.get(field, field) for field in fields)]))
+
+    # one extra row tells us if there is another page
+    rows = list(queryset.order_by(*key).values(*columns)[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1][field] for field in key])
+
+    results = [{field: row[renamed.get(field, field)] for field in fields} for row in rows]
+    return {'results': results, 'next': next_cursor}
+
+@require_GET
+def listResource(request, resource):
+    if resource not in RESOURCES:
+        raise Http404("Unknown list")
+    try:
+        return JsonResponse(get_page(resource, request))
+    except BadRequest as error:
+        return JsonResponse({'error': str(error)}, status=400)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ReelLoggerAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'reel_logger_app'
+
+    def ready(self):
+        # connects the signal handlers
+        from reel_logger_app import signals
@@ -0,0 +1,39 @@
+'''
+This file handles caching query results of the list and scene pages (the backend is set up in settings.py from secret.toml).
+Cache keys include a version per group, so nothing has to be found and deleted when something changes, the version is bumped:
+  - "scenes" and "scene:<number>" by signals.py when a scene or shot is saved or deleted
+  - "footage" by signals.py when footage, takes or links are saved or deleted,
+    and by everything that writes footage with .update() / bulk_update / bulk_create (which send no signals),
+    like the preview worker and the formatter
+A cached page does not touch the database at all.
+The preview worker and the commands are other processes, their bumps only reach the web server through a shared cache
+(the default file cache, or redis), with a local memory cache their changes show up after CACHE_TIMEOUT.
+'''
+import hashlib
+import time
+
+from django.core.cache import cache
+
+from reel_logger.settings import CACHE_TIMEOUT
+
+# the current version of a group (created the first time it is asked for)
+def version(group):
+    return cache.get_or_set(f"version:{group}", time.time_ns(), None)
+
+# makes every entry of the groups stale
+# a new unique value instead of incr, so a version that was evicted can never come back to an old number
+def bump(*groups):
+    cache.set_many({f"version:{group}": time.time_ns() for group in groups}, None)
+
+# a cache key for the group at this version, parts (like the query string) are hashed to keep it short
+def make_key(group, group_version, *parts):
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    return f"{group}:{group_version}:{digest}"
+
+# returns the cached result for the key, or computes and stores it
+def cached(key, compute, timeout=CACHE_TIMEOUT):
+    result = cache.get(key)
+    if result is None:
+        result = compute()
+        cache.set(key, result, timeout)
+    return result
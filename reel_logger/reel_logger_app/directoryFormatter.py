@@ -2,22 +2,36 @@
 not related to Django
 This is a separate file I made to handle creating directories and organizing footage.
 The idea behind it is to modularize the code.
+
+Formatting happens in two steps:
+    plan_format   works out where every footage goes using a few bulk queries (nothing is touched)
+    apply_plan    creates each directory once, renames the files in parallel and saves all paths at once
+A dry run is just the plan. apply_plan keeps a journal so an interrupted run can be resumed (see formatJournal).
+
+Footage remembers the settings fingerprint it was last formatted with (format_fingerprint), where that put it
+(format_key) and whether its takes or ratings changed since (format_dirty, set by signals.py).
+So a run with the same settings only looks at footage that changed.
 '''
+import hashlib
+import json
 import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db.models import F
+from django.utils import timezone
 
 from reel_logger.settings import MEDIA_ROOT
-from reel_logger_app.models import Footage, Scene, Shot, Take
+from reel_logger_app.cacheHandler import bump
+from reel_logger_app.models import Footage, Scene, Shot, Take, annotate_ratings
+from reel_logger_app.formatJournal import FormatJournal
+
+# how many renames run at once (renames are mostly waiting on the file system)
+RENAME_WORKERS = 8
 
 def get_footage_root():
     return os.path.join(MEDIA_ROOT, "footage/")
 
-# small function to create the directory only if it does not exist
-def mkdir_if_not_exists(path):
-    newPath = get_footage_root() + path
-    if not os.path.isdir(newPath): 
-        os.makedirs(newPath)
-    return newPath
-
 # small function to convert rating to a symbol
 # completely arbitrary - may be changed later
 def ratingToSymbol(rating):
@@ -36,68 +50,62 @@ def ratingToSymbol(rating):
     else:
         return 'O'
 
-# this function makes all the directories ahead of time
-def make_all_directories(folder_sort_type):
-    # create directories
+# folder of a scene / shot / take, relative to the footage root
+def get_folder(folder_sort_type, scene, shot, take):
     if folder_sort_type == 1:
-        mkdir_if_not_exists("logged")
+        return "logged"
+    folder = f"scene{scene}"
+    if folder_sort_type > 2:
+        folder = os.path.join(folder, f"shot{scene}{shot}")
+        if folder_sort_type > 3:
+            folder = os.path.join(folder, f"take{scene}{shot}{take}")
+    return folder
+
+# every folder there could be, for when the user wants them made ahead of time (3 queries at most)
+def all_directories(folder_sort_type):
+    if folder_sort_type == 1:
+        return {get_folder(1, 0, '', 0)}
+
+    folders = {get_folder(2, scene, '', 0) for scene in Scene.objects.values_list('script_number', flat=True)}
+    if folder_sort_type > 2:
+        for scene, shot in Shot.objects.values_list('scene', 'shot'):
+            folders.add(get_folder(3, scene, shot, 0))
+        if folder_sort_type > 3:
+            for scene, shot, take in Take.objects.values_list('shot_scene', 'shot_name', 'take_no'):
+                folders.add(get_folder(4, scene, shot, take))
+    return folders
+
+# the settings that decide where footage goes
+TARGET_SETTINGS = ('include_uid', 'include_hash', 'include_original_filename', 'base_takes_on',
+                   'include_take_in_filename', 'for_multiple_takes_use', 'sort_folders_by',
+                   'include_rating', 'use_rating')
+
+# a short hash of the settings (and the footage root), the same settings always give the same targets
+def settings_fingerprint(form):
+    settings = {name: form[name].value() for name in TARGET_SETTINGS}
+    settings['root'] = get_footage_root()
+    return hashlib.md5(json.dumps(settings, sort_keys=True, default=str).encode()).hexdigest()
+
+# picks the take a footage is filed under (from its takes sorted by scene, shot, take)
+# and returns its scene, shot, take (the true or marked values depending on the settings)
+def choose_take(form, footage_id, takes):
+    if not takes:
+        return 0, '', footage_id
+
+    preferred_order = form["for_multiple_takes_use"].value()
+    if preferred_order == '2':
+        chosen = takes[-1]
+    elif preferred_order == '3':
+        # rounded the way it always was, so re-formatting never moves existing footage
+        chosen = takes[int(round(len(takes) / 2))]
     else:
-        # get all scene numbers
-        scenes = Scene.objects.all().values_list('script_number', flat=True)
-
-        # make scene directories
-        for scene in scenes:
-            mkdir_if_not_exists(f"scene{scene}")
-
-        if folder_sort_type > 2:
-            # get all shots
-            shots = list(Shot.objects.all().values_list('scene', 'shot'))
-
-            # make shot directories
-            for scene, shot in shots:
-                mkdir_if_not_exists(os.path.join(f"scene{scene}", f"shot{scene}{shot}"))
-
-            if folder_sort_type > 3:
-                # get all takes
-                takes = list(Take.objects.all().values_list('shot_scene', 'shot_name', 'take_no'))
-
-                # make take directories
-                for scene, shot, take in takes:
-                    mkdir_if_not_exists(os.path.join(f"scene{scene}", f"shot{scene}{shot}", f"take{scene}{shot}{take}"))
-
-# this function finds a single take for the entire footage based on the settings
-# used in the filename and directory sorting
-def getTake(form, footage):
-    scene = 0
-    shot = ''
-    take = footage.id
-
-    if footage.take_set:
-        take_set = footage.take_set.order_by('shot_scene', 'shot_name', 'take_no')
-        preferred_order = form["for_multiple_takes_use"].value()
-
-        if preferred_order == '2':
-            take_set = take_set.latest()
-        if preferred_order == '3':
-            count = take_set.count()
-            take_set = take_set[int(round(count/2))]
-        else:
-            take_set = take_set.first()
-        
-        if take_set:
-            if take_set.shot_scene:
-                scene = take_set.shot_scene.script_number
-            shot = take_set.shot_name
-            take = take_set.take_no
-
-            if form['base_takes_on'].value() == '2':
-                if take_set.marked_scene:
-                    scene = take_set.marked_scene
-                if take_set.marked_shot:
-                    shot = take_set.marked_shot
-                if take_set.marked_take:
-                    take = take_set.marked_take
+        chosen = takes[0]
 
+    scene, shot, take = chosen.shot_scene_id, chosen.shot_name, chosen.take_no
+    if form['base_takes_on'].value() == '2':
+        scene = chosen.marked_scene or scene
+        shot = chosen.marked_shot or shot
+        take = chosen.marked_take or take
     return scene, shot, take
 
 # generates a filename based on the filename settings
@@ -124,48 +132,138 @@ def get_filename(form, footage, scene, shot, take):
         else:
             filename.append(str(rating))
     if not filename:
-        filename.append(footage.id)
+        filename.append(str(footage.id))
 
     return f"{delim.join(filename)}.{footage.filetype}"
 
-# figures out the correct folder based on the folder settings
-# it creates it if it does not exist
-def get_folder(form, scene, shot, take):
+# works out where all the footage goes without touching anything
+# returns {'fingerprint', 'directories': [...], 'moves': [{'footage', 'source', 'target', 'status'}, ...]}
+# status is 'move', 'in place' (nothing to do), 'conflict' (the target is already taken, skipped)
+# or 'pending' (the name needs the hash, which the preview worker has not computed yet since the file changed)
+def plan_format(form, footage_list):
+    root = get_footage_root()
     folder_sort_type = int(form['sort_folders_by'].value())
+    fingerprint = settings_fingerprint(form)
 
-    if folder_sort_type == 1:
-        return mkdir_if_not_exists("logged")
-    else:
-        newPath = mkdir_if_not_exists(f"scene{scene}")
+    # filter for logged footage
+    if form['only_logged_footage'].value():
+        footage_list = footage_list.filter(logged=True)
+    # skip footage already formatted with these settings that did not change since
+    if form['only_changed_footage'].value():
+        footage_list = footage_list.exclude(format_dirty=False, format_fingerprint=fingerprint)
+    footage_list = footage_list.order_by('id')
+    if form['include_rating'].value() != '1':
+        footage_list = annotate_ratings(footage_list)
 
-        if folder_sort_type > 2:
-            newPath = mkdir_if_not_exists(os.path.join(f"scene{scene}", f"shot{scene}{shot}"))
+    # the takes of all of that footage in one query, grouped by footage
+    takes = defaultdict(list)
+    take_list = (Take.objects.filter(footagetake__footage__in=footage_list.values('pk'))
+                 .annotate(footage_id=F('footagetake__footage'))
+                 .order_by('shot_scene', 'shot_name', 'take_no'))
+    for take in take_list:
+        takes[take.footage_id].append(take)
 
-            if folder_sort_type > 3:
-                newPath = mkdir_if_not_exists(os.path.join(f"scene{scene}", f"shot{scene}{shot}", f"take{scene}{shot}{take}"))
-        
-        return newPath
+    moves = []
+    targets = set()
+    for footage in footage_list:
+        # hashing reads the whole file, that is left to the preview worker (the footage stays dirty until the next run)
+        if form['include_hash'].value() and not footage.hash:
+            moves.append({'footage': footage, 'source': footage.path, 'target': footage.path, 'status': 'pending'})
+            continue
 
-# simple function to move the footage
-# the hard work is done by the other functions
-def moveFootage(form, footage):
-    scene, shot, take = getTake(form, footage)
-    filename = get_filename(form, footage, scene, shot, take)
-    filepath = get_folder(form, scene, shot, take)
-    filepath = os.path.join(filepath, filename)
-    footage.move(filepath)
+        scene, shot, take = choose_take(form, footage.id, takes[footage.id])
+        folder = get_folder(folder_sort_type, scene, shot, take)
+        filename = get_filename(form, footage, scene, shot, take)
+        target = os.path.join(root, folder, filename)
+
+        # the target did not change and the footage is still there, no need to look at the disk
+        if os.path.relpath(target, root) == footage.format_key and target == footage.path:
+            targets.add(target)
+            moves.append({'footage': footage, 'source': footage.path, 'target': target, 'status': 'in place'})
+            continue
+
+        # two footage would end up with the same name (or the name belongs to footage that was skipped),
+        # keep them apart with the id
+        if target != footage.path and (target in targets or os.path.exists(target)):
+            name, extension = os.path.splitext(filename)
+            target = os.path.join(root, folder, f"{name}-{footage.id}{extension}")
+        targets.add(target)
+
+        if target == footage.path:
+            status = 'in place'
+        elif os.path.exists(target):
+            # never overwrite a file (it may be footage that has not moved out of the way yet)
+            status = 'conflict'
+        else:
+            status = 'move'
+        moves.append({'footage': footage, 'source': footage.path, 'target': target, 'status': status})
 
-# this organizes all the footage into the proper directories
-def formatFootageDirectory(form, footage_list):
-    # filter for logged footage
-    if form['only_logged_footage'].value():
-        footage_list = footage_list.filter(logged=True)
-    
     # create all directories ahead of time if the user wants to
+    directories = {os.path.dirname(move['target']) for move in moves if move['status'] == 'move'}
     if not form['only_create_used_directories'].value():
-        make_all_directories(int(form['sort_folders_by'].value()))
+        directories |= {os.path.join(root, folder) for folder in all_directories(folder_sort_type)}
+    directories = sorted(directory for directory in directories if not os.path.isdir(directory))
 
-    # move all the footage
-    for footage in footage_list:
-        moveFootage(form, footage)
-    
+    return {'fingerprint': fingerprint, 'directories': directories, 'moves': moves}
+
+# renames one footage, returns the error (if any)
+def _rename(move, journal):
+    try:
+        os.rename(move['source'], move['target'])
+    except OSError as error:
+        journal.write('failed', footage=move['footage'].id, error=str(error))
+        return str(error)
+    journal.write('moved', footage=move['footage'].id)
+    return None
+
+# saves the paths of formatted footage in one go
+# with a fingerprint the footage is marked as formatted with those settings, without it (a rollback) as dirty
+# bulk_update skips save(), so set updated by hand
+# (a rename keeps size, mtime and inode, so nothing gets rehashed later either)
+def save_paths(paths, fingerprint=None):
+    root = get_footage_root()
+    now = timezone.now()
+    footage_list = [Footage(pk=footage_id, path=path, updated=now,
+                            format_key=os.path.relpath(path, root),
+                            format_fingerprint=fingerprint or "",
+                            format_dirty=fingerprint is None)
+                    for footage_id, path in paths.items()]
+    Footage.objects.bulk_update(footage_list, ['path', 'updated', 'format_key', 'format_fingerprint', 'format_dirty'],
+                                batch_size=500)
+    bump("footage")
+
+# carries out a plan made by plan_format
+# every step is written to a journal first (see formatJournal), `manage.py format_resume` picks up after a crash
+# returns the moves that failed (with an 'error')
+def apply_plan(plan):
+    moves = [move for move in plan['moves'] if move['status'] == 'move']
+    journal = FormatJournal.start()
+    journal.intend(plan['fingerprint'], plan['directories'], moves)
+
+    for directory in plan['directories']:
+        os.makedirs(directory, exist_ok=True)
+
+    with ThreadPoolExecutor(max_workers=RENAME_WORKERS) as pool:
+        errors = list(pool.map(lambda move: _rename(move, journal), moves))
+
+    failed = []
+    # footage that is already in place just gets marked as formatted
+    paths = {move['footage'].id: move['target'] for move in plan['moves'] if move['status'] == 'in place'}
+    for move, error in zip(moves, errors):
+        if error:
+            print(f"moving {move['source']} failed: {error}")
+            failed.append({**move, 'error': error})
+        else:
+            paths[move['footage'].id] = move['target']
+    save_paths(paths, plan['fingerprint'])
+
+    journal.close('committed')
+    return failed
+
+# this organizes all the footage into the proper directories
+# with dry_run nothing is changed, either way the plan is returned
+def formatFootageDirectory(form, footage_list, dry_run=False):
+    plan = plan_format(form, footage_list)
+    if not dry_run:
+        plan['failed'] = apply_plan(plan)
+    return plan
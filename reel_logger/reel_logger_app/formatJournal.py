@@ -0,0 +1,114 @@
+'''
+not related to Django
+This file keeps a journal of every directory format run, so an interrupted run can be finished or undone.
+
+Every run gets its own append-only file in MEDIA_ROOT/journal/ with one JSON object per line:
+    {"op": "start", "fingerprint": ...}                           the settings fingerprint of the run
+    {"op": "mkdir", "path": ...}                                  a directory the run created
+    {"op": "intend", "footage": id, "source": ..., "target": ...}  written (and synced) before any file moves
+    {"op": "moved", "footage": id}                                 a rename finished
+    {"op": "failed", "footage": id, "error": ...}                  a rename failed (the file did not move)
+    {"op": "committed"}                                            the new paths are saved in the database
+    {"op": "rolled back"}                                          everything was put back (format_resume --rollback)
+A journal without "committed" or "rolled back" at the end belongs to a run that did not finish.
+'''
+import json
+import os
+import threading
+from datetime import datetime
+
+from reel_logger.settings import MEDIA_ROOT
+
+# ops that close a journal
+FINISHED = ('committed', 'rolled back')
+
+def get_journal_root():
+    return os.path.join(MEDIA_ROOT, "journal/")
+
+# writes one journal file
+class FormatJournal:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "a", encoding="utf-8")
+        # renames run in several threads
+        self.lock = threading.Lock()
+
+    # starts the journal of a new run
+    @classmethod
+    def start(cls):
+        os.makedirs(get_journal_root(), exist_ok=True)
+        name = f"format-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.jsonl"
+        return cls(os.path.join(get_journal_root(), name))
+
+    def write(self, op, sync=False, **values):
+        with self.lock:
+            self.file.write(json.dumps({"op": op, **values}) + "\n")
+            self.file.flush()
+            if sync:
+                os.fsync(self.file.fileno())
+
+    # records the whole plan in one go before anything moves
+    def intend(self, fingerprint, directories, moves):
+        with self.lock:
+            self.file.write(json.dumps({"op": "start", "fingerprint": fingerprint}) + "\n")
+            for directory in directories:
+                self.file.write(json.dumps({"op": "mkdir", "path": directory}) + "\n")
+            for move in moves:
+                self.file.write(json.dumps({"op": "intend", "footage": move['footage'].id,
+                                            "source": move['source'], "target": move['target']}) + "\n")
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self, op=None):
+        if op:
+            self.write(op, sync=True)
+        self.file.close()
+
+# reads a journal back
+# returns {'fingerprint', 'directories': [...], 'moves': {footage id: {'source', 'target', 'state'}}, 'finished': op or None}
+# state is what the journal knows: 'intended', 'moved' or 'failed'
+def read_journal(path):
+    fingerprint = None
+    directories = []
+    moves = {}
+    finished = None
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # the last line may be cut off by the crash
+                continue
+            op = entry.get("op")
+            if op == "start":
+                fingerprint = entry.get("fingerprint")
+            elif op == "mkdir":
+                directories.append(entry["path"])
+            elif op == "intend":
+                moves[entry["footage"]] = {'source': entry["source"], 'target': entry["target"], 'state': 'intended'}
+            elif op in ("moved", "failed") and entry.get("footage") in moves:
+                moves[entry["footage"]]['state'] = op
+            elif op in FINISHED:
+                finished = op
+    return {'fingerprint': fingerprint, 'directories': directories, 'moves': moves, 'finished': finished}
+
+# all journals, newest first
+def list_journals():
+    root = get_journal_root()
+    if not os.path.isdir(root):
+        return []
+    names = sorted((name for name in os.listdir(root) if name.endswith(".jsonl")), reverse=True)
+    return [os.path.join(root, name) for name in names]
+
+# journals of runs that did not finish, newest first
+def unfinished_journals():
+    return [path for path in list_journals() if read_journal(path)['finished'] is None]
+
+# where a journaled file really is now: 'target', 'source' or 'missing'
+# the disk is the truth, the journal may be a line behind
+def locate(move):
+    if os.path.exists(move['target']):
+        return 'target'
+    if os.path.exists(move['source']):
+        return 'source'
+    return 'missing'
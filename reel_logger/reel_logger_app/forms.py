@@ -6,6 +6,7 @@ It is also used to query information from the user in general
 from django import forms
 
 from reel_logger_app.models import Footage, Take, Scene, Shot, FootageTake, Comment
+from reel_logger_app.searchHandler import search_footage
  
 # -------------- Model Forms ------------------
 # the following forms are based on models and translate between use input and models.
@@ -84,6 +85,26 @@ class FootageSearch(forms.Form):
     shot = forms.CharField(max_length=64, required=False)
     take = forms.IntegerField(required=False, min_value=0, max_value=255)
     logged_filter = forms.ChoiceField(required=False, choices=((1, 'Logged and Unlogged'), (2, 'Logged only'), (3, 'Unlogged only')))
+    codec = forms.CharField(max_length=16, required=False, help_text="Video or audio codec, like h264 or pcm_s24le")
+    min_height = forms.IntegerField(required=False, min_value=1, help_text="Like 1080 for HD and up")
+    sort = forms.ChoiceField(required=False, choices=(
+        ('path', 'File name'), ('-path', 'File name (reversed)'),
+        ('length', 'Shortest first'), ('-length', 'Longest first'),
+        ('-rating_average', 'Best average rating'), ('-rating_max', 'Best max rating'),
+        ('-id', 'Newest first'), ('id', 'Oldest first'),
+    ))
+
+    # narrows down a footage queryset to what was searched for (only call on a valid form)
+    # scene, shot and take match either the true or the marked take (see searchHandler)
+    def filter_footage(self, footage_list):
+        logged = {'2': True, '3': False}.get(self['logged_filter'].value())
+        return search_footage(footage_list,
+                              scene=self['scene'].value(),
+                              shot=self['shot'].value(),
+                              take=self['take'].value(),
+                              logged=logged,
+                              codec=self['codec'].value(),
+                              min_height=self['min_height'].value())
 
 # form used for the settings when organizing footage
 class FormatSettings(forms.Form):
@@ -97,4 +118,6 @@ class FormatSettings(forms.Form):
     include_rating = forms.ChoiceField(required=True, choices=((1, 'No'), (2, 'As number'), (3, 'As symbol')))
     use_rating = forms.ChoiceField(required=False, choices=((1, 'Average (rounded)'), (2, 'Max')))
     only_logged_footage = forms.BooleanField(required=False, initial=True, help_text="Recommended True")
-    only_create_used_directories = forms.BooleanField(required=False, initial=False, help_text="Recommended False")
\ No newline at end of file
+    only_create_used_directories = forms.BooleanField(required=False, initial=False, help_text="Recommended False")
+    only_changed_footage = forms.BooleanField(required=False, initial=True, help_text="Skip footage that did not change since it was last formatted with these settings")
+    dry_run = forms.BooleanField(required=False, initial=False, help_text="Only show what would be moved")
\ No newline at end of file
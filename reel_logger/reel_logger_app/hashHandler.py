@@ -0,0 +1,54 @@
+'''
+Not part of Django
+This file handles hashing footage files.
+Footage can be several GB, so we never read a whole file into memory.
+Instead the file is fed to the hash one fixed size buffer at a time.
+
+Reading a whole 50 GB file takes minutes, so change detection uses a sampled fingerprint instead:
+the size plus a few fixed pieces (start, middle, end) of the file, which is a few reads no matter how big it is.
+It is not proof the content is the same (the full md5 is still used for duplicates), it only has to notice when a file was replaced.
+'''
+import os
+from hashlib import blake2b, md5
+
+# how much of the file is read at once (8 MiB)
+CHUNK_SIZE = 8 * 1024 * 1024
+
+# how big each piece of a sampled fingerprint is (1 MiB)
+SAMPLE_SIZE = 1024 * 1024
+
+# hashes a file incrementally using a single reusable buffer
+def hash_file(path, chunk_size=CHUNK_SIZE):
+    digest = md5()
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+
+    with open(path, "rb") as file:
+        while True:
+            size = file.readinto(buffer)
+            if not size:
+                break
+            digest.update(view[:size])
+
+    return digest.hexdigest()
+
+# returns what we know about a file without reading it (size, mtime, inode)
+# if none of these changed, the contents did not change either
+def file_identity(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+# fingerprints a file from its size and three samples (start, middle, end)
+# small files are simply hashed whole
+def sample_fingerprint(path, sample_size=SAMPLE_SIZE):
+    digest = blake2b(digest_size=16)
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        digest.update(size.to_bytes(8, "little"))
+        if size <= sample_size * 3:
+            digest.update(file.read())
+        else:
+            for offset in (0, (size - sample_size) // 2, size - sample_size):
+                file.seek(offset)
+                digest.update(file.read(sample_size))
+    return digest.hexdigest()
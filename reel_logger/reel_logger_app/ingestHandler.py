@@ -0,0 +1,87 @@
+'''
+This file handles registering media files that are already on the media volume as footage.
+It is used by `manage.py ingest_watch` (files copied straight onto the volume instead of uploaded)
+and `manage.py import_footage` (whole archives at once).
+'''
+import os
+
+import ffmpeg
+
+from reel_logger_app.hashHandler import hash_file, file_identity
+from reel_logger_app.models import Footage
+from reel_logger_app.previewHandler import probe_media, get_media_info, apply_media_info
+
+# files that are still being written (or are not media at all)
+IGNORED_PREFIXES = ('.', '~')
+IGNORED_SUFFIXES = ('.part', '.tmp', '.crdownload', '.DS_Store')
+
+# what camera cards and recorders usually write (the rest of a card dump is metadata)
+MEDIA_EXTENSIONS = ('.mts', '.m2ts', '.mov', '.mp4', '.m4v', '.mxf', '.avi', '.mkv', '.webm', '.3gp',
+                    '.wav', '.bwf', '.mp3', '.m4a', '.aac', '.aif', '.aiff', '.flac', '.ogg')
+
+# whether a file should be looked at at all
+def is_candidate(path):
+    name = os.path.basename(path)
+    return not name.startswith(IGNORED_PREFIXES) and not name.endswith(IGNORED_SUFFIXES)
+
+# whether a file looks like media by its extension
+def is_media(path):
+    return is_candidate(path) and os.path.splitext(path)[1].lower() in MEDIA_EXTENSIONS
+
+# every media file under a folder
+def find_media(folder):
+    for directory, _, names in os.walk(folder):
+        for name in sorted(names):
+            path = os.path.join(directory, name)
+            if is_media(path):
+                yield path
+
+# the name shown for footage (the file name without extension, like uploads)
+def original_filename(path):
+    name = os.path.basename(path).rsplit(".", 1)[0]
+    return name[:Footage._meta.get_field('original_filename').max_length]
+
+# unsaved footage from the result of previewHandler.inspect_in_pool (for bulk_create, which skips save())
+# the preview is marked queued, the caller creates the preview jobs
+def footage_from_inspection(inspected):
+    path = inspected['path']
+    footage = Footage(path=path, original_filename=original_filename(path), hash=inspected['hash'],
+                      fingerprint=inspected['fingerprint'], preview_status='queued')
+    footage.file_size, footage.file_mtime, footage.file_inode = inspected['identity']
+    apply_media_info(footage, inspected['info'], inspected['probe'], inspected['identity'])
+    return footage
+
+# footage that already has this content (the oldest one), or None
+# the hash is indexed, so this is cheap enough to do for every new file
+def find_duplicate(file_hash):
+    if not file_hash:
+        return None
+    return Footage.objects.filter(hash=file_hash).order_by('id').first()
+
+# creates the footage for a file on the media volume
+# if the file or the same content is already footage, nothing is created and (existing footage, True) is returned
+# otherwise it probes the file so length / audio / video show up right away and saves it,
+# which queues the preview (see Footage.save), returning (new footage, False)
+def register_footage(path):
+    path = os.path.realpath(path)
+    # uploads land in the watched folder too and are footage already, no need to read them
+    existing = Footage.objects.filter(path=path).first()
+    if existing:
+        return existing, True
+
+    identity = file_identity(path)
+    file_hash = hash_file(path)
+    duplicate = find_duplicate(file_hash)
+    if duplicate:
+        return duplicate, True
+
+    footage = Footage(path=path, original_filename=original_filename(path), hash=file_hash)
+    footage.file_size, footage.file_mtime, footage.file_inode = identity
+    try:
+        probe = probe_media(path)
+        apply_media_info(footage, get_media_info(path, probe), probe, identity)
+    except ffmpeg.Error as error:
+        # not something ffmpeg understands, the preview worker will record why
+        print(f"probing {path} failed: {error}")
+    footage.save()
+    return footage, False
@@ -0,0 +1,124 @@
+'''
+manage.py benchmark_search
+Times the footage search while the take table grows.
+The fake library is made inside a transaction that is rolled back at the end, so nothing is kept.
+'''
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from reel_logger_app.cacheHandler import bump
+from reel_logger_app.forms import FootageSearch
+from reel_logger_app.models import Footage, Scene, Shot, Take, FootageTake, annotate_ratings
+
+# what gets searched for at every size
+SEARCHES = (
+    {'scene': 7},
+    {'scene': 7, 'shot': 'C'},
+    {'scene': 7, 'shot': 'C', 'take': 3, 'logged_filter': '2'},
+)
+
+# undoes everything at the end
+class _Rollback(Exception):
+    pass
+
+class Command(BaseCommand):
+    help = "Times the footage search with a growing (temporary) number of takes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="1000,10000,100000,300000",
+                            help="comma separated take counts to time the search at")
+        parser.add_argument("--repeat", type=int, default=5,
+                            help="runs per search, the best one is reported")
+        parser.add_argument("--explain", action="store_true",
+                            help="also print the query plan at the largest size")
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options["sizes"].split(","))
+        random.seed(0)
+
+        try:
+            with transaction.atomic():
+                self.stdout.write(f"{'takes':>8} " + " ".join(f"{self.describe(search):>28}" for search in SEARCHES))
+                made = 0
+                for size in sizes:
+                    self.populate(made, size)
+                    made = size
+                    timings = [self.time_search(search, options["repeat"]) for search in SEARCHES]
+                    self.stdout.write(f"{size:>8} " + " ".join(f"{ms:>24.1f} ms" for ms in timings))
+
+                if options["explain"]:
+                    for search in SEARCHES:
+                        self.stdout.write(self.describe(search))
+                        self.stdout.write(self.queryset(search).explain())
+                raise _Rollback()
+        except _Rollback:
+            pass
+        # bulk_create sends no signals, make pages cached while the rows existed stale (after the rollback, not before it)
+        bump("footage", "scenes")
+
+    def describe(self, search):
+        return " ".join(f"{key}={value}" for key, value in search.items())
+
+    # the same queryset viewFootage builds (without the pagination)
+    def queryset(self, search):
+        form = FootageSearch(search)
+        form.is_valid()
+        return annotate_ratings(form.filter_footage(Footage.objects.all())).order_by("path", "id")
+
+    # best time of a few runs of the first page
+    def time_search(self, search, repeat):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            list(self.queryset(search)[:50])
+            elapsed = (time.perf_counter() - started) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    # adds takes (and footage with two takes each) until there are `size` takes
+    # bulk_create skips Footage.save, so no files are needed
+    def populate(self, start, size):
+        scenes = {scene.script_number for scene in Scene.objects.all()}
+        new_scenes = [Scene(script_number=number, title=f"bench {number}") for number in range(1, 256) if number not in scenes]
+        Scene.objects.bulk_create(new_scenes)
+        Shot.objects.bulk_create([Shot(scene_id=number, shot=shot) for number in range(1, 256) for shot in "ABCDEFGH"],
+                                 ignore_conflicts=True)
+
+        batch = 5000
+        for first in range(start, size, batch):
+            takes = []
+            for i in range(first, min(first + batch, size)):
+                # spread takes over scene/shot/take so every combination is unique
+                scene = i % 255 + 1
+                shot = "ABCDEFGH"[i // 255 % 8]
+                take_no = i // (255 * 8) + 1000
+                # a few takes are marked differently than they really are
+                marked = random.random() < 0.1
+                takes.append(Take(shot_scene_id=scene, shot_name=shot, take_no=take_no,
+                                  marked_scene=random.randint(1, 255) if marked else scene,
+                                  marked_shot=shot, marked_take=take_no % 10 if marked else take_no,
+                                  rating=random.randint(0, 10)))
+            Take.objects.bulk_create(takes)
+
+            paths = [f"/benchmark/{i:08}.MTS" for i in range(first // 2, (first + len(takes)) // 2)]
+            Footage.objects.bulk_create([
+                Footage(path=path, hash="", logged=random.random() < 0.5, length=timedelta(seconds=random.randint(1, 600)))
+                for path in paths
+            ])
+            # mysql does not return the new ids from bulk_create
+            footage_list = Footage.objects.filter(path__in=paths).order_by("path")
+            links = []
+            for footage, (a, b) in zip(footage_list, zip(takes[::2], takes[1::2])):
+                for take in (a, b):
+                    links.append(FootageTake(footage=footage, take_scene_id=take.shot_scene_id,
+                                             take_shot=take.shot_name, take_no=take.take_no))
+            FootageTake.objects.bulk_create(links)
+
+        # let the planner know about the new rows (mysql keeps its statistics up to date itself)
+        if connection.vendor in ("sqlite", "postgresql"):
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE")
@@ -0,0 +1,71 @@
+'''
+manage.py dedup_report
+Lists footage that has the same content (the same hash) as other footage, biggest waste first.
+New duplicates are skipped when they come in (see ingestHandler.find_duplicate), this is for what was there before.
+Nothing is deleted: the copies may be logged differently, so which one to keep is up to you.
+'''
+import os
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from reel_logger_app.models import Footage
+
+class Command(BaseCommand):
+    help = "Lists groups of footage with identical content and how much space the extra copies take"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=50,
+                            help="how many groups to list (0 lists all of them)")
+        parser.add_argument("--hash-missing", action="store_true",
+                            help="hash footage that is not hashed yet first (reads those files completely)")
+
+    def handle(self, *args, **options):
+        # changed files are only hashed by the preview worker (see Footage.ensure_hash)
+        if options["hash_missing"]:
+            for footage in Footage.objects.filter(hash="").only("id", "path", "hash").iterator():
+                try:
+                    footage.ensure_hash()
+                except OSError as error:
+                    self.stderr.write(f"hashing {footage.path} failed: {error}")
+
+        # one grouped query over the indexed hash, then the rows of just the duplicated ones
+        hashes = list(Footage.objects.exclude(hash="").values("hash")
+                      .annotate(copies=Count("id")).filter(copies__gt=1).values_list("hash", flat=True))
+        unhashed = Footage.objects.filter(hash="").count()
+
+        groups = {}
+        for footage in (Footage.objects.filter(hash__in=hashes).annotate(takes=Count("footagetake__take_no"))
+                        .order_by("hash", "id").only("id", "path", "hash", "file_size", "logged")):
+            groups.setdefault(footage.hash, []).append(footage)
+
+        # everything but the first copy is wasted
+        report = []
+        for file_hash, copies in groups.items():
+            size = self.size_of(copies[0])
+            report.append((size * (len(copies) - 1), file_hash, size, copies))
+        report.sort(key=lambda group: group[0], reverse=True)
+
+        shown = report[:options["limit"]] if options["limit"] else report
+        for wasted, file_hash, size, copies in shown:
+            self.stdout.write(f"{file_hash}: {len(copies)} copies of {size / 1e6:.1f} MB, {wasted / 1e6:.1f} MB wasted")
+            for footage in copies:
+                state = "logged" if footage.logged else "unlogged"
+                self.stdout.write(f"    #{footage.id} {footage.path} ({state}, {footage.takes} takes)")
+        if len(shown) < len(report):
+            self.stdout.write(f"... and {len(report) - len(shown)} more groups (use --limit 0 to list all)")
+
+        extra = sum(len(copies) - 1 for _, _, _, copies in report)
+        wasted = sum(group[0] for group in report)
+        self.stdout.write(f"{len(report)} duplicated files, {extra} extra copies, {wasted / 1e9:.2f} GB wasted")
+        if unhashed:
+            self.stdout.write(f"{unhashed} footage are not hashed yet and were not checked (see --hash-missing)")
+
+    # the file size, from the database if it is known
+    def size_of(self, footage):
+        if footage.file_size is not None:
+            return footage.file_size
+        try:
+            return os.path.getsize(footage.path)
+        except OSError:
+            return 0
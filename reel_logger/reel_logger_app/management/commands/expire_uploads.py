@@ -0,0 +1,22 @@
+'''
+manage.py expire_uploads
+Gives up on chunked uploads that did not get any data for a while (the browser was closed for good)
+and deletes the .part files they left in footage/unlogged.
+Run it every now and then (like daily from cron), a resumed upload only has to start over once it expired.
+'''
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from reel_logger_app.uploadHandler import expire_uploads
+
+class Command(BaseCommand):
+    help = "Deletes the data of chunked uploads that stopped a while ago"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hours", type=float, default=48,
+                            help="hours without a chunk after which an upload is given up on")
+
+    def handle(self, *args, **options):
+        expired = expire_uploads(timedelta(hours=options["hours"]))
+        self.stdout.write(f"expired {expired} uploads")
@@ -0,0 +1,138 @@
+'''
+manage.py format_resume
+Finishes (or with --rollback, undoes) directory format runs that were interrupted.
+It reads the journal each run leaves in MEDIA_ROOT/journal/, checks where every file really is
+and then renames what is left and saves all the paths in one go.
+'''
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from reel_logger_app.directoryFormatter import RENAME_WORKERS, save_paths
+from reel_logger_app.formatJournal import FormatJournal, read_journal, list_journals, unfinished_journals, locate
+
+# renames a file unless something is already in the way, returns the error (if any)
+def _rename(source, target):
+    if os.path.exists(target):
+        return f"{target} already exists"
+    try:
+        os.rename(source, target)
+    except OSError as error:
+        return str(error)
+    return None
+
+class Command(BaseCommand):
+    help = "Finishes or rolls back interrupted directory format runs using their journals"
+
+    def add_arguments(self, parser):
+        parser.add_argument("journal", nargs="?",
+                            help="journal file to use (defaults to every run that did not finish)")
+        parser.add_argument("--rollback", action="store_true",
+                            help="put every file back where it was before the run instead of finishing it")
+        parser.add_argument("--list", action="store_true", help="list the journals and exit")
+
+    def handle(self, *args, **options):
+        if options["list"]:
+            for path in list_journals():
+                journal = read_journal(path)
+                self.stdout.write(f"{path}: {len(journal['moves'])} moves, {journal['finished'] or 'NOT FINISHED'}")
+            return
+
+        if options["journal"]:
+            if not os.path.isfile(options["journal"]):
+                raise CommandError(f"no journal at {options['journal']}")
+            paths = [options["journal"]]
+        else:
+            paths = unfinished_journals()
+            if not paths:
+                self.stdout.write("no interrupted format runs")
+                return
+
+        # unfinished_journals is newest first: finish the oldest first, undo the newest first
+        if not options["rollback"]:
+            paths = list(reversed(paths))
+
+        for path in paths:
+            journal = read_journal(path)
+            if journal['finished'] == 'rolled back':
+                self.stdout.write(f"{path} was already rolled back")
+                continue
+            if options["rollback"]:
+                self.rollback(path, journal)
+            elif journal['finished']:
+                self.stdout.write(f"{path} already finished")
+            else:
+                self.replay(path, journal)
+
+    # renames in parallel, returns {footage id: error or None}
+    def rename_all(self, renames):
+        with ThreadPoolExecutor(max_workers=RENAME_WORKERS) as pool:
+            errors = pool.map(lambda rename: _rename(rename[1], rename[2]), renames)
+            return {footage_id: error for (footage_id, _, _), error in zip(renames, errors)}
+
+    # moves whatever did not move yet and saves every path
+    def replay(self, path, journal):
+        paths = {}
+        renames = []
+        missing = 0
+        for footage_id, move in journal['moves'].items():
+            where = locate(move)
+            if where == 'target':
+                paths[footage_id] = move['target']
+            elif where == 'source':
+                renames.append((footage_id, move['source'], move['target']))
+            else:
+                missing += 1
+                self.stderr.write(f"footage {footage_id} is neither at {move['source']} nor at {move['target']}")
+
+        for directory in journal['directories']:
+            os.makedirs(directory, exist_ok=True)
+
+        # footage that could not be moved keeps its old path (and stays dirty for the next run)
+        for footage_id, error in self.rename_all(renames).items():
+            move = journal['moves'][footage_id]
+            if error:
+                self.stderr.write(f"moving {move['source']} failed: {error}")
+            else:
+                paths[footage_id] = move['target']
+
+        save_paths(paths, journal['fingerprint'])
+        FormatJournal(path).close('committed')
+        self.stdout.write(f"{path}: {len(renames)} files moved now, {len(paths)} paths saved, {missing} missing")
+
+    # moves every file back and saves the old paths
+    def rollback(self, path, journal):
+        paths = {}
+        renames = []
+        missing = 0
+        for footage_id, move in journal['moves'].items():
+            where = locate(move)
+            if where == 'source':
+                paths[footage_id] = move['source']
+            elif where == 'target':
+                renames.append((footage_id, move['target'], move['source']))
+            else:
+                missing += 1
+                self.stderr.write(f"footage {footage_id} is neither at {move['source']} nor at {move['target']}")
+
+        for footage_id, error in self.rename_all(renames).items():
+            move = journal['moves'][footage_id]
+            if error:
+                self.stderr.write(f"moving {move['target']} back failed: {error}")
+                paths[footage_id] = move['target']
+            else:
+                paths[footage_id] = move['source']
+
+        # the next format run has to look at all of it again
+        save_paths(paths)
+
+        # remove the directories the run made (deepest first, only if they are empty again)
+        for directory in sorted(journal['directories'], key=len, reverse=True):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                pass
+
+        FormatJournal(path).close('rolled back')
+        self.stdout.write(f"{path}: {len(renames)} files moved back, {len(paths)} paths saved, {missing} missing")
@@ -0,0 +1,143 @@
+'''
+manage.py import_footage <folder>
+Registers every media file under a folder (like an archive of card dumps) as footage, in place.
+Hashing and probing is spread over a pool of processes, the database is only touched here:
+rows are inserted in batches with bulk_create and the previews are queued for `manage.py preview_worker`
+(at bulk priority, so new uploads still go first).
+Files that are already footage (by path or by content) are skipped, so an interrupted import simply resumes.
+'''
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from reel_logger_app.cacheHandler import bump
+from reel_logger_app.ingestHandler import find_media, footage_from_inspection
+from reel_logger_app.models import Footage, PreviewJob
+from reel_logger_app.previewHandler import inspect_in_pool
+
+class Command(BaseCommand):
+    help = "Registers all media under a folder as footage, hashing and probing in parallel"
+
+    def add_arguments(self, parser):
+        parser.add_argument("folder", help="folder to import (searched recursively)")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                            help="number of processes (defaults to the number of cores)")
+        parser.add_argument("--batch", type=int, default=500,
+                            help="rows inserted per query")
+        parser.add_argument("--include-duplicates", action="store_true",
+                            help="also import files whose content is already footage")
+        parser.add_argument("--no-previews", action="store_true",
+                            help="do not queue previews (run rebuild_previews later)")
+
+    def handle(self, *args, **options):
+        folder = os.path.realpath(options["folder"])
+        if not os.path.isdir(folder):
+            raise CommandError(f"{folder} is not a folder")
+
+        # one query for what is already there, then only new paths are hashed
+        known_paths = set(Footage.objects.filter(path__startswith=folder).values_list('path', flat=True))
+        paths = [path for path in find_media(folder) if path not in known_paths]
+        total = len(paths)
+        total_bytes = sum(os.path.getsize(path) for path in paths)
+        if not total:
+            self.stdout.write("nothing new to import")
+            return
+
+        workers = max(1, options["workers"])
+        self.stdout.write(f"importing {total} files ({total_bytes / 1e9:.1f} GB) with {workers} processes")
+
+        self.options = options
+        self.batch = []
+        self.seen_hashes = set()
+        self.imported = self.duplicates = self.failed = 0
+        done = done_bytes = 0
+        started = time.monotonic()
+        pending = iter(paths)
+        in_flight = {}
+
+        # spawn instead of fork so no process inherits the database connection
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            try:
+                while True:
+                    # keep only a few files per process in flight
+                    while len(in_flight) < workers * 2:
+                        path = next(pending, None)
+                        if path is None:
+                            break
+                        in_flight[pool.submit(inspect_in_pool, path)] = path
+
+                    if not in_flight:
+                        break
+
+                    finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        in_flight.pop(future)
+                        inspected = future.result()
+                        if inspected['error']:
+                            self.failed += 1
+                            self.stderr.write(f"{inspected['path']} skipped: {inspected['error']}")
+                        else:
+                            self.batch.append(inspected)
+                            done_bytes += inspected['identity'][0]
+                        done += 1
+
+                    if len(self.batch) >= options["batch"]:
+                        self.flush()
+                    self.report(done, total, done_bytes, total_bytes, started)
+            except KeyboardInterrupt:
+                pool.shutdown(wait=True, cancel_futures=True)
+                self.flush()
+                self.stdout.write(f"interrupted after {done} of {total}, run again to resume")
+                return
+
+        self.flush()
+        self.stdout.write(f"imported {self.imported} files ({self.duplicates} duplicates skipped, {self.failed} failed) "
+                          f"in {time.monotonic() - started:.0f}s")
+
+    # inserts the collected footage (and their preview jobs)
+    def flush(self):
+        batch, self.batch = self.batch, []
+        if not batch:
+            return
+
+        # skip content that is already footage (or came up earlier in this import)
+        if not self.options["include_duplicates"]:
+            # (the hash is indexed)
+            hashes = {inspected['hash'] for inspected in batch}
+            known = set(Footage.objects.filter(hash__in=hashes).values_list('hash', flat=True)) | self.seen_hashes
+            unique = []
+            for inspected in batch:
+                if inspected['hash'] in known:
+                    self.duplicates += 1
+                    self.stdout.write(f"{inspected['path']} is already footage, skipped")
+                    continue
+                known.add(inspected['hash'])
+                unique.append(inspected)
+            self.seen_hashes |= {inspected['hash'] for inspected in unique}
+            batch = unique
+
+        footage_list = [footage_from_inspection(inspected) for inspected in batch]
+        if self.options["no_previews"]:
+            for footage in footage_list:
+                footage.preview_status = 'none'
+
+        with transaction.atomic():
+            Footage.objects.bulk_create(footage_list, batch_size=self.options["batch"])
+            if not self.options["no_previews"]:
+                # bulk_create does not return ids on every database, so look them up
+                ids = Footage.objects.filter(path__in=[footage.path for footage in footage_list]).values_list('pk', flat=True)
+                PreviewJob.objects.bulk_create([PreviewJob(footage_id=footage_id, priority=PreviewJob.PRIORITY_BULK)
+                                                for footage_id in ids], batch_size=self.options["batch"])
+        bump("footage")
+        self.imported += len(footage_list)
+
+    # prints progress and throughput
+    def report(self, done, total, done_bytes, total_bytes, started):
+        elapsed = max(time.monotonic() - started, 0.001)
+        rate = done_bytes / elapsed
+        remaining = (total_bytes - done_bytes) / rate if rate else 0
+        self.stdout.write(f"[{done}/{total}] {done / elapsed:.1f} files/s, {rate / 1e6:.1f} MB/s, about {remaining:.0f}s left")
@@ -0,0 +1,165 @@
+'''
+manage.py ingest_watch
+Runs forever, registering files that are copied into the footage folder (footage/unlogged by default) as footage.
+Meant for cards offloaded straight onto the media volume, so big files never go through an upload.
+
+Uses inotify (and friends) through the watchdog package if it is installed, otherwise it scans the folder every few seconds.
+A file is only registered once its size and modification time stopped changing for a while (the copy finished).
+Like import_footage, only files with a media extension are registered (see ingestHandler.MEDIA_EXTENSIONS).
+Files whose content is already footage (like a card that was offloaded twice) are not registered again.
+Probing and hashing run in a small pool of threads.
+'''
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from reel_logger_app.ingestHandler import is_media, register_footage
+from reel_logger_app.models import Footage, get_footage_root
+
+# watchdog is optional
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+# collects paths that changed, from watchdog's thread
+class _ChangedFiles(FileSystemEventHandler):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.paths = set()
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            return
+        with self.lock:
+            self.paths.add(getattr(event, 'dest_path', None) or event.src_path)
+
+    def take(self):
+        with self.lock:
+            paths, self.paths = self.paths, set()
+        return paths
+
+# registers a file in a worker thread
+# each thread gets its own database connection, so close it when done
+def _register_in_thread(path):
+    try:
+        return register_footage(path)
+    finally:
+        connection.close()
+
+# every file under a folder
+def _scan(folder):
+    for directory, _, names in os.walk(folder):
+        for name in names:
+            yield os.path.join(directory, name)
+
+class Command(BaseCommand):
+    help = "Watches the footage folder and registers new files as footage once they are fully copied"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", default=os.path.join(get_footage_root(), "unlogged"),
+                            help="folder to watch (defaults to footage/unlogged)")
+        parser.add_argument("--settle", type=float, default=10.0,
+                            help="seconds a file has to stay the same size before it is registered")
+        parser.add_argument("--workers", type=int, default=2,
+                            help="how many files are probed and hashed at once")
+        parser.add_argument("--poll", type=float, default=5.0,
+                            help="seconds between scans when watchdog is not installed")
+        parser.add_argument("--rescan", type=float, default=600.0,
+                            help="seconds between full scans when watchdog is installed (catches missed events)")
+        parser.add_argument("--once", action="store_true",
+                            help="register what is there (once it settled) and exit")
+
+    def handle(self, *args, **options):
+        folder = os.path.realpath(options["path"])
+        os.makedirs(folder, exist_ok=True)
+        workers = max(1, options["workers"])
+
+        changes = None
+        observer = None
+        if Observer is not None and not options["once"]:
+            changes = _ChangedFiles()
+            observer = Observer()
+            observer.schedule(changes, folder, recursive=True)
+            observer.start()
+            self.stdout.write(f"watching {folder} for new footage")
+        else:
+            self.stdout.write(f"scanning {folder} for new footage every {options['poll']}s")
+
+        # path -> (size, mtime, when it was last seen changing)
+        pending = {}
+        # paths that are registered (or failed), so they are not looked at again
+        done = set(Footage.objects.filter(path__startswith=folder).values_list('path', flat=True))
+        running = {}
+        last_scan = None
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            try:
+                while True:
+                    now = time.monotonic()
+
+                    # find files to look at (everything on a full scan, otherwise what watchdog saw)
+                    if changes is None or last_scan is None or now - last_scan > options["rescan"]:
+                        paths = _scan(folder)
+                        last_scan = now
+                    else:
+                        paths = changes.take()
+                    for path in paths:
+                        # (only media, card dumps also hold xml, thumbnails and other sidecars)
+                        if path not in done and path not in running.values() and is_media(path):
+                            pending.setdefault(path, None)
+
+                    # register the files that stopped changing (a few at a time)
+                    for path in list(pending):
+                        if len(running) >= workers * 2:
+                            break
+                        if self.settled(pending, path, now, options["settle"]):
+                            del pending[path]
+                            running[pool.submit(_register_in_thread, path)] = path
+
+                    if running:
+                        finished, _ = wait(running, timeout=options["poll"], return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            path = running.pop(future)
+                            done.add(path)
+                            if future.exception():
+                                self.stderr.write(f"registering {path} failed: {future.exception()}")
+                            else:
+                                footage, duplicate = future.result()
+                                if duplicate:
+                                    self.stdout.write(f"{path} is already {footage}, skipped")
+                                else:
+                                    self.stdout.write(f"registered {footage}")
+                    elif options["once"] and not pending:
+                        break
+                    else:
+                        time.sleep(options["poll"])
+            except KeyboardInterrupt:
+                self.stdout.write("stopping, waiting for running files to finish")
+            finally:
+                if observer is not None:
+                    observer.stop()
+                    observer.join()
+
+        self.stdout.write("ingest watcher stopped")
+
+    # whether a file stopped growing for long enough (and updates what we know about it)
+    def settled(self, pending, path, now, settle):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            # gone again (moved or deleted before it settled)
+            del pending[path]
+            return False
+
+        seen = pending[path]
+        if seen is None or seen[:2] != (stat.st_size, stat.st_mtime_ns):
+            pending[path] = (stat.st_size, stat.st_mtime_ns, now)
+            return False
+        return now - seen[2] >= settle
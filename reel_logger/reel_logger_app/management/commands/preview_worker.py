@@ -0,0 +1,80 @@
+'''
+manage.py preview_worker
+Runs forever, rendering queued previews in the background.
+Start it next to the web server so uploads never wait on ffmpeg.
+New footage gets a quick proxy first (see previewQueue), so it can be watched before its preview is done.
+'''
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from reel_logger.settings import PREVIEW_WORKER_CONCURRENCY
+from reel_logger_app.previewQueue import claim_next_job, heartbeat_jobs, requeue_stale_jobs, run_job
+
+# how often the worker tells the others its jobs are still running (seconds)
+HEARTBEAT_INTERVAL = 30
+
+# runs a job in a worker thread
+# each thread gets its own database connection, so close it when done
+def _run_in_thread(job):
+    try:
+        return run_job(job)
+    finally:
+        connection.close()
+
+class Command(BaseCommand):
+    help = "Renders queued footage previews in the background"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=PREVIEW_WORKER_CONCURRENCY,
+                            help="how many previews to render at once")
+        parser.add_argument("--poll", type=float, default=2.0,
+                            help="seconds to wait before checking an empty queue again")
+        parser.add_argument("--stale-after", type=int, default=5,
+                            help="minutes without a heartbeat after which a running job is assumed dead and requeued")
+        parser.add_argument("--once", action="store_true",
+                            help="exit as soon as the queue is empty")
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options["concurrency"])
+        stale_after = timedelta(minutes=options["stale_after"])
+        self.stdout.write(f"preview worker started ({concurrency} at once)")
+
+        # future -> id of the job it renders
+        running = {}
+        last_heartbeat = time.monotonic()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            try:
+                while True:
+                    requeue_stale_jobs(stale_after)
+                    if running and time.monotonic() - last_heartbeat > HEARTBEAT_INTERVAL:
+                        heartbeat_jobs(list(running.values()))
+                        last_heartbeat = time.monotonic()
+
+                    # fill every free slot with a job
+                    while len(running) < concurrency:
+                        job = claim_next_job()
+                        if job is None:
+                            break
+                        self.stdout.write(f"rendering {job.get_tier_display().lower()} for {job.footage}")
+                        running[pool.submit(_run_in_thread, job)] = job.pk
+
+                    if not running:
+                        if options["once"]:
+                            break
+                        time.sleep(options["poll"])
+                        continue
+
+                    # wait for a slot to free up (or poll again for more important jobs)
+                    done, _ = wait(running, timeout=options["poll"], return_when=FIRST_COMPLETED)
+                    for future in done:
+                        del running[future]
+                        if future.exception():
+                            self.stderr.write(f"preview worker error: {future.exception()}")
+            except KeyboardInterrupt:
+                self.stdout.write("stopping, waiting for running previews to finish")
+
+        self.stdout.write("preview worker stopped")
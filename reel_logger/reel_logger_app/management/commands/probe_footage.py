@@ -0,0 +1,65 @@
+'''
+manage.py probe_footage
+Fills in the stored ffprobe result (codecs, resolution, frame rate, timecode...) of footage that does not have one,
+or whose file changed since it was probed. New footage gets it when it is registered or previewed,
+this is for footage from before (so it shows up in searches on codec and resolution) without rebuilding any previews.
+'''
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from reel_logger_app.cacheHandler import bump
+from reel_logger_app.hashHandler import file_identity
+from reel_logger_app.models import Footage
+from reel_logger_app.previewHandler import probe_media, get_media_info, apply_media_info, MEDIA_INFO_FIELDS
+
+# probes one file, errors are returned so one bad file does not stop the rest
+def _probe(path):
+    try:
+        identity = file_identity(path)
+        probe = probe_media(path)
+        return identity, probe, get_media_info(path, probe), None
+    except Exception as error:
+        return None, None, None, f"{type(error).__name__}: {error}"
+
+class Command(BaseCommand):
+    help = "Stores the ffprobe result of footage that was never probed (or changed since)"
+
+    def add_arguments(self, parser):
+        # ffprobe runs in its own process, threads are enough to keep several going
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                            help="how many files are probed at once")
+        parser.add_argument("--all", action="store_true",
+                            help="also check footage that has a probe (finds files that changed)")
+
+    def handle(self, *args, **options):
+        footage_list = Footage.objects.only("id", "path", "probe_key")
+        if not options["all"]:
+            footage_list = footage_list.filter(Q(probe__isnull=True) | Q(probe_key=""))
+        # skip what is still up to date (a stat, no ffprobe)
+        stale = [footage for footage in footage_list.order_by("id").iterator() if not footage.probe_is_current()]
+        if not stale:
+            self.stdout.write("every footage is probed")
+            return
+
+        self.stdout.write(f"probing {len(stale)} files")
+        probed = []
+        failed = 0
+        with ThreadPoolExecutor(max_workers=max(1, options["workers"])) as pool:
+            for footage, (identity, probe, info, error) in zip(stale, pool.map(_probe, [footage.path for footage in stale])):
+                if error:
+                    failed += 1
+                    self.stderr.write(f"{footage.path} failed: {error}")
+                    continue
+                apply_media_info(footage, info, probe, identity)
+                probed.append(footage)
+
+        # bulk_update skips save() (which would look at the file again), so set updated as well
+        for footage in probed:
+            footage.updated = timezone.now()
+        Footage.objects.bulk_update(probed, list(MEDIA_INFO_FIELDS) + ["updated"], batch_size=500)
+        bump("footage")
+        self.stdout.write(f"probed {len(probed)} files ({failed} failed)")
@@ -0,0 +1,112 @@
+'''
+manage.py rebuild_previews
+Regenerates previews for the whole library (or part of it) after the preview profile changes.
+Probing and transcoding is spread over a pool of processes, the database is only touched here.
+Finished footage is stamped with the current profile, so an interrupted run simply resumes.
+'''
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from reel_logger_app.cacheHandler import bump
+from reel_logger_app.models import Footage
+from reel_logger_app.previewHandler import render_preview_in_pool, PREVIEW_PROFILE
+from reel_logger_app.previewQueue import save_rendered_preview
+
+class Command(BaseCommand):
+    help = "Rebuilds footage previews that are missing or were made with an old preview profile"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                            help="number of processes (defaults to the number of cores)")
+        parser.add_argument("--scene", type=int, action="append",
+                            help="only footage with a take in this scene (can be repeated)")
+        logged = parser.add_mutually_exclusive_group()
+        logged.add_argument("--logged", action="store_true", help="only logged footage")
+        logged.add_argument("--unlogged", action="store_true", help="only unlogged footage")
+        parser.add_argument("--missing-only", action="store_true",
+                            help="only footage without any preview (ignore out of date ones)")
+
+    def handle(self, *args, **options):
+        footage_list = self.get_footage(options)
+        total = footage_list.count()
+        if not total:
+            self.stdout.write("all previews are up to date")
+            return
+
+        workers = max(1, options["workers"])
+        self.stdout.write(f"rebuilding {total} previews with {workers} processes (profile {PREVIEW_PROFILE})")
+
+        # keep only a few jobs per process in flight so huge libraries do not queue everything at once
+        pending = footage_list.iterator()
+        in_flight = {}
+        done = failed = source_bytes = 0
+        started = time.monotonic()
+
+        # spawn instead of fork so no process inherits the database connection
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            try:
+                while True:
+                    while len(in_flight) < workers * 2:
+                        footage = next(pending, None)
+                        if footage is None:
+                            break
+                        # one ffmpeg thread per process, the pool already fills every core
+                        # (ffprobe only runs for files that changed since they were last probed)
+                        in_flight[pool.submit(render_preview_in_pool, footage.path, 1, footage.cached_probe())] = footage
+
+                    if not in_flight:
+                        break
+
+                    finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        footage = in_flight.pop(future)
+                        rendered = future.result()
+                        error = rendered['error']
+
+                        if error:
+                            failed += 1
+                            Footage.objects.filter(pk=footage.pk).update(preview_status='failed', preview_error=error, updated=timezone.now())
+                            bump("footage")
+                            self.stderr.write(f"{footage} failed: {error}")
+                        else:
+                            save_rendered_preview(footage, rendered)
+                            source_bytes += footage.file_size or 0
+
+                        done += 1
+                        self.report(done, failed, total, source_bytes, started)
+            except KeyboardInterrupt:
+                pool.shutdown(wait=True, cancel_futures=True)
+                self.stdout.write(f"interrupted after {done} of {total}, run again to resume")
+                return
+
+        self.stdout.write(f"finished {done - failed} previews ({failed} failed) in {time.monotonic() - started:.0f}s")
+
+    # everything that matches the filters and does not have an up to date preview
+    def get_footage(self, options):
+        if options["missing_only"]:
+            footage_list = Footage.objects.filter(Q(preview="") | Q(preview__isnull=True))
+        else:
+            footage_list = Footage.objects.filter(Q(preview="") | Q(preview__isnull=True) | ~Q(preview_profile=PREVIEW_PROFILE))
+
+        if options["scene"]:
+            footage_list = footage_list.filter(take__shot_scene_id__in=options["scene"]).distinct()
+        if options["logged"]:
+            footage_list = footage_list.filter(logged=True)
+        elif options["unlogged"]:
+            footage_list = footage_list.filter(logged=False)
+
+        return footage_list.order_by("id")
+
+    # prints progress and throughput
+    def report(self, done, failed, total, source_bytes, started):
+        elapsed = max(time.monotonic() - started, 0.001)
+        rate = done / elapsed
+        remaining = (total - done) / rate if rate else 0
+        self.stdout.write(f"[{done}/{total}] {failed} failed, {rate:.2f} clips/s, "
+                          f"{source_bytes / elapsed / 1e6:.1f} MB/s, about {remaining:.0f}s left")
@@ -0,0 +1,140 @@
+'''
+This file builds the responses that send media files (like previews) to the browser.
+I moved it out of views.py since it is a lot of HTTP detail.
+Browsers seek in <video> and <audio> by asking for byte ranges, so we answer those with 206 partial content.
+They also revalidate with ETag / Last-Modified, which we answer with 304 not modified.
+
+Requests served over ASGI get a body that reads the file a chunk at a time in a thread and hands it back to the event loop,
+so a slow client never holds on to a thread while it downloads.
+Under WSGI (runserver) the body has to be a normal iterator, Django would read an async one into memory before sending anything.
+'''
+import asyncio
+import os
+import re
+
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag, parse_http_date_safe
+
+# for urls that change whenever the file changes (the browser never has to ask again)
+CACHE_FOREVER = "public, max-age=31536000, immutable"
+# for urls that always point to the latest file (the browser has to check the ETag first)
+CACHE_REVALIDATE = "public, no-cache"
+
+# how much of a file is sent at once
+CHUNK_SIZE = 1024 * 1024
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# sends a file with support for Range, If-Range, If-None-Match and If-Modified-Since
+# asynchronous streams the file with an async iterator (only for requests served over ASGI)
+def media_response(request, path, content_type, etag, cache_control=CACHE_REVALIDATE, asynchronous=False):
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = quote_etag(etag)
+    last_modified = int(stat.st_mtime)
+
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(last_modified),
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+    }
+
+    # the browser already has this exact file
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return _with_headers(response, headers)
+
+    byte_range = _requested_range(request, size, etag, last_modified)
+
+    # the range is outside of the file
+    if byte_range == "unsatisfiable":
+        response = HttpResponse(status=416)
+        headers["Content-Range"] = f"bytes */{size}"
+        return _with_headers(response, headers)
+
+    # no (usable) range, send everything
+    if byte_range is None:
+        if asynchronous:
+            response = StreamingHttpResponse(_aread_range(path, 0, size - 1), content_type=content_type)
+            headers["Content-Length"] = str(size)
+        else:
+            response = FileResponse(open(path, "rb"), content_type=content_type)
+        return _with_headers(response, headers)
+
+    # send only the requested part
+    start, end = byte_range
+    read_range = _aread_range if asynchronous else _read_range
+    response = StreamingHttpResponse(read_range(path, start, end), status=206, content_type=content_type)
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return _with_headers(response, headers)
+
+# works out which bytes were asked for
+# returns (start, end) inclusive, None for the whole file or "unsatisfiable"
+def _requested_range(request, size, etag, last_modified):
+    header = request.headers.get("Range")
+    if not header:
+        return None
+
+    # If-Range means "only give me a part if the file did not change", otherwise send the whole thing
+    if_range = request.headers.get("If-Range")
+    if if_range:
+        if if_range.startswith('"') or if_range.startswith('W/'):
+            if if_range != etag:
+                return None
+        elif parse_http_date_safe(if_range) != last_modified:
+            return None
+
+    # multiple ranges are allowed to be answered with the whole file
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    elif last:
+        # suffix range, the last N bytes
+        start = max(size - int(last), 0)
+        end = size - 1
+    else:
+        return None
+
+    if start >= size or start > end:
+        return "unsatisfiable"
+    return start, end
+
+# reads bytes start to end (inclusive) of a file in chunks
+def _read_range(path, start, end):
+    with open(path, "rb") as file:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+# the same for async views, only the reads happen in a thread
+async def _aread_range(path, start, end):
+    file = await asyncio.to_thread(open, path, "rb")
+    try:
+        await asyncio.to_thread(file.seek, start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await asyncio.to_thread(file.read, min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+def _with_headers(response, headers):
+    for header, value in headers.items():
+        response[header] = value
+    return response
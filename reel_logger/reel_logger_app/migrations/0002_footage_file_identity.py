@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 08:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reel_logger_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='footage',
+            name='file_inode',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='footage',
+            name='file_mtime',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='footage',
+            name='file_size',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
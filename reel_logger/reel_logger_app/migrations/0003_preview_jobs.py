@@ -0,0 +1,41 @@
+# Generated by Django 5.2 on 2026-10-18 08:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reel_logger_app', '0002_footage_file_identity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='footage',
+            name='preview_error',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='footage',
+            name='preview_status',
+            field=models.CharField(choices=[('none', 'No preview'), ('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='none', editable=False, max_length=8),
+        ),
+        migrations.CreateModel(
+            name='PreviewJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=8)),
+                ('priority', models.SmallIntegerField(default=0)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('started', models.DateTimeField(blank=True, null=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+                ('footage', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='reel_logger_app.footage')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', '-priority', 'created'], name='reel_logger_status_8da631_idx')],
+            },
+        ),
+    ]
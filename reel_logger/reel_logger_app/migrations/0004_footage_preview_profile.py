@@ -0,0 +1,25 @@
+# Generated by Django 5.2 on 2026-10-18 08:06
+
+from django.db import migrations, models
+
+
+# previews made before this migration all used the original 720w/24fps/44.1kHz profile
+def mark_existing_previews(apps, schema_editor):
+    Footage = apps.get_model('reel_logger_app', 'Footage')
+    Footage.objects.exclude(preview='').exclude(preview__isnull=True).update(preview_profile='720w24fps44100hz')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reel_logger_app', '0003_preview_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='footage',
+            name='preview_profile',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32),
+        ),
+        migrations.RunPython(mark_existing_previews, migrations.RunPython.noop),
+    ]
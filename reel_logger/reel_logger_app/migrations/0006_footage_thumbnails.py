@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 08:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reel_logger_app', '0005_footage_preview_segments'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='footage',
+            name='poster',
+            field=models.FileField(blank=True, editable=False, null=True, upload_to='previews/posters/'),
+        ),
+        migrations.AddField(
+            model_name='footage',
+            name='sprite',
+            field=models.FileField(blank=True, editable=False, null=True, upload_to='previews/sprites/'),
+        ),
+        migrations.AddField(
+            model_name='footage',
+            name='thumbnail_index',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+    ]
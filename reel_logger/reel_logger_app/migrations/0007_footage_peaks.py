@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 08:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reel_logger_app', '0006_footage_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='footage',
+            name='peaks',
+            field=models.FileField(blank=True, editable=False, null=True, upload_to='previews/peaks/'),
+        ),
+    ]
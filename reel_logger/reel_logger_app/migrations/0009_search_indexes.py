@@ -0,0 +1,47 @@
+# Generated by Django 5.2 on 2026-10-18 08:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reel_logger_app', '0008_updated_timestamps'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='footage',
+            name='logged',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.AlterField(
+            model_name='take',
+            name='marked_scene',
+            field=models.PositiveSmallIntegerField(blank=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='take',
+            name='marked_shot',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='take',
+            name='marked_take',
+            field=models.PositiveSmallIntegerField(blank=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='take',
+            name='shot_name',
+            field=models.CharField(db_index=True, max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='take',
+            name='take_no',
+            field=models.PositiveSmallIntegerField(db_index=True),
+        ),
+        migrations.AddIndex(
+            model_name='footagetake',
+            index=models.Index(fields=['take_scene', 'take_shot', 'take_no'], name='reel_logger_take_sc_b7773f_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 08:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reel_logger_app', '0009_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='footage',
+            name='format_dirty',
+            field=models.BooleanField(default=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='footage',
+            name='format_fingerprint',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='footage',
+            name='format_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=512),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 08:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reel_logger_app', '0011_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='footage',
+            name='hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=32),
+        ),
+    ]
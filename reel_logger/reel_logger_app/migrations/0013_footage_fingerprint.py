@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 08:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reel_logger_app', '0012_footage_hash_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='footage',
+            name='fingerprint',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32),
+        ),
+    ]
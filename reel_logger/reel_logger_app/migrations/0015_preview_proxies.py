@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 08:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reel_logger_app', '0014_footage_probe_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='footage',
+            name='proxy',
+            field=models.FileField(blank=True, editable=False, null=True, upload_to='previews/proxies/'),
+        ),
+        migrations.AddField(
+            model_name='previewjob',
+            name='tier',
+            field=models.CharField(choices=[('proxy', 'Proxy'), ('full', 'Preview')], default='full', max_length=8),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 08:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reel_logger_app', '0015_preview_proxies'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='previewjob',
+            name='heartbeat',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
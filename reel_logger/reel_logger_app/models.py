@@ -6,29 +6,97 @@ It then handles building these objects from the database automatically
 It also adds a few other calculated fields, like object references from foreign keys and others that I added.
 '''
 import os
+import shutil
+import uuid
 from datetime import timedelta
-from hashlib import md5 as hash
+
+from django.conf import settings
 
 from django.db import models
+from django.db.models import Avg, Max, OuterRef, Prefetch, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
-from reel_logger.settings import MEDIA_ROOT
-from reel_logger_app.previewHandler import generate_preview
+from reel_logger.settings import MEDIA_ROOT, PREVIEW_PROXY
+from reel_logger_app.cacheHandler import bump
+from reel_logger_app.hashHandler import hash_file, file_identity, sample_fingerprint
 
 
 def get_footage_root():
     return os.path.join(MEDIA_ROOT, "footage/")
 
+# states a preview (or a preview job) can be in
+PREVIEW_STATUS_CHOICES = (
+    ('none', 'No preview'),
+    ('queued', 'Queued'),
+    ('running', 'Running'),
+    ('done', 'Done'),
+    ('failed', 'Failed'),
+)
+
+# what a cached probe is stored for (see Footage.cached_probe)
+def _probe_key(identity):
+    return ":".join(str(part) for part in identity)
+
+# the name of a stored file without folder and extension (the hash or fingerprint previews are named after)
+def _stored_stem(field_file):
+    return os.path.splitext(os.path.basename(field_file.name or ""))[0]
+
 class Footage(models.Model):
     # attributes for database
     path = models.FilePathField(path=get_footage_root, blank=False, null=False, recursive=True, unique=True)
-    hash = models.CharField(max_length=32, blank=True, editable=False)
+    # indexed so duplicates can be found when footage comes in (see ingestHandler.find_duplicate)
+    hash = models.CharField(max_length=32, blank=True, editable=False, db_index=True)
     length = models.DurationField(blank=True, default=timedelta(0))
     has_audio = models.BooleanField(default=False)
     has_video = models.BooleanField(default=False)
     notes = models.TextField(blank=True)
-    logged = models.BooleanField(default=False)
+    logged = models.BooleanField(default=False, db_index=True)
     preview = models.FileField(upload_to='previews/', blank=True, null=True, editable=False)
     original_filename = models.CharField(max_length=32, blank=True, default="", editable=False)
+    # last change (for clients that sync incrementally)
+    updated = models.DateTimeField(auto_now=True, db_index=True)
+
+    # identity of the file when it was last hashed
+    # used to skip rehashing when only database fields change
+    file_size = models.PositiveBigIntegerField(blank=True, null=True, editable=False)
+    file_mtime = models.PositiveBigIntegerField(blank=True, null=True, editable=False)
+    file_inode = models.PositiveBigIntegerField(blank=True, null=True, editable=False)
+    # sampled fingerprint of the content (see hashHandler.sample_fingerprint), cheap enough to check on every change
+    fingerprint = models.CharField(max_length=32, blank=True, default="", editable=False)
+
+    # progress of the background preview job (see PreviewJob)
+    preview_status = models.CharField(max_length=8, choices=PREVIEW_STATUS_CHOICES, default='none', editable=False)
+    preview_error = models.TextField(blank=True, editable=False)
+    preview_profile = models.CharField(max_length=32, blank=True, default="", editable=False)
+    # poster frame and hover-scrub sprite sheet for lists (see previewHandler.render_thumbnails for the index)
+    poster = models.FileField(upload_to='previews/posters/', blank=True, null=True, editable=False)
+    sprite = models.FileField(upload_to='previews/sprites/', blank=True, null=True, editable=False)
+    thumbnail_index = models.JSONField(blank=True, null=True, editable=False)
+    # min/max waveform peaks at several zoom levels (see previewHandler.render_peaks for the format)
+    peaks = models.FileField(upload_to='previews/peaks/', blank=True, null=True, editable=False)
+    # folder (in MEDIA_ROOT) holding the HLS playlist and segments of the preview, if any
+    preview_segments = models.CharField(max_length=128, blank=True, default="", editable=False)
+    # quick low resolution preview that is shown until the preview is done (removed then, see previewQueue)
+    proxy = models.FileField(upload_to='previews/proxies/', blank=True, null=True, editable=False)
+
+    # last directory format (see directoryFormatter): settings used, where it put the file
+    # and whether anything the filename depends on changed since (set by signals.py)
+    format_fingerprint = models.CharField(max_length=32, blank=True, default="", editable=False)
+    format_key = models.CharField(max_length=512, blank=True, default="", editable=False)
+    format_dirty = models.BooleanField(default=True, editable=False)
+
+    # the full ffprobe result and the file identity it belongs to, so it is not run again (see cached_probe)
+    probe = models.JSONField(blank=True, null=True, editable=False)
+    probe_key = models.CharField(max_length=64, blank=True, default="", editable=False)
+    # the interesting parts of the probe, as columns so search can filter on them
+    video_codec = models.CharField(max_length=16, blank=True, default="", editable=False, db_index=True)
+    audio_codec = models.CharField(max_length=16, blank=True, default="", editable=False, db_index=True)
+    width = models.PositiveIntegerField(blank=True, null=True, editable=False)
+    height = models.PositiveIntegerField(blank=True, null=True, editable=False, db_index=True)
+    framerate = models.FloatField(blank=True, null=True, editable=False)
+    bitrate = models.PositiveBigIntegerField(blank=True, null=True, editable=False)
+    timecode = models.CharField(max_length=16, blank=True, default="", editable=False)
 
     # takes in 'take_set' 
     # footagetake in 'footagetake_set'
@@ -45,13 +113,43 @@ class Footage(models.Model):
     def filetype(self):
         return self.path.split('.')[-1]
     
+    # the preview file to play: the proxy while the preview is being made, otherwise the preview
+    @property
+    def playable_preview(self):
+        return self.proxy or self.preview
+
     # returns th type of the PREVIEW file (only 'mp4' or 'mp3')
     @property
     def previewtype(self):
-        return self.preview.path.split('.')[-1]
+        return self.playable_preview.name.split('.')[-1]
     
+    # changes whenever the preview file changes, used to let browsers cache previews (and posters, sprites, peaks)
+    # taken from the stored file name (the hash it was rendered from) and not from the hash field:
+    # after the file changed the hash is empty until the preview worker gets to it, while the old preview is still served
+    @property
+    def preview_version(self):
+        return f"{_stored_stem(self.preview)}-{self.preview_profile}"
+
+    # the same for the proxy (named after the fingerprint it was rendered from)
+    @property
+    def proxy_version(self):
+        return f"proxy-{_stored_stem(self.proxy)}"
+
+    # the version of playable_preview
+    @property
+    def playable_version(self):
+        return self.proxy_version if self.proxy else self.preview_version
+
+    # returns the (size, mtime, inode) recorded the last time the file was looked at
+    @property
+    def file_identity(self):
+        return self.file_size, self.file_mtime, self.file_inode
+
+    # list pages annotate these in the query (see with_ratings), otherwise ask the database
     @property
     def average_rating(self):
+        if hasattr(self, 'rating_average'):
+            return self.rating_average
         ratings = list(self.take_set.values_list('rating', flat=True))
         if len(ratings) != 0:
             return sum(ratings) / len(ratings)
@@ -60,6 +158,8 @@ class Footage(models.Model):
     
     @property
     def max_rating(self):
+        if hasattr(self, 'rating_max'):
+            return self.rating_max
         ratings = list(self.take_set.values_list('rating', flat=True))
         if len(ratings) != 0:
             return max(ratings)
@@ -77,31 +177,112 @@ class Footage(models.Model):
 
         except Exception as error:
             print(error)
-        
-        with open(self.path, "rb") as file:
-            newhash = hash(file.read()).hexdigest()
-            if newhash != self.hash:
-                print("hash changed!")
-        
+
+        # a rename keeps size, mtime and inode, so save() does not even read the fingerprint
         self.save()
 
+    # helper function
+    # the stored ffprobe result, if the file did not change since (None otherwise)
+    # keyed by size, mtime and inode: formatting renames files, which keeps those but not the path
+    def cached_probe(self):
+        return self.probe if self.probe_is_current() and self.probe else None
+
+    # helper function
+    # whether the stored probe belongs to the file as it is now (only a stat, the probe itself is not loaded)
+    def probe_is_current(self):
+        try:
+            return bool(self.probe_key) and self.probe_key == _probe_key(file_identity(self.path))
+        except OSError:
+            return False
+
+    # helper function
+    # keeps an ffprobe result of the file (identity is what the file was when it was probed)
+    def set_probe(self, probe, identity=None):
+        self.probe = probe
+        self.probe_key = _probe_key(identity or file_identity(self.path))
+
+    # helper function
+    # asks the preview worker to (re)build the preview of this footage
+    # unless it is bulk work, a proxy is rendered first (ahead of every preview) so it can be watched right away
+    def queue_preview(self, priority=None):
+        if priority is None:
+            priority = PreviewJob.PRIORITY_NORMAL
+
+        if PREVIEW_PROXY and priority > PreviewJob.PRIORITY_BULK:
+            self._queue_job('proxy', PreviewJob.PRIORITY_PROXY)
+        job = self._queue_job('full', priority)
+
+        # update directly so we do not go through save() again
+        Footage.objects.filter(pk=self.pk).update(preview_status='queued', preview_error='', updated=timezone.now())
+        bump("footage")
+        self.preview_status = 'queued'
+        self.preview_error = ''
+        return job
+
+    # queues a preview job of one tier (or moves the one that is waiting up)
+    def _queue_job(self, tier, priority):
+        job = self.previewjob_set.filter(status='queued', tier=tier).first()
+        if job:
+            # already waiting, just make sure it is not stuck behind less important work
+            if priority > job.priority:
+                job.priority = priority
+                job.save(update_fields=['priority'])
+        else:
+            job = self.previewjob_set.create(tier=tier, priority=priority)
+        return job
+
     # overrides
 
-    # override save so that values like the hash are auto calculated
+    # override save so that a changed file is noticed
+    # the file is only looked at if its size, mtime or inode changed (metadata-only edits skip this),
+    # and then only its fingerprint is read: the full hash is left to the preview worker (see ensure_hash)
     def save(self, *args, **kwargs):
         print("models.py" + self.path)
-        with open(self.path, "rb") as file:
-            newhash = hash(file.read()).hexdigest()
 
-            # only run if hash is changed
-            if newhash != self.hash:
-                print("hash changed! recalculate video")
+        # new footage always needs a preview
+        needs_preview = self._state.adding
+        identity = file_identity(self.path)
+        identity_changed = identity != self.file_identity
+        if identity_changed or not self.fingerprint:
+            self.file_size, self.file_mtime, self.file_inode = identity
+            fingerprint = sample_fingerprint(self.path)
+
+            if self._state.adding or not identity_changed:
+                # the content is what was hashed (if it was), it only needs a fingerprint
+                changed = False
+            elif self.fingerprint:
+                changed = fingerprint != self.fingerprint
+            else:
+                # saved before there were fingerprints, the full hash has to decide this one time
+                newhash = hash_file(self.path)
+                changed = newhash != self.hash
                 self.hash = newhash
 
-                # create preview and autofill length, hash_video, has_audio
-                generate_preview(self)
+            if changed:
+                print("file changed! recalculate video")
+                if self.fingerprint:
+                    # out of date, the preview worker hashes it again
+                    self.hash = ""
+                # the hash can be part of the formatted filename
+                self.format_dirty = True
+                needs_preview = True
+            self.fingerprint = fingerprint
         super(Footage, self).save(*args, **kwargs)
-    
+
+        # the preview worker creates the preview and autofills length, has_video, has_audio
+        if needs_preview:
+            self.queue_preview()
+
+    # computes the full hash if it is not known yet (like after the file changed)
+    # reads the whole file, so this is for background work (the preview worker) and not for requests
+    def ensure_hash(self):
+        if not self.hash:
+            self.hash = hash_file(self.path)
+            # update directly so we do not go through save() again
+            Footage.objects.filter(pk=self.pk).update(hash=self.hash, updated=timezone.now())
+            bump("footage")
+        return self.hash
+
     # custom print method
     def __str__(self):
         return "Footage('" + str(self.path) + "')"
@@ -110,9 +291,88 @@ class Footage(models.Model):
     def delete(self, *args, **kwargs):
         if os.path.exists(self.path):
             os.remove(self.path)
+        # (segments from before they were kept per footage can be shared with a copy of the same content)
+        if self.preview_segments and not Footage.objects.filter(preview_segments=self.preview_segments).exclude(pk=self.pk).exists():
+            segments = self.preview.storage.path(self.preview_segments)
+            shutil.rmtree(segments, ignore_errors=True)
+            try:
+                os.rmdir(os.path.dirname(segments))
+            except OSError:
+                pass
         self.preview.delete(save=False)
+        self.poster.delete(save=False)
+        self.sprite.delete(save=False)
+        self.peaks.delete(save=False)
+        self.proxy.delete(save=False)
         super(Footage, self).delete(*args, **kwargs)
 
+# a request to render the preview of a footage
+# processed in the background by `manage.py preview_worker`
+class PreviewJob(models.Model):
+    # common priorities (higher runs first)
+    PRIORITY_BULK = -10
+    PRIORITY_NORMAL = 0
+    # proxies take seconds, so they go before everything else
+    PRIORITY_PROXY = 10
+
+    # what a job renders (see previewHandler: render_proxy and render_preview)
+    TIER_CHOICES = (
+        ('proxy', 'Proxy'),
+        ('full', 'Preview'),
+    )
+
+    # attributes for database
+    footage = models.ForeignKey(Footage, on_delete=models.CASCADE)
+    status = models.CharField(max_length=8, choices=PREVIEW_STATUS_CHOICES[1:], default='queued')
+    priority = models.SmallIntegerField(default=PRIORITY_NORMAL)
+    tier = models.CharField(max_length=8, choices=TIER_CHOICES, default='full')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(blank=True, null=True)
+    # refreshed by the worker while it renders, so a job is only taken back from a worker that is gone
+    heartbeat = models.DateTimeField(blank=True, null=True)
+    finished = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        # the worker always looks for the most important queued job
+        indexes = [models.Index(fields=['status', '-priority', 'created'])]
+
+    # custom print method
+    def __str__(self):
+        return f"PreviewJob({self.footage_id}, {self.tier}, {self.status})"
+
+# a large file being uploaded in chunks (see uploadHandler)
+# the file is written next to where it ends up, as <name>.part, and renamed when it is complete
+UPLOAD_STATUS_CHOICES = (
+    ('uploading', 'Uploading'),
+    ('done', 'Done'),
+    ('failed', 'Failed'),
+)
+
+class UploadSession(models.Model):
+    # attributes for database
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, blank=True, null=True)
+    filename = models.CharField(max_length=255)
+    path = models.CharField(max_length=512)
+    size = models.PositiveBigIntegerField()
+    # bytes written so far, the next chunk has to start here
+    received = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=16, choices=UPLOAD_STATUS_CHOICES, default='uploading')
+    footage = models.ForeignKey(Footage, on_delete=models.SET_NULL, blank=True, null=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    # where the data goes until the upload is complete
+    @property
+    def part_path(self):
+        return self.path + ".part"
+
+    # custom print method
+    def __str__(self):
+        return f"UploadSession({self.filename}, {self.received}/{self.size})"
+
 class Comment(models.Model):
     # attributes for database
     footage = models.ForeignKey(Footage, on_delete=models.CASCADE)
@@ -123,6 +383,7 @@ class Scene(models.Model):
     script_number = models.PositiveSmallIntegerField(primary_key=True)
     title = models.CharField(max_length=128)
     description = models.TextField(blank=True)
+    updated = models.DateTimeField(auto_now=True, db_index=True)
 
     # custom print method
     def __str__(self):
@@ -135,6 +396,7 @@ class Shot(models.Model):
     scene = models.ForeignKey(Scene, on_delete=models.CASCADE)
     shot = models.CharField(max_length=64)
     description = models.TextField(blank=True)
+    updated = models.DateTimeField(auto_now=True, db_index=True)
 
     # custom print method
     def __str__(self):
@@ -146,19 +408,21 @@ class Take(models.Model):
 
     # shot reference
     shot_scene = models.ForeignKey(Scene, on_delete=models.CASCADE)
-    shot_name = models.CharField(max_length=64)
+    shot_name = models.CharField(max_length=64, db_index=True)
     shot = models.ForeignObject(Shot,
                                 on_delete=models.CASCADE,
                                 from_fields=("shot_scene", "shot_name"),
                                 to_fields=("scene_id", "shot"))
     
     # other attributes for database
-    take_no = models.PositiveSmallIntegerField()
-    marked_scene = models.PositiveSmallIntegerField(blank=True)
-    marked_shot = models.CharField(max_length=64, blank=True)
-    marked_take = models.PositiveSmallIntegerField(blank=True)
+    take_no = models.PositiveSmallIntegerField(db_index=True)
+    # indexed for searching by what was marked on the slate (see searchHandler)
+    marked_scene = models.PositiveSmallIntegerField(blank=True, db_index=True)
+    marked_shot = models.CharField(max_length=64, blank=True, db_index=True)
+    marked_take = models.PositiveSmallIntegerField(blank=True, db_index=True)
     rating = models.SmallIntegerField(blank=True, default=0)
     notes = models.TextField(blank=True)
+    updated = models.DateTimeField(auto_now=True, db_index=True)
 
     # many to many relationship with footage
     footage = models.ManyToManyField(
@@ -196,3 +460,27 @@ class FootageTake(models.Model):
 
     # other attributes for database
     start_time = models.DurationField(blank=True, default=timedelta(0))
+    updated = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        # the primary key starts with footage, this finds the footage of a take
+        indexes = [models.Index(fields=['take_scene', 'take_shot', 'take_no'])]
+
+
+# helper function
+# adds average_rating and max_rating to a footage queryset
+# the ratings are subqueries so they are not affected by filters on takes
+# (annotated as rating_average / rating_max, the properties pick them up)
+def annotate_ratings(footage_list):
+    ratings = FootageTake.objects.filter(footage=OuterRef('pk')).order_by().values('footage')
+    return footage_list.annotate(
+        rating_average=Coalesce(Subquery(ratings.annotate(value=Avg('take__rating')).values('value')), Value(0.0)),
+        rating_max=Coalesce(Subquery(ratings.annotate(value=Max('take__rating')).values('value')), Value(0)),
+    )
+
+# helper function
+# annotate_ratings and also loads the takes of every footage in one extra query
+def with_ratings(footage_list):
+    return annotate_ratings(footage_list).prefetch_related(
+        Prefetch('take_set', queryset=Take.objects.order_by('shot_scene', 'shot_name', 'take_no')),
+    )
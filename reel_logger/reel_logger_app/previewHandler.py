@@ -4,17 +4,90 @@ This file handles creating the preview and ffmpeg.
 I moved it here for increased modularity and to de-clutter models.py
 We need to generate mp4 and mp3 previews of all media so that we can play it in a web browser
 '''
+import os
+import shutil
+import struct
+import tempfile
 from datetime import timedelta
+from fractions import Fraction
 from math import ceil
 
 import ffmpeg
+import numpy as np
 
 from django.core.files import File
 
+from reel_logger.settings import PREVIEW_TMP_DIR, PREVIEW_SEGMENTED, PREVIEW_SEGMENT_SECONDS
+from reel_logger_app.hashHandler import hash_file, file_identity, sample_fingerprint
+
+# the preview profile
+# previews are scaled down to this width, framerate and sample rate
+PREVIEW_WIDTH = 720
+PREVIEW_MAX_FPS = 24
+PREVIEW_SAMPLE_RATE = 44100
+
+# stored with every preview so we know which previews are out of date after the profile changes
+PREVIEW_PROFILE = f"{PREVIEW_WIDTH}w{PREVIEW_MAX_FPS}fps{PREVIEW_SAMPLE_RATE}hz"
+
+# the proxy profile
+# a tiny and very fast encode so new footage can be watched right away, the preview replaces it once it is done
+# audio only files (like WAVs from the sound recorder) just get a small mp3
+PROXY_WIDTH = 320
+PROXY_MAX_FPS = 12
+PROXY_SAMPLE_RATE = 22050
+PROXY_VIDEO_ARGS = {'preset': 'ultrafast', 'crf': 32, 'movflags': '+faststart'}
+PROXY_AUDIO_ARGS = {'audio_bitrate': '64k'}
+
+# streams browsers play as they are, these are copied into the preview instead of encoded again
+# (only if they also fit the profile, so no scaling, fps or resampling is needed)
+COPY_VIDEO_CODECS = ('h264',)
+COPY_VIDEO_PROFILES = ('Constrained Baseline', 'Baseline', 'Main', 'High')
+COPY_PIXEL_FORMATS = ('yuv420p', 'yuvj420p')
+COPY_AUDIO_CODECS = {'mp4': ('aac',), 'mp3': ('mp3',)}
+COPY_MAX_CHANNELS = 2
+
+# where HLS segments of previews go (a folder per footage, with one folder per preview version in it)
+# not only per version: copies of the same content have the same version but are deleted on their own
+HLS_ROOT = "previews/hls"
+HLS_PLAYLIST = "index.m3u8"
+
+# poster frame and hover-scrub sprite sheet sizes
+POSTER_WIDTH = 320
+THUMBNAIL_WIDTH = 160
+SPRITE_COLUMNS = 10
+SPRITE_MAX_TILES = 100
+SPRITE_MIN_INTERVAL = 1 # seconds between thumbnails for short clips
+
+# waveform peaks
+# audio is decoded once at a low sample rate, then reduced to min/max pairs at several zoom levels
+PEAK_SAMPLE_RATE = 8000
+PEAK_BASE_SAMPLES = 80 # samples per peak at the most detailed level (100 peaks per second)
+PEAK_ZOOM_FACTOR = 4 # each level has 4 times fewer peaks than the one before
+PEAK_MIN_COUNT = 512 # stop zooming out once a level would have fewer peaks than this
+PEAK_MAGIC = b"RLPK"
+
+# runs ffprobe on a file, the whole result is kept with the footage (see Footage.cached_probe)
+def probe_media(input_path):
+    return ffmpeg.probe(input_path)
+
+# ffprobe gives rates as fractions like "30000/1001" (and "0/0" if it does not know)
+def _parse_rate(rate):
+    try:
+        return float(Fraction(rate))
+    except (ValueError, ZeroDivisionError, TypeError):
+        return None
+
+def _parse_int(value):
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return None
+
 # extracts info from media
-def _get_media_info(input_path):
-    # extract data from media
-    probe = ffmpeg.probe(input_path)
+# probe is an earlier ffprobe result of the same file, without one the file is probed
+def get_media_info(input_path, probe=None):
+    if probe is None:
+        probe = probe_media(input_path)
     video_stream = next((s for s in probe['streams'] if s['codec_type'] == 'video'), None)
     audio_stream = next((s for s in probe['streams'] if s['codec_type'] == 'audio'), None)
 
@@ -22,6 +95,7 @@ def _get_media_info(input_path):
     media_info = {
         'has_video': video_stream is not None,
         'has_audio': audio_stream is not None,
+        'bitrate': _parse_int(probe.get('format', {}).get('bit_rate')),
     }
 
     # extract duration
@@ -30,27 +104,67 @@ def _get_media_info(input_path):
         total_seconds = ceil(float(format_info['duration']))
         media_info['duration'] = timedelta(seconds=total_seconds)
 
+    # the timecode can be on the container or on a stream (or a separate data stream)
+    for tags in [format_info.get('tags', {})] + [s.get('tags', {}) for s in probe['streams']]:
+        if tags.get('timecode'):
+            media_info['timecode'] = tags['timecode']
+            break
+
     # extract video specific information
     if video_stream:
         media_info.update({
+            'video_codec': video_stream.get('codec_name', ''),
+            'video_profile': video_stream.get('profile', ''),
+            'pix_fmt': video_stream.get('pix_fmt', ''),
             'width': int(video_stream['width']),
             'height': int(video_stream['height']),
-            'framerate': eval(video_stream['r_frame_rate']),
+            'framerate': _parse_rate(video_stream.get('r_frame_rate')),
         })
 
     # extract audio specific information
     if audio_stream:
         media_info.update({
+            'audio_codec': audio_stream.get('codec_name', ''),
             'sample_rate': int(audio_stream['sample_rate']),
+            'audio_channels': _parse_int(audio_stream.get('channels')),
         })
 
     return media_info
     
-# creates preview and auto-fills attributes (has_video, has_audio, length)
-def generate_preview(footage):
-    # read media
-    info = _get_media_info(footage.path)
-    input_stream = ffmpeg.input(footage.path)
+# which streams can go into the preview without encoding (copy video, copy audio)
+# a stream is copied when browsers play its codec and it is within the profile already
+def _copyable_streams(info, output_type, width, max_fps, sample_rate):
+    copy_video = (info.get('has_video', False)
+                  and info.get('video_codec') in COPY_VIDEO_CODECS
+                  and info.get('video_profile') in COPY_VIDEO_PROFILES
+                  and info.get('pix_fmt') in COPY_PIXEL_FORMATS
+                  and info.get('width', width + 1) <= width
+                  # unknown frame rates are encoded to be safe
+                  and 0 < (info.get('framerate') or 0) <= max_fps)
+    copy_audio = (info.get('has_audio', False)
+                  and info.get('audio_codec') in COPY_AUDIO_CODECS.get(output_type, ())
+                  and info.get('sample_rate', sample_rate + 1) <= sample_rate
+                  and (info.get('audio_channels') or COPY_MAX_CHANNELS + 1) <= COPY_MAX_CHANNELS)
+    return copy_video, copy_audio
+
+# whether the preview of this media is just a remux (nothing is encoded, so it is about as fast as copying the file)
+def is_remux(info):
+    output_type = "mp4" if info.get('has_video') else "mp3" if info.get('has_audio') else None
+    copy_video, copy_audio = _copyable_streams(info, output_type, PREVIEW_WIDTH, PREVIEW_MAX_FPS, PREVIEW_SAMPLE_RATE)
+    return output_type is not None and copy_video == info.get('has_video', False) and copy_audio == info.get('has_audio', False)
+
+# converts media into a browser friendly preview in a temp file of its own
+# returns the path of the temp file and its type (or None, None if there is nothing to render)
+# threads limits how many cores ffmpeg uses (None lets ffmpeg decide)
+# proxy uses the proxy profile instead of the preview profile
+# streams that are playable and within the profile already are copied instead of encoded (see _copyable_streams)
+def _transcode(input_path, info, tmp_dir, threads, proxy=False):
+    input_stream = ffmpeg.input(input_path)
+    output_type = None
+    if proxy:
+        width, max_fps, sample_rate = PROXY_WIDTH, PROXY_MAX_FPS, PROXY_SAMPLE_RATE
+    else:
+        width, max_fps, sample_rate = PREVIEW_WIDTH, PREVIEW_MAX_FPS, PREVIEW_SAMPLE_RATE
 
     # separate audio and video streams for filtering
     video_stream = input_stream.video if info.get('has_video') else None
@@ -58,41 +172,32 @@ def generate_preview(footage):
 
     # check for video specific stuff
     if info.get('has_video', False):
-        footage.has_video = True
-        default_width = 720
-
         # if video is in high definition, downgrade it
-        if info.get('width', default_width) > default_width:
-            new_height = int(info.get('height') * default_width / info.get('width'))
+        if info.get('width', width) > width:
+            new_height = int(info.get('height') * width / info.get('width'))
 
             # Make sure new height is divisible by 2
             if new_height % 2 != 0:
                 new_height += 1  # Or subtract 1 to round down
 
-            video_stream = video_stream.filter('scale', default_width, new_height)
+            video_stream = video_stream.filter('scale', width, new_height)
         
-        # if video has a high framerate, downgrade it
-        if info.get('framerate', 24) > 24:
-            video_stream = video_stream.filter('fps', fps=24)
+        # if video has a high framerate, downgrade it (unknown frame rates are left alone)
+        if (info.get('framerate') or 0) > max_fps:
+            video_stream = video_stream.filter('fps', fps=max_fps)
 
         # set output type to mp4 to so we know to render it later as an mp4
         output_type = "mp4"
-    else:
-        footage.has_video = False
     
     # check for audio specific stuff
     if info.get('has_audio'):
-        footage.has_audio = True
-
         # if sample rate is high, downgrade it
-        if info.get('sample_rate', 44100) > 44100:
-            audio_stream = audio_stream.filter('aresample', 44100)
+        if info.get('sample_rate', sample_rate) > sample_rate:
+            audio_stream = audio_stream.filter('aresample', sample_rate)
 
         # if there was no video data (but there is audio data), then we render as an mp3
         if not info.get('has_video'):
             output_type = "mp3"
-    else:
-        footage.has_audio = False
     
     # put the audio and video back together
     output_args = []
@@ -101,17 +206,324 @@ def generate_preview(footage):
     if audio_stream:
         output_args.append(audio_stream)
 
-    # if there is any data to output, render it
-    if output_args and output_type:
-        # converts media
-        ffmpeg.output(*output_args, f"tmp.{output_type}").run(overwrite_output=True)
+    # if there is no data to output, there is nothing to render
+    if not (output_args and output_type):
+        return None, None
+
+    # converts media
+    tmp_path = _temp_file(output_type, tmp_dir)
+    output_kwargs = {'threads': threads} if threads else {}
+
+    # copy what does not need changing (the filters above were not needed for those streams either)
+    copy_video, copy_audio = _copyable_streams(info, output_type, width, max_fps, sample_rate)
+    if copy_video:
+        output_kwargs['vcodec'] = 'copy'
+    if copy_audio:
+        output_kwargs['acodec'] = 'copy'
+    if copy_video or copy_audio:
+        # the index goes to the front so browsers can start playing before the whole file arrived
+        if output_type == "mp4":
+            output_kwargs['movflags'] = '+faststart'
+
+    if proxy:
+        # speed over quality
+        if output_type == "mp4" and not copy_video:
+            output_kwargs.update(PROXY_VIDEO_ARGS)
+        if audio_stream and not copy_audio:
+            output_kwargs.update(PROXY_AUDIO_ARGS)
+    # keyframes on every segment boundary, so the preview can be split without re-encoding
+    # (copied video keeps its own keyframes, segments are cut at the next one)
+    elif PREVIEW_SEGMENTED and output_type == "mp4" and not copy_video:
+        output_kwargs['force_key_frames'] = f"expr:gte(t,n_forced*{PREVIEW_SEGMENT_SECONDS})"
+    try:
+        ffmpeg.output(*output_args, tmp_path, **output_kwargs).run(overwrite_output=True, capture_stdout=True, capture_stderr=True)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    return tmp_path, output_type
+
+# makes an empty temp file and returns its path
+def _temp_file(extension, tmp_dir):
+    handle, tmp_path = tempfile.mkstemp(suffix=f".{extension}", dir=tmp_dir)
+    os.close(handle)
+    return tmp_path
+
+# renders the poster frame and the hover-scrub sprite sheet from a (small) video preview
+# the sprite sheet is a grid of thumbnails taken every `interval` seconds
+# returns the temp files and the index needed to find the thumbnail for a timestamp:
+# tile = min(floor(seconds / interval), count - 1), at x = (tile % columns) * width, y = (tile // columns) * height
+def render_thumbnails(preview_path, info, tmp_dir=PREVIEW_TMP_DIR):
+    duration = max(info['duration'].total_seconds(), 1) if 'duration' in info else 1
+
+    # always the same small grid, long clips just get a larger interval
+    interval = max(SPRITE_MIN_INTERVAL, ceil(duration / SPRITE_MAX_TILES))
+    count = max(1, ceil(duration / interval))
+    columns = min(SPRITE_COLUMNS, count)
+    rows = ceil(count / columns)
+    tile_height = max(2, round(THUMBNAIL_WIDTH * info['height'] / info['width'] / 2) * 2)
+
+    poster_path = _temp_file("jpg", tmp_dir)
+    sprite_path = _temp_file("jpg", tmp_dir)
+    try:
+        (ffmpeg.input(preview_path, ss=duration / 10)
+            .video.filter('scale', POSTER_WIDTH, -2)
+            .output(poster_path, vframes=1)
+            .run(overwrite_output=True, capture_stdout=True, capture_stderr=True))
+        (ffmpeg.input(preview_path)
+            .video.filter('fps', fps=f"1/{interval}")
+            .filter('scale', THUMBNAIL_WIDTH, tile_height)
+            .filter('tile', f"{columns}x{rows}")
+            .output(sprite_path, vframes=1)
+            .run(overwrite_output=True, capture_stdout=True, capture_stderr=True))
+    except BaseException:
+        os.remove(poster_path)
+        os.remove(sprite_path)
+        raise
+
+    index = {'interval': interval, 'count': count, 'columns': columns, 'rows': rows,
+             'width': THUMBNAIL_WIDTH, 'height': tile_height}
+    return {'poster': poster_path, 'sprite': sprite_path, 'thumbnail_index': index}
+
+# decodes the audio of a file once and reduces it to waveform peaks
+# returns a list of levels, each (samples_per_peak, mins, maxs) as int8 arrays, most detailed first
+def compute_peaks(media_path):
+    process = (ffmpeg.input(media_path).audio
+               .output('pipe:', format='s16le', ac=1, ar=PEAK_SAMPLE_RATE)
+               .global_args('-nostats', '-loglevel', 'error')
+               .run_async(pipe_stdout=True, pipe_stderr=True))
 
-        # saves file to previews
-        with open(f"tmp.{output_type}", 'rb') as f:
-            footage.preview.save(f'{footage.hash}.{output_type}', File(f), save=False)
+    # read the decoded samples a big block at a time, each block is reduced in one go
+    block_bytes = PEAK_BASE_SAMPLES * 8192 * 2
+    mins, maxs = [], []
+    leftover = np.empty(0, dtype=np.int16)
+    try:
+        while True:
+            data = process.stdout.read(block_bytes)
+            if not data:
+                break
+            samples = np.frombuffer(data[:len(data) // 2 * 2], dtype='<i2')
+            if len(leftover):
+                samples = np.concatenate((leftover, samples))
+
+            usable = len(samples) - len(samples) % PEAK_BASE_SAMPLES
+            frames = samples[:usable].reshape(-1, PEAK_BASE_SAMPLES)
+            mins.append(frames.min(axis=1))
+            maxs.append(frames.max(axis=1))
+            leftover = samples[usable:]
+    finally:
+        process.stdout.close()
+        error = process.stderr.read()
+        process.stderr.close()
+        if process.wait() != 0:
+            raise ffmpeg.Error('ffmpeg', None, error)
+
+    # the last partial block
+    if len(leftover):
+        mins.append(leftover.min(keepdims=True))
+        maxs.append(leftover.max(keepdims=True))
+    if not mins:
+        return []
+
+    # 16 bit is far more detail than a waveform drawing needs
+    level_mins = (np.concatenate(mins) >> 8).astype(np.int8)
+    level_maxs = (np.concatenate(maxs) >> 8).astype(np.int8)
+    samples_per_peak = PEAK_BASE_SAMPLES
+    levels = [(samples_per_peak, level_mins, level_maxs)]
+
+    # zoom out by combining every PEAK_ZOOM_FACTOR peaks into one
+    while len(level_mins) // PEAK_ZOOM_FACTOR >= PEAK_MIN_COUNT:
+        padding = -len(level_mins) % PEAK_ZOOM_FACTOR
+        level_mins = np.pad(level_mins, (0, padding), mode='edge').reshape(-1, PEAK_ZOOM_FACTOR).min(axis=1)
+        level_maxs = np.pad(level_maxs, (0, padding), mode='edge').reshape(-1, PEAK_ZOOM_FACTOR).max(axis=1)
+        samples_per_peak *= PEAK_ZOOM_FACTOR
+        levels.append((samples_per_peak, level_mins, level_maxs))
+
+    return levels
+
+# writes the waveform peaks of a file into a binary sidecar temp file
+# layout (little endian):
+#   header: b"RLPK", uint16 version, uint16 level count, uint32 sample rate
+#   per level: uint32 samples per peak, uint32 peak count, then peak count pairs of int8 (min, max)
+def render_peaks(media_path, tmp_dir=PREVIEW_TMP_DIR):
+    levels = compute_peaks(media_path)
+    if not levels:
+        return {}
+
+    peaks_path = _temp_file("peaks", tmp_dir)
+    with open(peaks_path, 'wb') as f:
+        f.write(struct.pack('<4sHHI', PEAK_MAGIC, 1, len(levels), PEAK_SAMPLE_RATE))
+        for samples_per_peak, mins, maxs in levels:
+            f.write(struct.pack('<II', samples_per_peak, len(mins)))
+            f.write(np.column_stack((mins, maxs)).tobytes())
+    return {'peaks': peaks_path}
+
+# converts media into everything the browser needs to show it
+# returns a dict with the media 'info', the temp 'preview' file (or None) and its 'preview_type',
+# plus the temp 'poster' and 'sprite' files and 'thumbnail_index' for video
+# and the temp 'peaks' file for anything with audio
+# and the 'probe' it is based on (with the 'identity' of the file it was made from)
+# every call renders to temp files of its own so several previews can be made at once
+# probe is a cached ffprobe result of the same file (so ffprobe does not run again)
+def render_preview(input_path, tmp_dir=PREVIEW_TMP_DIR, threads=None, probe=None):
+    # read media
+    identity = file_identity(input_path)
+    if probe is None:
+        probe = probe_media(input_path)
+    info = get_media_info(input_path, probe)
+    tmp_path, output_type = _transcode(input_path, info, tmp_dir, threads)
+    rendered = {'info': info, 'probe': probe, 'identity': identity, 'preview': tmp_path, 'preview_type': output_type}
+
+    # thumbnails are nice to have, a preview without them is still useful
+    if output_type == "mp4":
+        try:
+            rendered.update(render_thumbnails(tmp_path, info, tmp_dir))
+        except Exception as error:
+            print(f"thumbnails for {input_path} failed: {error}")
+
+    # peaks come from the preview as well, it is much smaller than the original
+    if tmp_path and info.get('has_audio'):
+        try:
+            rendered.update(render_peaks(tmp_path, tmp_dir))
+        except Exception as error:
+            print(f"waveform peaks for {input_path} failed: {error}")
+
+    return rendered
+
+# converts media into a quick proxy (see the proxy profile), nothing else is rendered
+# returns a dict with the media 'info', 'probe' and 'identity' (like render_preview)
+# and the temp 'proxy' file (or None) with its 'proxy_type'
+def render_proxy(input_path, tmp_dir=PREVIEW_TMP_DIR, threads=None, probe=None):
+    identity = file_identity(input_path)
+    if probe is None:
+        probe = probe_media(input_path)
+    info = get_media_info(input_path, probe)
+    if is_remux(info):
+        # the preview itself will be ready about as fast, a proxy would only be in the way
+        tmp_path, output_type = None, None
     else:
-        print("No preview created")
-                
+        tmp_path, output_type = _transcode(input_path, info, tmp_dir, threads, proxy=True)
+    return {'info': info, 'probe': probe, 'identity': identity, 'proxy': tmp_path, 'proxy_type': output_type}
+
+# render_preview for process pools
+# pool processes never load Django, and errors are returned as text since ffmpeg errors do not pickle
+def render_preview_in_pool(input_path, threads=1, probe=None):
+    try:
+        rendered = render_preview(input_path, threads=threads, probe=probe)
+    except Exception as error:
+        return {'error': f"{type(error).__name__}: {error}"}
+    rendered['error'] = None
+    return rendered
+
+# hashes and probes a media file (for importing lots of files at once)
+# like render_preview_in_pool this runs in pool processes, so errors are returned as text
+def inspect_in_pool(input_path):
+    try:
+        identity = file_identity(input_path)
+        file_hash = hash_file(input_path)
+        fingerprint = sample_fingerprint(input_path)
+        probe = probe_media(input_path)
+        info = get_media_info(input_path, probe)
+    except Exception as error:
+        return {'path': input_path, 'error': f"{type(error).__name__}: {error}"}
+    return {'path': input_path, 'identity': identity, 'hash': file_hash, 'fingerprint': fingerprint,
+            'probe': probe, 'info': info, 'error': None}
+
+# the footage fields apply_media_info sets (for saving them with an update)
+MEDIA_INFO_FIELDS = ('has_video', 'has_audio', 'length', 'video_codec', 'audio_codec', 'width', 'height',
+                     'framerate', 'bitrate', 'timecode', 'probe', 'probe_key')
+
+# fills in the attributes of footage (has_video, has_audio, length, codecs...) from the media info
+# with the probe it came from, that is kept too (for the identity the file has now)
+def apply_media_info(footage, info, probe=None, identity=None):
+    footage.has_video = info.get('has_video', False)
+    footage.has_audio = info.get('has_audio', False)
+    footage.video_codec = info.get('video_codec', '')
+    footage.audio_codec = info.get('audio_codec', '')
+    footage.width = info.get('width')
+    footage.height = info.get('height')
+    footage.framerate = info.get('framerate')
+    footage.bitrate = info.get('bitrate')
+    footage.timecode = info.get('timecode', '')
+    if probe is not None:
+        footage.set_probe(probe, identity)
+
     # get time
     if 'duration' in info:
-        footage.length = info["duration"]
\ No newline at end of file
+        footage.length = info["duration"]
+
+# saves the rendered temp files as the preview (and poster, sprite, peaks) of footage and removes the temp files
+def store_rendered(footage, rendered):
+    files = (
+        (footage.preview, rendered.get('preview'), rendered.get('preview_type')),
+        (footage.poster, rendered.get('poster'), 'jpg'),
+        (footage.sprite, rendered.get('sprite'), 'jpg'),
+        (footage.peaks, rendered.get('peaks'), 'peaks'),
+    )
+    for field_file, tmp_path, extension in files:
+        if not tmp_path:
+            # nothing rendered, forget the old file (the caller deletes it)
+            field_file.name = None
+            continue
+        try:
+            with open(tmp_path, 'rb') as f:
+                field_file.save(f'{footage.hash}.{extension}', File(f), save=False)
+        finally:
+            os.remove(tmp_path)
+
+    footage.thumbnail_index = rendered.get('thumbnail_index')
+
+# saves the rendered temp file as the proxy of footage and removes the temp file
+# named after the fingerprint, the full hash is not known this early
+def store_proxy(footage, rendered):
+    tmp_path = rendered.get('proxy')
+    if not tmp_path:
+        footage.proxy.name = None
+        return
+    try:
+        with open(tmp_path, 'rb') as f:
+            footage.proxy.save(f"{footage.fingerprint or footage.pk}.{rendered['proxy_type']}", File(f), save=False)
+    finally:
+        os.remove(tmp_path)
+
+# splits a stored mp4 preview into HLS segments plus a playlist (no re-encoding)
+# the segments are written next to the final folder and swapped in once complete
+def segment_preview(footage, segment_seconds=PREVIEW_SEGMENT_SECONDS):
+    storage = footage.preview.storage
+    relative_dir = f"{HLS_ROOT}/{footage.pk}/{footage.preview_version}"
+    final_dir = storage.path(relative_dir)
+    os.makedirs(os.path.dirname(final_dir), exist_ok=True)
+
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(final_dir))
+    try:
+        (ffmpeg.input(footage.preview.path)
+            .output(os.path.join(tmp_dir, HLS_PLAYLIST), c='copy', f='hls', hls_time=segment_seconds,
+                    hls_playlist_type='vod', hls_segment_filename=os.path.join(tmp_dir, 'seg%05d.ts'))
+            .run(overwrite_output=True, capture_stdout=True, capture_stderr=True))
+        if os.path.isdir(final_dir):
+            shutil.rmtree(final_dir)
+        os.rename(tmp_dir, final_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    footage.preview_segments = relative_dir
+
+# removes a folder of HLS segments (and the folder of its footage once that is empty)
+def remove_segments(storage, relative_dir):
+    if relative_dir:
+        shutil.rmtree(storage.path(relative_dir), ignore_errors=True)
+        try:
+            os.rmdir(os.path.dirname(storage.path(relative_dir)))
+        except OSError:
+            pass
+
+# creates preview and auto-fills attributes (has_video, has_audio, length)
+def generate_preview(footage):
+    rendered = render_preview(footage.path, probe=footage.cached_probe())
+    apply_media_info(footage, rendered['info'], rendered['probe'], rendered['identity'])
+
+    # saves file to previews
+    if not rendered['preview']:
+        print("No preview created")
+    store_rendered(footage, rendered)
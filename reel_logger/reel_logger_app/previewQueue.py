@@ -0,0 +1,194 @@
+'''
+This file handles the preview job queue.
+Uploads only record a PreviewJob, the actual ffmpeg work happens here in the background.
+It is driven by `manage.py preview_worker`.
+
+New footage gets two jobs: a proxy (tiny and fast, runs first) and the preview itself.
+The proxy is played until the preview is done, then one update swaps in the preview and the proxy is deleted.
+'''
+import os
+from datetime import timedelta
+
+import ffmpeg
+
+from django.db.models import Q
+from django.utils import timezone
+
+from reel_logger.settings import PREVIEW_MAX_ATTEMPTS, PREVIEW_SEGMENTED
+from reel_logger_app.cacheHandler import bump
+from reel_logger_app.models import Footage, PreviewJob
+from reel_logger_app.previewHandler import render_preview, render_proxy, apply_media_info, store_rendered, store_proxy, segment_preview, remove_segments, PREVIEW_PROFILE, MEDIA_INFO_FIELDS
+
+# grabs the most important queued job and marks it as running
+# the status check in the update means two workers can never claim the same job
+def claim_next_job():
+    candidates = (PreviewJob.objects.filter(status='queued')
+                  .order_by('-priority', 'created')
+                  .values_list('id', flat=True)[:10])
+
+    for job_id in candidates:
+        now = timezone.now()
+        claimed = PreviewJob.objects.filter(pk=job_id, status='queued').update(
+            status='running', started=now, heartbeat=now)
+        if claimed:
+            # the footage (and the job with it) may have been deleted in the meantime
+            job = PreviewJob.objects.select_related('footage').filter(pk=job_id).first()
+            if job:
+                return job
+    return None
+
+# tells other workers these jobs are still being rendered
+def heartbeat_jobs(job_ids):
+    return PreviewJob.objects.filter(pk__in=job_ids, status='running').update(heartbeat=timezone.now())
+
+# puts jobs back in the queue if their worker died while running them
+# a worker refreshes the heartbeat of its jobs every few seconds, so a long transcode is never taken away
+def requeue_stale_jobs(older_than=timedelta(minutes=5)):
+    cutoff = timezone.now() - older_than
+    # (jobs claimed before there were heartbeats only have started)
+    stale = Q(heartbeat__lt=cutoff) | Q(heartbeat__isnull=True, started__lt=cutoff)
+    return PreviewJob.objects.filter(stale, status='running').update(status='queued')
+
+# renders the preview (or the proxy) for a single claimed job
+def run_job(job):
+    footage = job.footage
+    if job.tier == 'proxy':
+        return _run_proxy_job(job)
+    Footage.objects.filter(pk=footage.pk).update(preview_status='running', updated=timezone.now())
+    bump("footage")
+
+    try:
+        # a cached probe saves running ffprobe again (like when only the profile changed)
+        stored = save_rendered_preview(footage, render_preview(footage.path, probe=footage.cached_probe()))
+    except Exception as error:
+        _fail_job(job, error)
+        return False
+
+    # the job was deleted together with the footage if it is gone
+    if stored:
+        _finish_job(job, 'done')
+    return stored
+
+# renders the proxy for a claimed proxy job
+# a proxy is only a stopgap, so a failure is not retried (the preview job reports what is wrong with the file)
+def _run_proxy_job(job):
+    footage = job.footage
+    try:
+        save_rendered_proxy(footage, render_proxy(footage.path, probe=footage.cached_probe()))
+    except Exception as error:
+        print(f"proxy for {footage} failed: {error}")
+        _finish_job(job, 'failed', f"{type(error).__name__}: {error}")
+        return False
+    _finish_job(job, 'done')
+    return True
+
+# records how a job ended
+# an update and not job.save(), that would raise if the footage (and the job with it) was deleted while it ran
+def _finish_job(job, status, error=''):
+    job.status = status
+    job.attempts += 1
+    job.error = error
+    job.finished = timezone.now() if status != 'queued' else None
+    PreviewJob.objects.filter(pk=job.pk).update(status=job.status, attempts=job.attempts, error=job.error, finished=job.finished)
+
+# stores a rendered proxy on its footage
+# it is thrown away again if the preview finished first (or the footage was deleted)
+def save_rendered_proxy(footage, rendered):
+    old_proxy = footage.proxy.name
+    storage = footage.proxy.storage
+
+    # length, codecs and the probe are known now, no need to wait for the preview
+    apply_media_info(footage, rendered['info'], rendered['probe'], rendered['identity'])
+    store_proxy(footage, rendered)
+
+    updated = Footage.objects.filter(pk=footage.pk).exclude(preview_status='done').update(
+        proxy=footage.proxy.name, **{field: getattr(footage, field) for field in MEDIA_INFO_FIELDS},
+        updated=timezone.now())
+    bump("footage")
+
+    # clean up the old proxy, or the new one if it is not needed anymore
+    if not updated:
+        old_proxy = footage.proxy.name
+    if old_proxy and (not updated or old_proxy != footage.proxy.name):
+        storage.delete(old_proxy)
+
+# stores a rendered preview (and poster, sprite, peaks) on its footage and replaces the old files
+# also used by `manage.py rebuild_previews` which renders in other processes
+# returns False if the footage was deleted while it rendered (nothing is stored then)
+def save_rendered_preview(footage, rendered):
+    # its file is gone too, so there is nothing to hash, throw the render away
+    if not Footage.objects.filter(pk=footage.pk).exists():
+        _discard_rendered(rendered)
+        return False
+
+    old_files = [footage.preview.name, footage.poster.name, footage.sprite.name, footage.peaks.name]
+    old_segments = footage.preview_segments
+    storage = footage.preview.storage
+
+    # the files are named after the hash, which is only computed here after the file changed
+    footage.ensure_hash()
+    apply_media_info(footage, rendered['info'], rendered.get('probe'), rendered.get('identity'))
+    footage.preview_profile = PREVIEW_PROFILE
+    footage.preview_segments = ''
+    store_rendered(footage, rendered)
+
+    # segments are optional, the plain preview still works without them
+    if PREVIEW_SEGMENTED and rendered['preview_type'] == "mp4":
+        try:
+            segment_preview(footage)
+        except Exception as error:
+            print(f"segmenting the preview of {footage} failed: {error}")
+
+    # the proxy goes away with the old files, the preview replaces it
+    # (it was most likely made while this preview was rendering, so ask the database)
+    old_files.append(Footage.objects.filter(pk=footage.pk).values_list('proxy', flat=True).first())
+    footage.proxy.name = None
+
+    # update directly so save() does not look at the file again
+    new_files = [footage.preview.name, footage.poster.name, footage.sprite.name, footage.peaks.name]
+    updated = Footage.objects.filter(pk=footage.pk).update(
+        preview=footage.preview.name, poster=footage.poster.name, sprite=footage.sprite.name, peaks=footage.peaks.name, proxy='',
+        thumbnail_index=footage.thumbnail_index, **{field: getattr(footage, field) for field in MEDIA_INFO_FIELDS},
+        preview_status='done', preview_error='', preview_profile=PREVIEW_PROFILE,
+        preview_segments=footage.preview_segments, updated=timezone.now())
+    bump("footage")
+
+    # the footage was deleted meanwhile (with its old files), nothing uses the new ones
+    if not updated:
+        for name in new_files:
+            if name:
+                storage.delete(name)
+        remove_segments(storage, footage.preview_segments)
+        return False
+
+    # clean up the old files
+    for name in old_files:
+        if name and name not in new_files:
+            storage.delete(name)
+    # (unless a copy of the same content still uses them, from before segments were kept per footage)
+    if old_segments != footage.preview_segments and not Footage.objects.filter(preview_segments=old_segments).exists():
+        remove_segments(storage, old_segments)
+    return True
+
+# removes the temp files of a render that is not stored
+def _discard_rendered(rendered):
+    for name in ('preview', 'poster', 'sprite', 'peaks'):
+        if rendered.get(name) and os.path.exists(rendered[name]):
+            os.remove(rendered[name])
+
+# records a failure and retries the job unless it ran out of attempts
+def _fail_job(job, error):
+    # ffmpeg puts the useful part of the error in stderr
+    if isinstance(error, ffmpeg.Error) and error.stderr:
+        message = error.stderr.decode(errors='replace')[-2000:]
+    else:
+        message = f"{type(error).__name__}: {error}"
+    print(f"preview for {job.footage} failed: {message}")
+
+    if job.attempts + 1 < PREVIEW_MAX_ATTEMPTS:
+        _finish_job(job, 'queued', message)
+        Footage.objects.filter(pk=job.footage_id).update(preview_status='queued', updated=timezone.now())
+    else:
+        _finish_job(job, 'failed', message)
+        Footage.objects.filter(pk=job.footage_id).update(preview_status='failed', preview_error=message, updated=timezone.now())
+    bump("footage")
@@ -0,0 +1,41 @@
+'''
+This file handles searching footage by its takes.
+Scene, shot and take each match either the true take or what was marked on the slate.
+
+Every criterion becomes one "id IN (footage of matching takes)" subquery,
+so the whole search is a single query with no joins on the footage itself.
+That means no duplicate rows (no .distinct()) and adding a filter only adds one more subquery.
+The subquery starts from the take indexes (true OR marked, added in migration 0009) and
+reaches footage through the FootageTake take index, so it only touches matching takes.
+(A correlated EXISTS would have to be checked against every footage row instead.)
+
+Codec and resolution come from the stored ffprobe result (copied into indexed columns), so no file is probed to search.
+'''
+from django.db.models import Q
+
+from reel_logger_app.models import Take
+
+# footage with a take that has this value as either its true or its marked value
+def _has_take(true_field, marked_field, value):
+    matches = Q(**{true_field: value}) | Q(**{marked_field: value})
+    return Q(pk__in=Take.objects.filter(matches).values('footage'))
+
+# narrows down a footage queryset
+# each criterion is checked on its own, so scene and shot may match different takes of the same footage
+# logged is True, False or None (both)
+# codec matches the video or the audio codec (like "h264" or "pcm_s24le"), min_height is in pixels
+def search_footage(footage_list, scene=None, shot=None, take=None, logged=None, codec=None, min_height=None):
+    if scene:
+        footage_list = footage_list.filter(_has_take('shot_scene_id', 'marked_scene', scene))
+    if shot:
+        footage_list = footage_list.filter(_has_take('shot_name', 'marked_shot', shot))
+    if take:
+        footage_list = footage_list.filter(_has_take('take_no', 'marked_take', take))
+    if logged is not None:
+        footage_list = footage_list.filter(logged=logged)
+    if codec:
+        codec = codec.lower()
+        footage_list = footage_list.filter(Q(video_codec=codec) | Q(audio_codec=codec))
+    if min_height:
+        footage_list = footage_list.filter(height__gte=min_height)
+    return footage_list
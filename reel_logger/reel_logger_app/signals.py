@@ -0,0 +1,51 @@
+'''
+This file contains the signal handlers for reel_logger_app.
+Django calls these automatically whenever a model is saved or deleted.
+They keep things that depend on several tables (like Footage.updated and Footage.format_dirty) in sync,
+and make the cached list and scene pages stale (see cacheHandler.py).
+'''
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from reel_logger_app.cacheHandler import bump
+from reel_logger_app.models import Footage, Scene, Shot, Take, FootageTake
+
+# linking or unlinking a take changes the footage (its takes and ratings, so also where it gets formatted to)
+@receiver(post_save, sender=FootageTake)
+@receiver(post_delete, sender=FootageTake)
+def footage_take_changed(sender, instance, **kwargs):
+    Footage.objects.filter(pk=instance.footage_id).update(updated=timezone.now(), format_dirty=True)
+    bump("footage")
+
+# a take rating (or marking) shows up on every footage the take is in
+@receiver(post_save, sender=Take)
+def take_changed(sender, instance, **kwargs):
+    Footage.objects.filter(footagetake__take_scene=instance.shot_scene_id,
+                           footagetake__take_shot=instance.shot_name,
+                           footagetake__take_no=instance.take_no).update(updated=timezone.now(), format_dirty=True)
+    bump("footage")
+
+# a deleted take takes its links along (FootageTake cascades, which sends footage_take_changed for each),
+# this covers the list as well when it had none
+@receiver(post_delete, sender=Take)
+def take_deleted(sender, instance, **kwargs):
+    bump("footage")
+
+# footage itself (saved through the model, .update() callers bump on their own)
+@receiver(post_save, sender=Footage)
+@receiver(post_delete, sender=Footage)
+def footage_changed(sender, instance, **kwargs):
+    bump("footage")
+
+# the scene list shows every scene, its page shows the scene itself
+@receiver(post_save, sender=Scene)
+@receiver(post_delete, sender=Scene)
+def scene_changed(sender, instance, **kwargs):
+    bump("scenes", f"scene:{instance.script_number}")
+
+# only the page of the scene the shot is in lists it
+@receiver(post_save, sender=Shot)
+@receiver(post_delete, sender=Shot)
+def shot_changed(sender, instance, **kwargs):
+    bump(f"scene:{instance.scene_id}")
@@ -1,4 +1,1012 @@
-from django.test import TestCase
+import hashlib
+import json
+import os
+import shutil
+import struct
+import tempfile
+import wave
+from concurrent.futures import Future
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
-# none lol
\ No newline at end of file
+import ffmpeg
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from reel_logger_app import directoryFormatter, formatJournal
+from reel_logger_app.hashHandler import hash_file, file_identity
+from reel_logger_app.ingestHandler import register_footage
+from reel_logger_app.management.commands.ingest_watch import Command as IngestWatch
+from reel_logger_app.management.commands.rebuild_previews import Command as RebuildPreviews
+from reel_logger_app.mediaResponse import media_response
+from reel_logger_app.api import encode_cursor
+from reel_logger_app.forms import FootageSearch, FormatSettings
+from reel_logger_app.models import Footage, Scene, Shot, Take, FootageTake, PreviewJob, UploadSession
+from reel_logger_app.previewHandler import apply_media_info, get_media_info, inspect_in_pool, is_remux, render_peaks, render_thumbnails, segment_preview, PREVIEW_PROFILE
+from reel_logger_app.previewQueue import claim_next_job, heartbeat_jobs, requeue_stale_jobs, run_job, save_rendered_preview
+
+# makes footage backed by small real files (Footage.save reads the file)
+# every test gets an empty local memory cache and its own MEDIA_ROOT (previews, uploads), whatever secret.toml configures
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "tests"}})
+class FootageTestCase(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir, ignore_errors=True)
+        settings = self.settings(MEDIA_ROOT=self.tmp_dir)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        cache.clear()
+
+    def make_footage(self, name, **kwargs):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, "wb") as f:
+            f.write(name.encode())
+        return Footage.objects.create(path=path, **kwargs)
+
+    def make_take(self, scene, shot, take_no, rating=0, **kwargs):
+        scene, _ = Scene.objects.get_or_create(script_number=scene, defaults={"title": f"scene {scene}"})
+        Shot.objects.get_or_create(scene=scene, shot=shot)
+        take, _ = Take.objects.get_or_create(shot_scene=scene, shot_name=shot, take_no=take_no,
+                                             defaults={"rating": rating, **kwargs})
+        return take
+
+    # a silent wav (real media for ffmpeg)
+    def write_wav(self, path, seconds=1):
+        with wave.open(path, "wb") as file:
+            file.setnchannels(1)
+            file.setsampwidth(2)
+            file.setframerate(8000)
+            file.writeframes(bytes(8000 * seconds * 2))
+
+    def link(self, footage, take):
+        return FootageTake.objects.create(footage=footage, take_scene_id=take.shot_scene_id,
+                                          take_shot=take.shot_name, take_no=take.take_no)
+
+class FootageListTests(FootageTestCase):
+    def make_library(self, count, prefix=""):
+        for i in range(count):
+            footage = self.make_footage(f"{prefix}{i:05}.MTS")
+            self.link(footage, self.make_take(1, "A", i % 5 + 1, rating=i % 7))
+            self.link(footage, self.make_take(2, "B", i % 3 + 1, rating=i % 4))
+
+    # the list must not run queries per row (count, page, takes)
+    def test_query_count_does_not_grow_with_rows(self):
+        self.make_library(3)
+        with self.assertNumQueries(3):
+            self.client.get(reverse("View_Footage"))
+
+        self.make_library(40, prefix="more")
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("View_Footage"), {"scene": 1, "sort": "-rating_max"})
+        self.assertEqual(response.status_code, 200)
+
+    # a cached page does not query, and any change to footage (or its takes) shows up right away
+    def test_cached_until_footage_changes(self):
+        footage = self.make_footage("cached.MTS")
+        take = self.make_take(1, "A", 1, rating=3)
+        self.link(footage, take)
+        self.client.get(reverse("View_Footage"))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("View_Footage"))
+        self.assertEqual(response.context["page"][0].max_rating, 3)
+
+        take.rating = 8
+        take.save()
+        response = self.client.get(reverse("View_Footage"))
+        self.assertEqual(response.context["page"][0].max_rating, 8)
+
+        # the preview worker writes with .update() (no signals) and bumps the version itself
+        PreviewJob.objects.filter(footage=footage).delete()
+        PreviewJob.objects.create(footage=footage)
+        with mock.patch("reel_logger_app.previewQueue.render_preview", side_effect=RuntimeError("bad file")), \
+             mock.patch("reel_logger_app.previewQueue.PREVIEW_MAX_ATTEMPTS", 1):
+            run_job(claim_next_job())
+        self.assertEqual(self.client.get(reverse("View_Footage")).context["page"][0].preview_status, "failed")
+
+        # deleting a take drops its links (the cascade sends their signals)
+        take.delete()
+        response = self.client.get(reverse("View_Footage"))
+        self.assertEqual((response.context["page"][0].max_rating, list(response.context["page"][0].take_set.all())), (0, []))
+        self.assertTrue(Footage.objects.get(pk=footage.pk).format_dirty)
+
+        self.make_footage("new.MTS")
+        self.assertEqual(self.client.get(reverse("View_Footage")).context["page"].paginator.count, 2)
+
+    def test_ratings_and_pagination(self):
+        footage = self.make_footage("rated.MTS")
+        self.link(footage, self.make_take(3, "C", 1, rating=9))
+        self.link(footage, self.make_take(3, "C", 2, rating=10))
+        self.make_library(60)
+
+        response = self.client.get(reverse("View_Footage"), {"sort": "-rating_average"})
+        first = response.context["page"][0]
+        self.assertEqual(first, footage)
+        self.assertEqual(first.average_rating, 9.5)
+        self.assertEqual(first.max_rating, 10)
+        self.assertEqual(len(response.context["page"]), 50)
+        self.assertEqual(response.context["page"].paginator.count, 61)
+
+class SceneCacheTests(FootageTestCase):
+    # scene pages are served from the cache until a scene or shot signal bumps their version
+    def test_scene_pages_are_invalidated_by_signals(self):
+        scene = Scene.objects.create(script_number=4, title="night")
+        Shot.objects.create(scene=scene, shot="A")
+        other = Scene.objects.create(script_number=5, title="day")
+        self.client.get(reverse("View_Scenes"))
+        self.client.get(reverse("Scene_Editor", args=[4]))
+        with self.assertNumQueries(0):
+            self.client.get(reverse("View_Scenes"))
+            response = self.client.get(reverse("Scene_Editor", args=[4]))
+        self.assertEqual([str(shot) for shot in response.context["list"]], ["4 A"])
+
+        # a shot in another scene leaves this page cached
+        Shot.objects.create(scene=other, shot="B")
+        with self.assertNumQueries(0):
+            self.client.get(reverse("Scene_Editor", args=[4]))
+
+        Shot.objects.create(scene=scene, shot="B")
+        response = self.client.get(reverse("Scene_Editor", args=[4]))
+        self.assertEqual([str(shot) for shot in response.context["list"]], ["4 A", "4 B"])
+
+        scene.title = "dawn"
+        scene.save()
+        self.assertContains(self.client.get(reverse("View_Scenes")), "4 - dawn")
+        other.delete()
+        self.assertNotContains(self.client.get(reverse("View_Scenes")), "5 - day")
+
+class HashingTests(FootageTestCase):
+    # the file is read a buffer at a time, the result is the md5 of the whole file
+    def test_chunked_hash(self):
+        data = os.urandom(100_003)
+        path = os.path.join(self.tmp_dir, "chunks.MOV")
+        with open(path, "wb") as file:
+            file.write(data)
+        self.assertEqual(hash_file(path, chunk_size=4096), hashlib.md5(data).hexdigest())
+        self.assertEqual(hash_file(path), hashlib.md5(data).hexdigest())
+
+    # editing notes or moving the file does not read it again
+    def test_metadata_edits_and_moves_skip_the_file(self):
+        footage = self.make_footage("C0001.MP4", hash="known")
+        with mock.patch("reel_logger_app.models.hash_file", side_effect=AssertionError("file was read")), \
+             mock.patch("reel_logger_app.models.sample_fingerprint", side_effect=AssertionError("file was read")):
+            footage.notes = "good take"
+            footage.save()
+            footage.move(os.path.join(self.tmp_dir, "moved.MP4"))
+
+        footage.refresh_from_db()
+        self.assertEqual((footage.path, footage.notes, footage.hash),
+                         (os.path.join(self.tmp_dir, "moved.MP4"), "good take", "known"))
+        self.assertEqual(footage.file_identity, file_identity(footage.path))
+
+class PreviewQueueTests(FootageTestCase):
+    # proxies go first, then new uploads, bulk work last
+    def test_claim_order(self):
+        bulk = self.make_footage("bulk.MTS")
+        PreviewJob.objects.all().delete()
+        bulk.queue_preview(PreviewJob.PRIORITY_BULK)
+        upload = self.make_footage("upload.MTS")
+
+        claimed = [claim_next_job() for _ in range(3)]
+        self.assertEqual([(job.footage, job.tier) for job in claimed],
+                         [(upload, "proxy"), (upload, "full"), (bulk, "full")])
+        self.assertTrue(all(job.status == "running" for job in claimed))
+        self.assertIsNone(claim_next_job())
+
+        # queueing again moves a waiting job up instead of adding one
+        other = self.make_footage("other.MTS")
+        other.queue_preview(PreviewJob.PRIORITY_NORMAL + 5)
+        self.assertEqual(other.previewjob_set.filter(tier="full").get().priority, PreviewJob.PRIORITY_NORMAL + 5)
+
+    # a failing preview is retried until it runs out of attempts
+    def test_retry_then_fail(self):
+        footage = self.make_footage("broken.MTS")
+        PreviewJob.objects.filter(tier="proxy").delete()
+        with mock.patch("reel_logger_app.previewQueue.PREVIEW_MAX_ATTEMPTS", 2), \
+             mock.patch("reel_logger_app.previewQueue.render_preview", side_effect=RuntimeError("bad file")):
+            self.assertFalse(run_job(claim_next_job()))
+            job = PreviewJob.objects.get()
+            footage.refresh_from_db()
+            self.assertEqual((job.status, job.attempts, footage.preview_status), ("queued", 1, "queued"))
+
+            self.assertFalse(run_job(claim_next_job()))
+        job.refresh_from_db()
+        footage.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, footage.preview_status), ("failed", 2, "failed"))
+        self.assertEqual(footage.preview_error, "RuntimeError: bad file")
+        self.assertIsNone(claim_next_job())
+
+    # only jobs whose worker stopped sending heartbeats are taken back
+    def test_stale_jobs_are_requeued(self):
+        self.make_footage("long.MTS")
+        PreviewJob.objects.filter(tier="proxy").delete()
+        job = claim_next_job()
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        PreviewJob.objects.filter(pk=job.pk).update(started=an_hour_ago, heartbeat=an_hour_ago)
+
+        heartbeat_jobs([job.pk])
+        self.assertEqual(requeue_stale_jobs(timedelta(minutes=5)), 0)
+
+        PreviewJob.objects.filter(pk=job.pk).update(heartbeat=an_hour_ago)
+        self.assertEqual(requeue_stale_jobs(timedelta(minutes=5)), 1)
+        self.assertEqual(claim_next_job(), job)
+
+    # footage deleted while its job renders (the job goes with it) ends the job quietly
+    def test_deleted_while_rendering(self):
+        def render(footage_path, **kwargs):
+            Footage.objects.get(path=footage_path).delete()
+            rendered = {"info": {"has_video": True, "has_audio": False}, "preview_type": "mp4"}
+            rendered["preview"] = os.path.join(self.tmp_dir, "rendered.mp4")
+            with open(rendered["preview"], "wb") as file:
+                file.write(b"rendered")
+            return rendered
+
+        def fail(footage_path, **kwargs):
+            Footage.objects.get(path=footage_path).delete()
+            raise RuntimeError("file went away")
+
+        for tier, target, side_effect in (("full", "render_preview", render), ("full", "render_preview", fail),
+                                          ("proxy", "render_proxy", fail)):
+            self.make_footage("gone.MOV")
+            PreviewJob.objects.exclude(tier=tier).delete()
+            with mock.patch(f"reel_logger_app.previewQueue.{target}", side_effect=side_effect):
+                self.assertFalse(run_job(claim_next_job()))
+            self.assertFalse(PreviewJob.objects.exists())
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, "rendered.mp4")))
+
+class RebuildPreviewsTests(FootageTestCase):
+    def select(self, **options):
+        options = {"scene": None, "logged": False, "unlogged": False, "missing_only": False, **options}
+        return list(RebuildPreviews().get_footage(options))
+
+    # missing and out of date previews are rebuilt, current ones are left alone
+    def test_selection(self):
+        missing = self.make_footage("missing.MTS", logged=True)
+        self.link(missing, self.make_take(1, "A", 1))
+        outdated = self.make_footage("outdated.MTS")
+        current = self.make_footage("current.MTS")
+        Footage.objects.filter(pk=outdated.pk).update(preview="previews/outdated.mp4", preview_profile="old")
+        Footage.objects.filter(pk=current.pk).update(preview="previews/current.mp4", preview_profile=PREVIEW_PROFILE)
+
+        self.assertEqual(self.select(), [missing, outdated])
+        self.assertEqual(self.select(missing_only=True), [missing])
+        self.assertEqual(self.select(scene=[1]), [missing])
+        self.assertEqual(self.select(unlogged=True), [outdated])
+
+        Footage.objects.update(preview="previews/done.mp4", preview_profile=PREVIEW_PROFILE)
+        output = StringIO()
+        call_command("rebuild_previews", stdout=output)
+        self.assertEqual(output.getvalue().strip(), "all previews are up to date")
+
+class MediaResponseTests(FootageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.data = os.urandom(10_000)
+        self.path = os.path.join(self.tmp_dir, "preview.mp4")
+        with open(self.path, "wb") as file:
+            file.write(self.data)
+
+    def get(self, **headers):
+        request = RequestFactory().get("/", headers=headers)
+        return media_response(request, self.path, "video/mp4", "v1")
+
+    # seeking asks for ranges, revalidating sends the ETag back
+    def test_ranges_and_conditional_requests(self):
+        response = self.get()
+        self.assertEqual((response.status_code, response["ETag"], response["Accept-Ranges"]), (200, '"v1"', "bytes"))
+        self.assertEqual(b"".join(response.streaming_content), self.data)
+
+        response = self.get(Range="bytes=100-199")
+        self.assertEqual((response.status_code, response["Content-Range"]), (206, "bytes 100-199/10000"))
+        self.assertEqual(b"".join(response.streaming_content), self.data[100:200])
+        self.assertEqual(b"".join(self.get(Range="bytes=-10").streaming_content), self.data[-10:])
+        self.assertEqual(b"".join(self.get(Range="bytes=9990-").streaming_content), self.data[9990:])
+
+        response = self.get(Range="bytes=20000-")
+        self.assertEqual((response.status_code, response["Content-Range"]), (416, "bytes */10000"))
+
+        self.assertEqual(self.get(**{"If-None-Match": '"v1"'}).status_code, 304)
+        # the file changed since the browser got its part, so it gets everything
+        self.assertEqual(self.get(Range="bytes=0-9", **{"If-Range": '"v0"'}).status_code, 200)
+        self.assertEqual(self.get(Range="bytes=0-9", **{"If-Range": '"v1"'}).status_code, 206)
+
+    # preview urls are cached forever, so their version has to follow the preview file, not the hash field
+    # (which is empty after a change until the preview worker hashes the file again)
+    def test_preview_version_follows_the_file(self):
+        first = self.make_footage("first.MOV")
+        second = self.make_footage("second.MOV")
+        for footage, name in ((first, "previews/aaa.mp4"), (second, "previews/bbb.mp4")):
+            footage.preview.name, footage.preview_profile, footage.hash = name, PREVIEW_PROFILE, ""
+        self.assertNotEqual(first.preview_version, second.preview_version)
+        self.assertEqual(first.preview_version, f"aaa-{PREVIEW_PROFILE}")
+
+        first.preview.name = "previews/ccc.mp4"
+        self.assertEqual(first.preview_version, f"ccc-{PREVIEW_PROFILE}")
+
+class SegmentedPreviewTests(FootageTestCase):
+    # copies of the same content have the same preview version, but each gets its own segments
+    def test_segments_are_kept_per_footage(self):
+        os.makedirs(os.path.join(self.tmp_dir, "previews"))
+        preview = os.path.join(self.tmp_dir, "previews", "same.mp4")
+        (ffmpeg.input("testsrc=duration=3:size=64x48:rate=10", f="lavfi")
+            .output(preview, vcodec="libx264", g=10).run(quiet=True))
+
+        copies = [self.make_footage(name, hash="same") for name in ("A.MOV", "B.MOV")]
+        for footage in copies:
+            footage.preview.name = "previews/same.mp4"
+            segment_preview(footage, segment_seconds=1)
+            Footage.objects.filter(pk=footage.pk).update(preview=footage.preview.name,
+                                                         preview_segments=footage.preview_segments)
+        first, second = copies
+        self.assertEqual(first.preview_version, second.preview_version)
+        self.assertEqual(first.preview_segments, f"previews/hls/{first.pk}/{first.preview_version}")
+        self.assertNotEqual(first.preview_segments, second.preview_segments)
+
+        Footage.objects.filter(pk=first.pk).update(preview="")
+        Footage.objects.get(pk=first.pk).delete()
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, "previews", "hls", str(first.pk))))
+        response = self.client.get(reverse("Footage_Preview_Playlist", args=[second.pk, second.preview_version]))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(os.path.exists(os.path.join(self.tmp_dir, second.preview_segments, "seg00000.ts")))
+
+class ThumbnailTests(FootageTestCase):
+    def make_clip(self, seconds):
+        path = os.path.join(self.tmp_dir, f"{seconds}s.mp4")
+        (ffmpeg.input(f"testsrc=duration={seconds}:size=64x48:rate=1", f="lavfi")
+            .output(path, vcodec="libx264").run(quiet=True))
+        return path
+
+    def sprite_size(self, rendered):
+        stream = ffmpeg.probe(rendered["sprite"])["streams"][0]
+        return stream["width"], stream["height"]
+
+    # a tile every second for short clips, long clips get a larger interval instead of more tiles
+    def test_thumbnail_index(self):
+        info = {"duration": timedelta(seconds=3), "width": 64, "height": 48}
+        rendered = render_thumbnails(self.make_clip(3), info, self.tmp_dir)
+        self.assertEqual(rendered["thumbnail_index"],
+                         {"interval": 1, "count": 3, "columns": 3, "rows": 1, "width": 160, "height": 120})
+        self.assertEqual(self.sprite_size(rendered), (480, 120))
+        self.assertTrue(os.path.getsize(rendered["poster"]))
+
+        info["duration"] = timedelta(seconds=250)
+        rendered = render_thumbnails(self.make_clip(250), info, self.tmp_dir)
+        self.assertEqual(rendered["thumbnail_index"],
+                         {"interval": 3, "count": 84, "columns": 10, "rows": 9, "width": 160, "height": 120})
+        self.assertEqual(self.sprite_size(rendered), (1600, 1080))
+
+    # footage deleted while its preview rendered leaves no files behind
+    def test_deleted_while_rendering(self):
+        footage = self.make_footage("gone.MOV", hash="gone")
+        rendered = {"info": {"has_video": True, "has_audio": False}, "preview_type": "mp4"}
+        for name in ("preview", "poster", "sprite"):
+            rendered[name] = os.path.join(self.tmp_dir, f"rendered-{name}")
+            with open(rendered[name], "wb") as file:
+                file.write(b"rendered")
+        Footage.objects.filter(pk=footage.pk).delete()
+
+        save_rendered_preview(footage, rendered)
+        left = [names for _, _, names in os.walk(os.path.join(self.tmp_dir, "previews")) if names]
+        self.assertEqual(left, [])
+
+class PeaksTests(FootageTestCase):
+    # 15 seconds of silence, then 15 seconds of a square wave at half scale
+    def test_peaks_sidecar_format(self):
+        path = os.path.join(self.tmp_dir, "sound.wav")
+        square = struct.pack("<2h", 16384, -16384) * (8000 * 15 // 2)
+        with wave.open(path, "wb") as file:
+            file.setnchannels(1)
+            file.setsampwidth(2)
+            file.setframerate(8000)
+            file.writeframes(bytes(8000 * 15 * 2) + square)
+
+        with open(render_peaks(path, self.tmp_dir)["peaks"], "rb") as file:
+            data = file.read()
+        self.assertEqual(struct.unpack_from("<4sHHI", data), (b"RLPK", 1, 2, 8000))
+
+        # 100 peaks a second, then 4 times fewer (another level would have less than 512)
+        offset = 12
+        levels = []
+        for _ in range(2):
+            samples_per_peak, count = struct.unpack_from("<II", data, offset)
+            pairs = struct.unpack_from(f"<{count * 2}b", data, offset + 8)
+            levels.append((samples_per_peak, count, pairs[:2], pairs[-2:]))
+            offset += 8 + count * 2
+        self.assertEqual(offset, len(data))
+        self.assertEqual(levels, [(80, 3000, (0, 0), (-64, 64)), (320, 750, (0, 0), (-64, 64))])
+
+# runs submitted work right away, so commands can be tested inside the test transaction
+class InlinePool:
+    def __init__(self, max_workers=None, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def submit(self, function, *args):
+        future = Future()
+        try:
+            future.set_result(function(*args))
+        except Exception as error:
+            future.set_exception(error)
+        return future
+
+class IngestWatchTests(FootageTestCase):
+    # only media that stopped changing is registered, sidecars and files being copied are not
+    def test_registers_settled_media(self):
+        folder = os.path.join(self.tmp_dir, "card")
+        os.makedirs(os.path.join(folder, "CLIP"))
+        self.write_wav(os.path.join(folder, "CLIP", "ZOOM0001.WAV"))
+        for name in ("C0001M01.XML", "C0001.THM", ".DS_Store", "ZOOM0002.WAV.part"):
+            with open(os.path.join(folder, "CLIP", name), "wb") as file:
+                file.write(b"sidecar")
+
+        output = StringIO()
+        with mock.patch("reel_logger_app.management.commands.ingest_watch.ThreadPoolExecutor", InlinePool), \
+             mock.patch("reel_logger_app.management.commands.ingest_watch._register_in_thread", register_footage):
+            call_command("ingest_watch", path=folder, once=True, settle=0, poll=0.01, stdout=output)
+        self.assertEqual([os.path.basename(footage.path) for footage in Footage.objects.all()], ["ZOOM0001.WAV"])
+        self.assertTrue(Footage.objects.get().has_audio)
+
+    # files that are footage already (like uploads, which land in the watched folder) are not read again
+    def test_known_paths_are_not_hashed(self):
+        footage = self.make_footage("upload.MOV")
+        Footage.objects.filter(pk=footage.pk).update(hash="")
+        with mock.patch("reel_logger_app.ingestHandler.hash_file", side_effect=AssertionError("file was read")):
+            self.assertEqual(register_footage(footage.path), (footage, True))
+
+    # a file has to keep its size and mtime for the whole settle time
+    def test_settling(self):
+        path = os.path.join(self.tmp_dir, "growing.MOV")
+        with open(path, "wb") as file:
+            file.write(b"start")
+        command = IngestWatch()
+        pending = {path: None}
+        self.assertFalse(command.settled(pending, path, 100.0, 10))
+        self.assertFalse(command.settled(pending, path, 105.0, 10))
+        self.assertTrue(command.settled(pending, path, 110.0, 10))
+
+        with open(path, "ab") as file:
+            file.write(b"more")
+        self.assertFalse(command.settled(pending, path, 111.0, 10))
+        self.assertEqual(pending[path][2], 111.0)
+        self.assertTrue(command.settled(pending, path, 121.0, 10))
+
+        os.remove(path)
+        self.assertFalse(command.settled(pending, path, 130.0, 10))
+        self.assertNotIn(path, pending)
+
+class ImportFootageTests(FootageTestCase):
+    def run_import(self, folder, **options):
+        output = StringIO()
+        with mock.patch("reel_logger_app.management.commands.import_footage.ProcessPoolExecutor", InlinePool):
+            call_command("import_footage", folder, stdout=output, stderr=StringIO(), **options)
+        return output.getvalue()
+
+    # known content and sidecars are skipped, a second run only picks up what is new
+    def test_skip_and_resume(self):
+        folder = os.path.join(self.tmp_dir, "archive")
+        os.makedirs(os.path.join(folder, "day1"))
+        self.write_wav(os.path.join(folder, "day1", "A.WAV"), seconds=1)
+        self.write_wav(os.path.join(folder, "day1", "B.WAV"), seconds=2)
+        shutil.copy(os.path.join(folder, "day1", "A.WAV"), os.path.join(folder, "day1", "A copy.WAV"))
+        with open(os.path.join(folder, "day1", "A.XML"), "wb") as file:
+            file.write(b"sidecar")
+
+        output = self.run_import(folder, batch=1)
+        self.assertIn("imported 2 files (1 duplicates skipped, 0 failed)", output)
+        imported = {os.path.basename(footage.path): footage for footage in Footage.objects.all()}
+        # (which copy comes first depends on which finished first)
+        duplicate = ({"A.WAV", "A copy.WAV"} - set(imported)).pop()
+        self.assertEqual(set(imported) - {"A.WAV", "A copy.WAV"}, {"B.WAV"})
+        self.assertTrue(all(footage.preview_status == "queued" and footage.hash for footage in imported.values()))
+        self.assertEqual(PreviewJob.objects.filter(priority=PreviewJob.PRIORITY_BULK).count(), 2)
+
+        # like an interrupted run: paths that are already footage are not hashed again
+        self.write_wav(os.path.join(folder, "day1", "C.WAV"), seconds=3)
+        with mock.patch("reel_logger_app.management.commands.import_footage.inspect_in_pool",
+                        side_effect=inspect_in_pool) as inspect:
+            output = self.run_import(folder, no_previews=True)
+        self.assertEqual(sorted(os.path.basename(call.args[0]) for call in inspect.call_args_list), sorted([duplicate, "C.WAV"]))
+        self.assertIn("imported 1 files (1 duplicates skipped", output)
+        self.assertEqual(Footage.objects.get(path__endswith="C.WAV").preview_status, "none")
+        # (only the duplicate is looked at again)
+        self.assertIn("importing 1 files", self.run_import(folder))
+        self.assertEqual(Footage.objects.count(), 3)
+
+class ChangeDetectionTests(FootageTestCase):
+    # a changed file is noticed from its fingerprint, the full hash is left to the preview worker
+    def test_changes_are_found_without_reading_the_whole_file(self):
+        data = bytearray(os.urandom(5 * 1024 * 1024))
+        path = os.path.join(self.tmp_dir, "A001.MOV")
+        with open(path, "wb") as file:
+            file.write(data)
+        footage = Footage.objects.create(path=path, hash=hashlib.md5(data).hexdigest())
+        PreviewJob.objects.all().delete()
+        footage.format_dirty = False
+
+        with mock.patch("reel_logger_app.models.hash_file", side_effect=AssertionError("file was read completely")):
+            # same content, new mtime
+            os.utime(path, ns=(0, 0))
+            footage.save()
+            self.assertFalse(PreviewJob.objects.exists())
+
+            # the end of the file was rewritten (same size)
+            data[-10:] = b"x" * 10
+            with open(path, "r+b") as file:
+                file.seek(-10, os.SEEK_END)
+                file.write(data[-10:])
+            footage.save()
+
+        footage.refresh_from_db()
+        self.assertEqual(footage.hash, "")
+        self.assertTrue(footage.format_dirty)
+        self.assertEqual(PreviewJob.objects.get(tier="full").footage, footage)
+        self.assertEqual(footage.ensure_hash(), hashlib.md5(data).hexdigest())
+
+    # the ffprobe result is reused until the file changes
+    def test_probe_is_cached(self):
+        probe = {'format': {'duration': '1.5', 'bit_rate': '1000', 'tags': {'timecode': '01:00:00:00'}},
+                 'streams': [{'codec_type': 'video', 'codec_name': 'h264', 'width': 1920, 'height': 1080,
+                              'r_frame_rate': '30000/1001'},
+                             {'codec_type': 'audio', 'codec_name': 'aac', 'sample_rate': '48000', 'channels': 2}]}
+        footage = self.make_footage("A002.MOV")
+        apply_media_info(footage, get_media_info(footage.path, probe), probe)
+        footage.save()
+        self.assertEqual((footage.video_codec, footage.height, footage.timecode), ("h264", 1080, "01:00:00:00"))
+        self.assertAlmostEqual(footage.framerate, 29.97, places=2)
+        self.assertEqual(Footage.objects.get(pk=footage.pk).cached_probe(), probe)
+
+        # an unknown frame rate is not an error
+        probe['streams'][0]['r_frame_rate'] = '0/0'
+        self.assertIsNone(get_media_info(footage.path, probe)['framerate'])
+
+        # a rename (like formatting) keeps it, a new file does not
+        moved = footage.path + ".moved"
+        footage.move(moved)
+        self.assertEqual(footage.cached_probe(), probe)
+        with open(moved, "ab") as file:
+            file.write(b"more")
+        self.assertIsNone(footage.cached_probe())
+
+class PreviewTierTests(FootageTestCase):
+    # a quick proxy is played until the preview is done, then the preview replaces it
+    def test_proxy_then_preview(self):
+
+        path = os.path.join(self.tmp_dir, "sound.wav")
+        with wave.open(path, "wb") as file:
+            file.setnchannels(1)
+            file.setsampwidth(2)
+            file.setframerate(48000)
+            file.writeframes(bytes(48000 * 2))
+        footage = Footage.objects.create(path=path)
+
+        job = claim_next_job()
+        self.assertEqual(job.tier, "proxy")
+        self.assertTrue(run_job(job))
+        footage.refresh_from_db()
+        self.assertTrue(footage.proxy.name.endswith(".mp3"))
+        self.assertEqual(footage.preview_status, "queued")
+        response = self.client.get(reverse("Footage_Preview", args=[footage.pk]))
+        self.assertEqual((response.status_code, response["Content-Type"]), (200, "audio/mpeg"))
+        self.assertIn("proxy", response["ETag"])
+
+        job = claim_next_job()
+        self.assertEqual(job.tier, "full")
+        self.assertTrue(run_job(job))
+        proxy_path = footage.proxy.path
+        footage.refresh_from_db()
+        self.assertFalse(footage.proxy)
+        self.assertFalse(os.path.exists(proxy_path))
+        self.assertEqual(footage.preview_status, "done")
+        response = self.client.get(reverse("Footage_Preview", args=[footage.pk]))
+        self.assertNotIn("proxy", response["ETag"])
+
+    # previews are streamed by an async view, a range is read without loading the file
+    async def test_async_range_streaming(self):
+        data = os.urandom(3 * 1024 * 1024)
+        os.makedirs(os.path.join(self.tmp_dir, "previews"))
+        with open(os.path.join(self.tmp_dir, "previews", "clip.mp4"), "wb") as file:
+            file.write(data)
+        footage = await sync_to_async(self.make_footage)("clip.MOV")
+        await Footage.objects.filter(pk=footage.pk).aupdate(preview="previews/clip.mp4")
+
+        response = await self.async_client.get(reverse("Footage_Preview", args=[footage.pk]),
+                                               headers={"Range": "bytes=1048570-2097160"})
+        self.assertEqual(response.status_code, 206)
+        body = b"".join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(body, data[1048570:2097161])
+
+        response = await self.async_client.get(reverse("Footage_Preview", args=[footage.pk]))
+        self.assertEqual(response["Content-Length"], str(len(data)))
+        self.assertEqual(b"".join([chunk async for chunk in response.streaming_content]), data)
+
+    # under WSGI (runserver) the body is a normal iterator, an async one would be read into memory first
+    def test_sync_range_streaming(self):
+        data = os.urandom(3 * 1024 * 1024)
+        os.makedirs(os.path.join(self.tmp_dir, "previews"))
+        with open(os.path.join(self.tmp_dir, "previews", "clip.mp4"), "wb") as file:
+            file.write(data)
+        footage = self.make_footage("clip.MOV")
+        Footage.objects.filter(pk=footage.pk).update(preview="previews/clip.mp4")
+
+        response = self.client.get(reverse("Footage_Preview", args=[footage.pk]), headers={"Range": "bytes=0-"})
+        self.assertEqual((response.status_code, response["Content-Length"]), (206, str(len(data))))
+        self.assertFalse(response.is_async)
+        self.assertEqual(b"".join(response.streaming_content), data)
+
+    # footage that browsers play as it is (within the profile) is copied into the preview, not encoded
+    def test_remux_detection(self):
+        phone = {'has_video': True, 'has_audio': True, 'video_codec': 'h264', 'video_profile': 'High',
+                 'pix_fmt': 'yuv420p', 'width': 640, 'height': 360, 'framerate': 24.0,
+                 'audio_codec': 'aac', 'sample_rate': 44100, 'audio_channels': 2}
+        self.assertTrue(is_remux(phone))
+        self.assertFalse(is_remux({**phone, 'width': 1920, 'height': 1080}))
+        self.assertFalse(is_remux({**phone, 'framerate': 59.94}))
+        self.assertFalse(is_remux({**phone, 'framerate': None}))
+        self.assertFalse(is_remux({**phone, 'pix_fmt': 'yuv422p10le'}))
+        self.assertFalse(is_remux({**phone, 'audio_codec': 'pcm_s24le'}))
+        self.assertTrue(is_remux({'has_audio': True, 'audio_codec': 'mp3', 'sample_rate': 44100, 'audio_channels': 2}))
+        self.assertFalse(is_remux({'has_audio': True, 'audio_codec': 'pcm_s16le', 'sample_rate': 48000, 'audio_channels': 1}))
+
+class FootageEditorTests(FootageTestCase):
+    # footage, takes with start times, comments and the scene choices of the add take form
+    def test_query_count_does_not_grow_with_rows(self):
+        footage = self.make_footage("edit.MTS")
+        for i in range(40):
+            self.link(footage, self.make_take(1, "A", i + 1))
+        for i in range(200):
+            footage.comment_set.create(time=timedelta(seconds=i), comment=f"comment {i}")
+
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("Footage_Editor", args=[footage.pk]))
+        self.assertEqual(len(response.context["takes"]), 40)
+        self.assertFalse(any(row["form"] for row in response.context["comments"]))
+
+        comment = footage.comment_set.first()
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("Footage_Editor", args=[footage.pk]),
+                                       {"edit_take": "1/A/7", "edit_comment": comment.pk})
+        forms = [row for row in response.context["takes"] if row["form"]]
+        self.assertEqual([row["take"].take_no for row in forms], [7])
+        self.assertEqual([row["comment"] for row in response.context["comments"] if row["form"]], [comment])
+
+class DirectoryFormatterTests(FootageTestCase):
+    def settings_form(self, **changes):
+        data = {"include_uid": True, "include_original_filename": False, "base_takes_on": "1",
+                "include_take_in_filename": True, "for_multiple_takes_use": "2", "sort_folders_by": "3",
+                "include_rating": "2", "use_rating": "2", "only_logged_footage": True,
+                "only_create_used_directories": True, "only_changed_footage": True, **changes}
+        form = FormatSettings(data)
+        self.assertTrue(form.is_valid(), form.errors)
+        return form
+
+    def setUp(self):
+        super().setUp()
+        for module in (directoryFormatter, formatJournal):
+            patcher = mock.patch.object(module, "MEDIA_ROOT", self.tmp_dir)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    # "middle" picks the same take it always did (round half to even, so 3 takes give the third)
+    def test_middle_take(self):
+        form = self.settings_form(for_multiple_takes_use="3")
+        scene = Scene(script_number=1)
+        for count, expected in ((1, 1), (2, 2), (3, 3), (4, 3), (5, 3), (7, 5)):
+            takes = [Take(shot_scene=scene, shot_name="A", take_no=number) for number in range(1, count + 1)]
+            self.assertEqual(directoryFormatter.choose_take(form, 0, takes), (1, "A", expected))
+
+    def test_plan_then_apply(self):
+        footage = self.make_footage("a.MTS", logged=True)
+        self.link(footage, self.make_take(2, "B", 1, rating=4))
+        self.link(footage, self.make_take(2, "B", 3, rating=7))
+        self.make_footage("unlogged.MTS")
+
+        # footage, takes (ratings are part of the footage query)
+        with self.assertNumQueries(2):
+            plan = directoryFormatter.formatFootageDirectory(self.settings_form(), Footage.objects.all(), dry_run=True)
+        target = os.path.join(self.tmp_dir, "footage", "scene2", "shot2B", f"{footage.id}-2B-3-7.MTS")
+        self.assertEqual([(move["footage"], move["target"], move["status"]) for move in plan["moves"]],
+                         [(footage, target, "move")])
+        self.assertFalse(os.path.exists(target))
+
+        plan = directoryFormatter.formatFootageDirectory(self.settings_form(), Footage.objects.all())
+        self.assertEqual(plan["failed"], [])
+        self.assertTrue(os.path.exists(target))
+        footage.refresh_from_db()
+        self.assertEqual(footage.path, target)
+
+    # only footage whose takes changed is looked at again
+    def test_incremental_runs(self):
+        footage = self.make_footage("a.MTS", logged=True)
+        take = self.make_take(2, "B", 1, rating=4)
+        self.link(footage, take)
+        self.make_footage("b.MTS", logged=True)
+
+        plan = directoryFormatter.formatFootageDirectory(self.settings_form(), Footage.objects.all())
+        self.assertEqual([move["status"] for move in plan["moves"]], ["move", "move"])
+        plan = directoryFormatter.formatFootageDirectory(self.settings_form(), Footage.objects.all())
+        self.assertEqual(plan["moves"], [])
+
+        take.rating = 9
+        take.save()
+        plan = directoryFormatter.formatFootageDirectory(self.settings_form(), Footage.objects.all())
+        self.assertEqual([(move["footage"], move["status"]) for move in plan["moves"]], [(footage, "move")])
+        self.assertTrue(plan["moves"][0]["target"].endswith(f"{footage.id}-2B-1-9.MTS"))
+
+        # other settings, everything again
+        plan = directoryFormatter.formatFootageDirectory(self.settings_form(include_rating="1"), Footage.objects.all(),
+                                                         dry_run=True)
+        self.assertEqual(len(plan["moves"]), 2)
+
+    # planning never reads whole files, footage that changed waits for the preview worker to hash it
+    def test_plan_does_not_hash(self):
+        hashed = self.make_footage("hashed.MTS", logged=True, hash="abc")
+        changed = self.make_footage("changed.MTS", logged=True)
+        Footage.objects.filter(pk=changed.pk).update(hash="")
+        form = self.settings_form(include_hash=True, include_take_in_filename=False, include_rating="1")
+
+        with mock.patch("reel_logger_app.models.hash_file", side_effect=AssertionError("file was read")):
+            plan = directoryFormatter.formatFootageDirectory(form, Footage.objects.all())
+        self.assertEqual([(move["footage"], move["status"]) for move in plan["moves"]],
+                         [(hashed, "move"), (changed, "pending")])
+        self.assertTrue(plan["moves"][0]["target"].endswith(f"{hashed.id}-abc.MTS"))
+        changed.refresh_from_db()
+        self.assertEqual((changed.path, changed.hash), (os.path.join(self.tmp_dir, "changed.MTS"), ""))
+
+        # once it is hashed the next run picks it up
+        changed.ensure_hash()
+        plan = directoryFormatter.formatFootageDirectory(form, Footage.objects.all())
+        self.assertEqual([(move["footage"], move["status"]) for move in plan["moves"]], [(changed, "move")])
+
+    # a run that died after the first of two renames
+    def test_resume_and_rollback(self):
+        first = self.make_footage("first.MTS", logged=True)
+        second = self.make_footage("second.MTS", logged=True)
+        plan = directoryFormatter.plan_format(self.settings_form(), Footage.objects.all())
+        journal = formatJournal.FormatJournal.start()
+        journal.intend(plan["fingerprint"], plan["directories"], plan["moves"])
+        for directory in plan["directories"]:
+            os.makedirs(directory)
+        os.rename(first.path, plan["moves"][0]["target"])
+        journal.file.close()
+
+        call_command("format_resume", stdout=StringIO())
+        for footage, move in zip((first, second), plan["moves"]):
+            footage.refresh_from_db()
+            self.assertEqual(footage.path, move["target"])
+            self.assertTrue(os.path.exists(move["target"]))
+        self.assertEqual(formatJournal.unfinished_journals(), [])
+
+        call_command("format_resume", journal.path, "--rollback", stdout=StringIO())
+        for footage, move in zip((first, second), plan["moves"]):
+            footage.refresh_from_db()
+            self.assertEqual(footage.path, move["source"])
+            self.assertTrue(os.path.exists(move["source"]))
+        self.assertFalse(os.path.exists(plan["directories"][0]))
+
+class ChunkedUploadTests(FootageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("uploader")
+        self.client.force_login(self.user)
+
+    def put(self, upload, offset, data):
+        return self.client.put(f"{reverse('Upload_Chunk', args=[upload])}?offset={offset}", data,
+                               content_type="application/octet-stream")
+
+    def test_upload_resume_and_finish(self):
+        data = os.urandom(3000)
+        response = self.client.post(reverse("Start_Upload"), {"filename": "A001.MOV", "size": len(data)})
+        self.assertEqual(response.status_code, 201)
+        upload = response.json()["id"]
+
+        self.assertEqual(self.put(upload, 0, data[:1000]).json()["offset"], 1000)
+        # a retry of a chunk that already arrived is refused with the offset to continue from
+        response = self.put(upload, 0, data[:1000])
+        self.assertEqual((response.status_code, response.json()["offset"]), (409, 1000))
+        self.assertEqual(self.client.get(reverse("Upload_Chunk", args=[upload])).json()["offset"], 1000)
+
+        # not complete yet
+        self.assertEqual(self.client.post(reverse("Finish_Upload", args=[upload])).status_code, 409)
+        self.assertEqual(self.put(upload, 1000, data[1000:]).json()["offset"], 3000)
+
+        # finishing is a rename, the file is hashed later by the preview worker
+        with mock.patch("reel_logger_app.uploadHandler.hash_file", side_effect=AssertionError("file was read")), \
+             mock.patch("reel_logger_app.models.hash_file", side_effect=AssertionError("file was read")):
+            response = self.client.post(reverse("Finish_Upload", args=[upload]))
+        self.assertEqual(response.status_code, 200)
+        footage = Footage.objects.get(pk=response.json()["footage"])
+        self.assertEqual(footage.hash, "")
+        self.assertEqual(footage.ensure_hash(), hashlib.md5(data).hexdigest())
+        self.assertEqual(footage.path, os.path.join(os.path.realpath(self.tmp_dir), "footage", "unlogged", "A001.MOV"))
+        self.assertEqual(footage.original_filename, "A001")
+        with open(footage.path, "rb") as file:
+            self.assertEqual(file.read(), data)
+        self.assertFalse(os.path.exists(footage.path + ".part"))
+
+        # uploads belong to whoever started them
+        self.client.force_login(User.objects.create_user("someone else"))
+        self.assertEqual(self.client.get(reverse("Upload_Chunk", args=[upload])).status_code, 404)
+
+    # two uploads of the same card name at once each get their own file
+    def test_same_name_at_once(self):
+        first, second = [self.client.post(reverse("Start_Upload"), {"filename": "C0001.MP4", "size": 10}).json()["id"]
+                         for _ in range(2)]
+        paths = [UploadSession.objects.get(pk=upload).path for upload in (first, second)]
+        self.assertEqual(os.path.basename(paths[0]), "C0001.MP4")
+        self.assertNotEqual(paths[0], paths[1])
+        self.assertTrue(all(os.path.exists(path + ".part") for path in paths))
+
+        self.put(second, 0, b"b" * 10)
+        self.put(first, 0, b"a" * 10)
+        for upload, path, data in ((first, paths[0], b"a" * 10), (second, paths[1], b"b" * 10)):
+            self.assertEqual(self.client.post(reverse("Finish_Upload", args=[upload])).status_code, 200)
+            with open(path, "rb") as file:
+                self.assertEqual(file.read(), data)
+
+    # uploads that were given up on (or lost their data) are refused instead of failing
+    def test_expired_and_missing_uploads(self):
+        stale = self.client.post(reverse("Start_Upload"), {"filename": "E001.MOV", "size": 10}).json()["id"]
+        self.put(stale, 0, b"x" * 4)
+        fresh = self.client.post(reverse("Start_Upload"), {"filename": "E002.MOV", "size": 10}).json()["id"]
+        UploadSession.objects.filter(pk=stale).update(updated=timezone.now() - timedelta(days=3))
+
+        output = StringIO()
+        call_command("expire_uploads", stdout=output)
+        self.assertEqual(output.getvalue().strip(), "expired 1 uploads")
+        session = UploadSession.objects.get(pk=stale)
+        self.assertEqual(session.status, "failed")
+        self.assertFalse(os.path.exists(session.part_path))
+        self.assertEqual(self.put(stale, 4, b"x" * 6).status_code, 409)
+        self.assertEqual(self.client.post(reverse("Finish_Upload", args=[stale])).status_code, 409)
+
+        self.put(fresh, 0, b"y" * 10)
+        os.remove(UploadSession.objects.get(pk=fresh).part_path)
+        self.assertEqual(self.client.post(reverse("Finish_Upload", args=[fresh])).status_code, 404)
+        self.assertEqual(UploadSession.objects.get(pk=fresh).status, "failed")
+        self.assertFalse(Footage.objects.exists())
+
+    # multipart uploads are hashed while they arrive, saving the footage does not read the file again
+    def test_upload_is_hashed_once(self):
+        data = os.urandom(5000)
+        upload = SimpleUploadedFile("B002.MOV", data)
+        with mock.patch("reel_logger_app.models.hash_file", side_effect=AssertionError("file was read again")):
+            response = self.client.post(reverse("File_Uploads"), {"posts": [upload]})
+
+        footage = Footage.objects.get()
+        self.assertRedirects(response, reverse("Footage_Editor", args=[footage.pk]))
+        self.assertEqual(footage.hash, hashlib.md5(data).hexdigest())
+        self.assertEqual(footage.preview_status, "queued")
+        self.assertEqual(os.listdir(os.path.join(self.tmp_dir, ".uploads")), [])
+
+        # the CSRF check still happens (after the upload handler is set)
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        response = client.post(reverse("File_Uploads"), {"posts": [SimpleUploadedFile("C003.MOV", data)]})
+        self.assertEqual(response.status_code, 403)
+
+    # content that is already footage is not stored (or previewed) a second time
+    def test_duplicates_are_not_stored_again(self):
+        data = os.urandom(4000)
+        self.client.post(reverse("File_Uploads"), {"posts": [SimpleUploadedFile("D004.MOV", data)]})
+        original = Footage.objects.get()
+
+        response = self.client.post(reverse("File_Uploads"), {"posts": [SimpleUploadedFile("D004 copy.MOV", data)]})
+        self.assertRedirects(response, reverse("Footage_Editor", args=[original.pk]))
+        self.assertEqual(Footage.objects.count(), 1)
+        self.assertEqual(PreviewJob.objects.filter(tier="full").count(), 1)
+        self.assertEqual(os.listdir(os.path.join(self.tmp_dir, "footage", "unlogged")), ["D004.MOV"])
+        self.assertEqual(os.listdir(os.path.join(self.tmp_dir, ".uploads")), [])
+
+        upload = self.client.post(reverse("Start_Upload"), {"filename": "D004.MOV", "size": len(data)}).json()["id"]
+        self.put(upload, 0, data)
+        response = self.client.post(reverse("Finish_Upload", args=[upload])).json()
+        self.assertEqual((response["footage"], response["duplicate"]), (original.pk, True))
+        self.assertEqual(Footage.objects.count(), 1)
+        self.assertEqual(os.listdir(os.path.join(self.tmp_dir, "footage", "unlogged")), ["D004.MOV"])
+
+        # copies from before are listed by dedup_report
+        copy = os.path.join(self.tmp_dir, "D004 copy.MOV")
+        shutil.copy(original.path, copy)
+        Footage.objects.create(path=copy)
+        output = StringIO()
+        call_command("dedup_report", hash_missing=True, stdout=output)
+        self.assertIn(f"{original.hash}: 2 copies", output.getvalue())
+        self.assertIn("1 duplicated files, 1 extra copies", output.getvalue())
+
+class SearchTests(FootageTestCase):
+    def search(self, **criteria):
+        form = FootageSearch(criteria)
+        self.assertTrue(form.is_valid())
+        return set(form.filter_footage(Footage.objects.all()))
+
+    # scene, shot and take match the true or the marked take, each on its own
+    def test_true_and_marked_takes(self):
+        true = self.make_footage("true.MTS")
+        self.link(true, self.make_take(5, "A", 1))
+        marked = self.make_footage("marked.MTS", logged=True)
+        self.link(marked, self.make_take(6, "B", 2, marked_scene=5, marked_shot="A"))
+        both = self.make_footage("both.MTS")
+        self.link(both, self.make_take(5, "C", 3))
+        self.link(both, self.make_take(6, "A", 4))
+        self.link(both, self.make_take(6, "A", 5))
+
+        self.assertEqual(self.search(scene=5), {true, marked, both})
+        self.assertEqual(self.search(scene=5, shot="A"), {true, marked, both})
+        self.assertEqual(self.search(scene=5, shot="A", take=1), {true})
+        self.assertEqual(self.search(scene=5, logged_filter="2"), {marked})
+        self.assertEqual(len(self.search(shot="A")), 3)
+
+    # codec and resolution come from the stored probe, nothing is probed to search
+    def test_codec_and_height(self):
+        hd = self.make_footage("hd.MOV", video_codec="h264", audio_codec="aac", height=1080)
+        prores = self.make_footage("prores.MOV", video_codec="prores", audio_codec="pcm_s24le", height=2160)
+        sound = self.make_footage("sound.WAV", audio_codec="pcm_s24le")
+
+        self.assertEqual(self.search(codec="H264"), {hd})
+        self.assertEqual(self.search(codec="pcm_s24le"), {prores, sound})
+        self.assertEqual(self.search(min_height=1080), {hd, prores})
+        self.assertEqual(self.search(codec="pcm_s24le", min_height=1080), {prores})
+
+class ApiTests(FootageTestCase):
+    # walking the cursors returns every row exactly once, in key order
+    def test_keyset_pagination_over_composite_keys(self):
+        for scene in (1, 2):
+            for shot in ("A", "B"):
+                for take_no in (1, 2, 3):
+                    self.make_take(scene, shot, take_no)
+
+        seen = []
+        cursor = ""
+        while True:
+            response = self.client.get(reverse("API_List", args=["takes"]),
+                                       {"limit": 5, "cursor": cursor, "fields": "shot_scene_id,shot_name,take_no"})
+            self.assertEqual(response.status_code, 200)
+            page = json.loads(response.content)
+            seen += [(row["shot_scene_id"], row["shot_name"], row["take_no"]) for row in page["results"]]
+            if not page["next"]:
+                break
+            cursor = page["next"]
+
+        self.assertEqual(seen, sorted(seen))
+        self.assertEqual(len(seen), 12)
+
+    def test_footage_filters_and_updated_since(self):
+        footage = self.make_footage("a.MTS")
+        self.make_footage("b.MTS")
+        self.link(footage, self.make_take(4, "A", 1, rating=3))
+
+        page = json.loads(self.client.get(reverse("API_List", args=["footage"]), {"scene": 4}).content)
+        self.assertEqual([row["id"] for row in page["results"]], [footage.id])
+        self.assertEqual(page["results"][0]["average_rating"], 3)
+
+        page = json.loads(self.client.get(reverse("API_List", args=["footage"]), {"updated_since": "2999-01-01"}).content)
+        self.assertEqual(page["results"], [])
+
+        response = self.client.get(reverse("API_List", args=["footage"]), {"fields": "secret"})
+        self.assertEqual(response.status_code, 400)
+
+    # cursors and dates that decode but do not fit are a 400, not a database error
+    def test_invalid_cursor_and_dates(self):
+        self.make_take(1, "A", 1)
+        for resource, values in (("footage", ["abc"]), ("takes", [1, "A", "x"]), ("takes", [[1], "A", 1]),
+                                 ("footage", [1, 2]), ("scenes", {"a": 1})):
+            cursor = encode_cursor(values)
+            response = self.client.get(reverse("API_List", args=[resource]), {"cursor": cursor})
+            self.assertEqual(response.status_code, 400, values)
+        response = self.client.get(reverse("API_List", args=["takes"]), {"cursor": encode_cursor([1, "A", 0])})
+        self.assertEqual(len(json.loads(response.content)["results"]), 1)
+
+        for value in ("2024-13-45", "2024-02-30T10:00", "yesterday"):
+            response = self.client.get(reverse("API_List", args=["footage"]), {"updated_since": value})
+            self.assertEqual(response.status_code, 400, value)
@@ -0,0 +1,229 @@
+'''
+This file handles uploads of footage.
+
+Normal (multipart) uploads go through HashingFileUploadHandler:
+the file is written to MEDIA_ROOT/.uploads (the same file system as the footage, so placing it is a rename)
+and hashed while it arrives, so it is never read again after the upload.
+
+Big files can be uploaded in chunks instead (resumable).
+The browser sends a file in pieces, each one with the offset it starts at:
+    start   reserves a file name in footage/unlogged and returns the upload id
+    status  returns how much arrived so far, so a broken upload continues where it stopped
+    chunk   writes one piece at its offset (pieces have to come in order)
+    finish  renames the complete file into place and creates the footage (the preview worker hashes it later)
+            (or deletes it again if the same content is already footage)
+Uploads that stop getting data are given up on by `manage.py expire_uploads`.
+Data is written straight next to its final location (as <name>.part), so finishing never copies anything.
+'''
+import os
+import tempfile
+from datetime import timedelta
+from hashlib import md5
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.utils import timezone
+
+from reel_logger_app.hashHandler import hash_file, file_identity, sample_fingerprint
+from reel_logger_app.ingestHandler import find_duplicate, original_filename
+from reel_logger_app.models import Footage, UploadSession
+
+# how big the browser should make its pieces, and the most we accept at once
+CHUNK_SIZE = 16 * 1024 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+
+# how much of a request is written at once
+WRITE_SIZE = 1024 * 1024
+
+# where multipart uploads are written while they arrive (inside MEDIA_ROOT, so moving them is a rename)
+def get_spool_dir():
+    path = default_storage.path(".uploads")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+# an uploaded file in the spool dir, with the md5 of its content in 'hash'
+class HashedUploadedFile(UploadedFile):
+    def __init__(self, name, content_type, size, charset, content_type_extra=None):
+        file = tempfile.NamedTemporaryFile(suffix=".upload", dir=get_spool_dir())
+        super().__init__(file, name, content_type, size, charset, content_type_extra)
+        self.digest = md5()
+        self.hash = ""
+
+    # storages move files that have a path instead of copying them
+    def temporary_file_path(self):
+        return self.file.name
+
+    def close(self):
+        try:
+            return self.file.close()
+        except FileNotFoundError:
+            # the file was moved into place, there is nothing left to delete
+            pass
+
+# upload handler that spools to the media volume and hashes as the data comes in
+# use it by setting request.upload_handlers before the request body is read
+class HashingFileUploadHandler(FileUploadHandler):
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = HashedUploadedFile(self.file_name, self.content_type, 0, self.charset, self.content_type_extra)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.file.write(raw_data)
+        self.file.digest.update(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.hash = self.file.digest.hexdigest()
+        return self.file
+
+    def upload_interrupted(self):
+        if hasattr(self, "file"):
+            self.file.close()
+
+# thrown when a chunk does not fit, turned into an error response
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+# reserves a name in footage/unlogged and an empty .part file for the data
+def start_upload(user, filename, size):
+    filename = os.path.basename(filename or "")
+    if not filename:
+        raise UploadError("missing file name")
+    if size < 0:
+        raise UploadError("invalid size")
+
+    path = _reserve_path(default_storage.generate_filename(os.path.join("footage", "unlogged", filename)))
+    try:
+        return UploadSession.objects.create(user=user if user.is_authenticated else None,
+                                            filename=filename, path=path, size=size)
+    except BaseException:
+        os.remove(path + ".part")
+        raise
+
+# picks a free name and creates its empty .part file, returns the final path
+# get_available_name only knows about finished files, so a name is only ours once its .part is created:
+# 'x' fails if another upload of the same name (card names like C0001.MP4 repeat a lot) got there first
+def _reserve_path(name):
+    root, extension = os.path.splitext(name)
+    name = default_storage.get_available_name(name)
+    while True:
+        path = os.path.realpath(default_storage.path(name))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            open(path + ".part", "xb").close()
+            return path
+        except FileExistsError:
+            name = default_storage.get_available_name(default_storage.get_alternative_name(root, extension))
+
+# writes one chunk from a stream (the request), it has to start where the last one ended
+# returns the new offset
+def write_chunk(session, offset, stream, length):
+    if session.status != 'uploading':
+        raise UploadError("upload is already finished", status=409)
+    if offset != session.received:
+        raise UploadError(f"expected offset {session.received}", status=409)
+    if length > MAX_CHUNK_SIZE:
+        raise UploadError(f"chunks can be at most {MAX_CHUNK_SIZE} bytes", status=413)
+    if offset + length > session.size:
+        raise UploadError("chunk goes past the end of the file", status=416)
+
+    written = 0
+    try:
+        file = open(session.part_path, "r+b")
+    except FileNotFoundError:
+        raise UploadError("the uploaded data is gone, start again", status=404)
+    with file:
+        file.seek(offset)
+        while written < length:
+            data = stream.read(min(WRITE_SIZE, length - written))
+            if not data:
+                break
+            file.write(data)
+            written += len(data)
+        # only acknowledge what is really on the disk
+        file.flush()
+        os.fsync(file.fileno())
+
+    # only move the offset if no other request did in the meantime
+    # (and only while it is still going, expire_uploads may have given up on it)
+    if not UploadSession.objects.filter(pk=session.pk, status='uploading', received=offset).update(received=offset + written,
+                                                                             updated=timezone.now()):
+        session.refresh_from_db()
+        raise UploadError(f"expected offset {session.received}", status=409)
+    session.received = offset + written
+    return session.received
+
+# renames the complete file into place and creates the footage
+# returns (footage, whether it was a duplicate): if the same content is already footage
+# the uploaded file is deleted again and the existing footage is returned instead (nothing is transcoded)
+def finish_upload(session):
+    if session.status == 'done' and session.footage:
+        return session.footage, False
+    if session.status != 'uploading':
+        raise UploadError(f"upload is {session.get_status_display().lower()}, start again", status=409)
+    if session.received != session.size:
+        raise UploadError(f"only {session.received} of {session.size} bytes arrived", status=409)
+    if not os.path.exists(session.part_path):
+        UploadSession.objects.filter(pk=session.pk).update(status='failed', updated=timezone.now())
+        session.status = 'failed'
+        raise UploadError("the uploaded data is gone, start again", status=404)
+
+    # finishing is only a rename, the full hash is left to the preview worker (see Footage.ensure_hash)
+    # only a file whose fingerprint matches existing footage is read in full, to be sure before it is thrown away
+    fingerprint = sample_fingerprint(session.part_path)
+    file_hash = ""
+    if Footage.objects.filter(fingerprint=fingerprint).exists():
+        file_hash = hash_file(session.part_path)
+    duplicate = find_duplicate(file_hash)
+    if duplicate:
+        os.remove(session.part_path)
+        UploadSession.objects.filter(pk=session.pk).update(status='done', footage=duplicate, updated=timezone.now())
+        session.status, session.footage = 'done', duplicate
+        return duplicate, True
+
+    # the name may have been taken since the upload started
+    path = session.path
+    if os.path.exists(path):
+        path = default_storage.path(default_storage.get_available_name(os.path.relpath(path, default_storage.location)))
+    os.rename(session.part_path, path)
+
+    try:
+        footage = Footage(path=path, original_filename=original_filename(session.filename), hash=file_hash,
+                          fingerprint=fingerprint)
+        footage.file_size, footage.file_mtime, footage.file_inode = file_identity(path)
+        footage.save()
+    except Exception as error:
+        print(f"making footage for {path} failed: {error}")
+        os.remove(path)
+        UploadSession.objects.filter(pk=session.pk).update(status='failed', path=path, updated=timezone.now())
+        raise UploadError("making footage failed", status=500)
+
+    UploadSession.objects.filter(pk=session.pk).update(status='done', path=path, footage=footage, updated=timezone.now())
+    session.status, session.path, session.footage = 'done', path, footage
+    return footage, False
+
+# gives up on uploads that did not get any data for a while and deletes what they wrote
+# returns how many were given up on
+def expire_uploads(older_than=timedelta(days=2)):
+    cutoff = timezone.now() - older_than
+    expired = 0
+    for session in UploadSession.objects.filter(status='uploading', updated__lt=cutoff).iterator():
+        # only if no chunk arrived in the meantime
+        if UploadSession.objects.filter(pk=session.pk, status='uploading', received=session.received).update(
+                status='failed', updated=timezone.now()):
+            try:
+                os.remove(session.part_path)
+            except FileNotFoundError:
+                pass
+            expired += 1
+    return expired
+
+# the state of an upload as sent to the browser
+def describe(session):
+    return {'id': str(session.pk), 'filename': session.filename, 'size': session.size,
+            'offset': session.received, 'status': session.status, 'chunk_size': CHUNK_SIZE,
+            'footage': session.footage_id}
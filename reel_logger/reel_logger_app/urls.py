@@ -7,17 +7,25 @@ from django.conf import settings
 from django.urls import path
 from django.conf.urls.static import static
 
-from . import views
+from . import views, api
 
 urlpatterns = [
     path("", views.index, name="index"),
     path("settings/", views.settings, name="logger_settings"),
     path('upload/', views.fileupload, name = "File_Uploads"),
+    path('upload/chunked/', views.startUpload, name = "Start_Upload"),
+    path('upload/chunked/<uuid:upload_id>/', views.uploadChunk, name = "Upload_Chunk"),
+    path('upload/chunked/<uuid:upload_id>/finish/', views.finishUpload, name = "Finish_Upload"),
     path('format/', views.formatDirectory, name = "Format_Directory"),
 
     path('footage/', views.viewFootage, name = "View_Footage"),
     path("footage/<int:footage_id>/edit/", views.editFootage, name="Footage_Editor"),
     path("footage/<int:footage_id>/preview/", views.getPreview, name="Footage_Preview"),
+    path("footage/<int:footage_id>/preview/hls/<str:version>/index.m3u8", views.getPreviewSegment, name="Footage_Preview_Playlist"),
+    path("footage/<int:footage_id>/preview/hls/<str:version>/<str:segment>", views.getPreviewSegment, name="Footage_Preview_Segment"),
+    path("footage/<int:footage_id>/poster/", views.getPoster, name="Footage_Poster"),
+    path("footage/<int:footage_id>/sprite/", views.getSprite, name="Footage_Sprite"),
+    path("footage/<int:footage_id>/peaks/", views.getPeaks, name="Footage_Peaks"),
     path("footage/<int:pk>/delete/", views.FootageDeleteView.as_view(), name="Delete_Footage"),
 
     path("footage/<int:footage_id>/add take/", views.addTakeToFootage, name="Add_Take_To_Footage"),
@@ -38,4 +46,6 @@ urlpatterns = [
     path("comment/<int:pk>/delete/", views.CommentDeleteView.as_view(), name="Delete_Comment"),
     path("comment/<int:pk>/edit/", views.CommentUpdateView.as_view(), name="Edit_Comment"),
 
+    path("api/<str:resource>/", api.listResource, name="API_List"),
+
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT) + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
\ No newline at end of file
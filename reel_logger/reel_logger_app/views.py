@@ -4,8 +4,10 @@ All web responses for the app go through here.
 It references html templates included in `templates`.
 It also handles a lot of internal logic and checking.
 '''
-from django.shortcuts import render, redirect, get_object_or_404
-from django.http import FileResponse
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
+from django.http import Http404, JsonResponse
+from django.views.decorators.http import require_POST, require_http_methods
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from django.core.files.storage import default_storage
 from django.contrib import messages
 from django.views.generic.edit import DeleteView, UpdateView
@@ -13,14 +15,24 @@ from django.urls import reverse_lazy
 from django.urls import reverse as urlreverse
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.paginator import Paginator, Page
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import F
+from asgiref.sync import sync_to_async
 
 import datetime
 import os
+import re
 from pathlib import Path
 
-from reel_logger_app.models import Footage, Comment, Scene, Shot, Take, FootageTake
+from reel_logger_app.models import Footage, Comment, Scene, Shot, Take, FootageTake, UploadSession, with_ratings
 from reel_logger_app.forms import FootageForm, SceneForm, ShotForm, NewSceneForm, ShotInSceneForm, AddTakeToFootageForm, TakeInFootageForm, CommentForm, FootageSearch, FormatSettings
 from reel_logger_app.directoryFormatter import formatFootageDirectory
+from reel_logger_app.uploadHandler import start_upload, write_chunk, finish_upload, describe, UploadError, HashingFileUploadHandler
+from reel_logger_app.hashHandler import file_identity
+from reel_logger_app.ingestHandler import find_duplicate
+from reel_logger_app.mediaResponse import media_response, CACHE_FOREVER, CACHE_REVALIDATE
+from reel_logger_app.cacheHandler import cached, make_key, version
 
 # saves on repeated code
 def simple_save_if_valid(form, request):
@@ -33,6 +45,9 @@ def simple_save_if_valid(form, request):
         messages.error(request, 'Please correct the following errors:')
 
 # ------------ misc ------------------
+# the footage pages, file downloads and uploads are async views (see the uvicorn section of the README):
+# database work uses the async ORM and files are streamed without holding a thread
+# anything that is only sync (forms, templates, hashing) runs in a thread with sync_to_async
 
 # simply returns a webpage
 def index(request):
@@ -44,14 +59,33 @@ def settings(request):
     return render(request, "settings.html", context)
 
 # file upload page (handles multi-file upload)
+# files are hashed while they arrive and moved into place (see uploadHandler.HashingFileUploadHandler)
+# the handler has to be set before the CSRF check reads the body, so the check happens in _fileupload
+# under ASGI the body is received without a thread, parsing and placing the files runs in one (sync_to_async)
 @login_required
-def fileupload(request):    
+@csrf_exempt
+async def fileupload(request):
+    request.upload_handlers = [HashingFileUploadHandler(request)]
+    return await sync_to_async(_fileupload)(request)
+
+@csrf_protect
+def _fileupload(request):
     if request.method == 'POST':
         first = ""
+        uploaded = 0
         for file in request.FILES.getlist('posts'):
             print(file)
             original_filename = file.name.rsplit(".", 1)[0]
 
+            # the same content is already footage (like a card uploaded twice), link that instead
+            duplicate = find_duplicate(file.hash)
+            if duplicate:
+                file.close()
+                messages.info(request, f'{file.name} was already uploaded as {duplicate.original_filename}.')
+                if first == "":
+                    first = duplicate.id
+                continue
+
             # get full filename in new location
             try_filename = os.path.join("footage", "unlogged", file.name)
             new_filename = default_storage.generate_filename(try_filename)
@@ -62,7 +96,11 @@ def fileupload(request):
 
             try:
                 # create new footage object
-                newfoot = Footage.objects.create(path=full_filename, original_filename=original_filename)
+                # the hash is already known and the file did not change since, so saving does not read it again
+                newfoot = Footage(path=full_filename, original_filename=original_filename, hash=file.hash)
+                newfoot.file_size, newfoot.file_mtime, newfoot.file_inode = file_identity(full_filename)
+                newfoot.save()
+                uploaded += 1
 
                 if first == "":
                     first = newfoot.id
@@ -74,10 +112,58 @@ def fileupload(request):
 
         # redirects to the first footage successfully uploaded
         if first != "":
-            messages.success(request, 'The files have been uploaded successfully.')
+            if uploaded:
+                messages.success(request, 'The files have been uploaded successfully.')
             return redirect('Footage_Editor', first)
     return render(request, "upload.html")
 
+# the following handle chunked uploads for big files (see uploadHandler and upload.html)
+
+# finds an upload of the current user
+async def _get_upload(request, upload_id):
+    return await aget_object_or_404(UploadSession, pk=upload_id, user=await request.auser())
+
+# starts a chunked upload, takes 'filename' and 'size'
+@login_required
+@require_POST
+async def startUpload(request):
+    try:
+        size = int(request.POST.get('size', ''))
+        session = await sync_to_async(start_upload)(await request.auser(), request.POST.get('filename'), size)
+    except ValueError:
+        return JsonResponse({'error': "size must be a number"}, status=400)
+    except UploadError as error:
+        return JsonResponse({'error': str(error)}, status=error.status)
+    return JsonResponse(describe(session), status=201)
+
+# GET returns how far an upload got, PUT ?offset=<bytes> writes the next chunk (the request body)
+@login_required
+@require_http_methods(["GET", "PUT"])
+async def uploadChunk(request, upload_id):
+    session = await _get_upload(request, upload_id)
+    if request.method == 'PUT':
+        try:
+            offset = int(request.GET.get('offset', ''))
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+            await sync_to_async(write_chunk)(session, offset, request, length)
+        except ValueError:
+            return JsonResponse({'error': "offset must be a number"}, status=400)
+        except UploadError as error:
+            return JsonResponse({**describe(session), 'error': str(error)}, status=error.status)
+    return JsonResponse(describe(session))
+
+# turns a complete upload into footage
+@login_required
+@require_POST
+async def finishUpload(request, upload_id):
+    session = await _get_upload(request, upload_id)
+    try:
+        footage, duplicate = await sync_to_async(finish_upload)(session)
+    except UploadError as error:
+        return JsonResponse({**describe(session), 'error': str(error)}, status=error.status)
+    return JsonResponse({**describe(session), 'duplicate': duplicate,
+                         'url': urlreverse('Footage_Editor', args=[footage.pk])})
+
 # posting to this page formats the footage files
 @login_required
 def formatDirectory(request):
@@ -87,15 +173,48 @@ def formatDirectory(request):
         if form.is_valid():
             # grab all footage
             footage_list = Footage.objects.all()
-            # format all the footage files
-            formatFootageDirectory(form, footage_list)
+            # format all the footage files (or just show what would happen)
+            dry_run = form.cleaned_data['dry_run']
+            plan = formatFootageDirectory(form, footage_list, dry_run=dry_run)
+            if dry_run:
+                context = {'formatter': form, 'plan': plan}
+                return render(request, "settings.html", context)
+
+            moved = sum(1 for move in plan['moves'] if move['status'] == 'move') - len(plan['failed'])
+            conflicts = sum(1 for move in plan['moves'] if move['status'] == 'conflict')
+            pending = sum(1 for move in plan['moves'] if move['status'] == 'pending')
+            messages.info(request, f"moved {moved} files ({len(plan['failed'])} failed, {conflicts} skipped because the name was taken, "
+                                   f"{pending} waiting to be hashed)")
     return redirect('logger_settings')
 
 # ------------ footage ------------------
 
-def viewFootage(request):
-    # grab all footage
-    footage_list = Footage.objects.all()
+# how many footage rows are shown per page
+FOOTAGE_PAGE_SIZE = 50
+
+# one page of a queryset, with its rows loaded (so the template does not query)
+# the rows and the count are cached until any footage changes (see cacheHandler)
+# search is the query string the queryset was made from, so it is part of the key
+def _get_page(queryset, number, search):
+    paginator = Paginator(queryset, FOOTAGE_PAGE_SIZE)
+
+    def load():
+        page = paginator.get_page(number)
+        return paginator.count, page.number, list(page.object_list)
+
+    count, number, object_list = cached(make_key("footage", version("footage"), search, number), load)
+    # a cached count, so the paginator does not count again
+    paginator.count = count
+    return Page(object_list, number, paginator)
+
+# render for async views
+# templates (and their context processors, like the logged in user) may still query, so they run in a thread
+async def _arender(request, template_name, context):
+    return await sync_to_async(render)(request, template_name, context)
+
+async def viewFootage(request):
+    # grab all footage (without the stored ffprobe output, the list does not show it)
+    footage_list = Footage.objects.defer('probe')
 
     # you can submit the form with GET
     if request.method == 'GET':
@@ -105,38 +224,29 @@ def viewFootage(request):
     
     # filter results
     if form.is_valid():
-        if form['scene'].value():
-            query1 = footage_list.filter(take__shot_scene_id=form['scene'].value()).distinct()
-            query2 = footage_list.filter(take__marked_scene=form['scene'].value()).distinct()
-            footage_list = query1 | query2
-        if form['shot'].value():
-            query1 = footage_list.filter(take__shot_name=form['shot'].value()).distinct()
-            query2 = footage_list.filter(take__marked_shot=form['shot'].value()).distinct()
-            footage_list = query1 | query2
-        if form['take'].value():
-            query1 = footage_list.filter(take__take_no=form['take'].value()).distinct()
-            query2 = footage_list.filter(take__marked_take=form['take'].value()).distinct()
-            footage_list = query1 | query2
-        if form['logged_filter'].value() == '2':
-            footage_list = footage_list.filter(logged=True).distinct()
-        elif form['logged_filter'].value() == '3':
-            footage_list = footage_list.filter(logged=False).distinct()
-
-    # order results
-    footage_list.order_by("path")
-
-    context = {"list": footage_list, "form":form}
-    return render(request, "footage_list.html", context)
+        footage_list = form.filter_footage(footage_list)
+
+    # order results (id breaks ties so pages never overlap)
+    sort = form.cleaned_data.get('sort') if form.is_valid() else None
+    footage_list = with_ratings(footage_list).order_by(sort or "path", "id")
+
+    # only load one page of footage (ratings and takes included)
+    # the csrf token the search form sends along is different for every user, so it is not part of the key
+    search = sorted((key, value) for key, value in request.GET.lists() if key not in ('page', 'csrfmiddlewaretoken'))
+    page = await sync_to_async(_get_page)(footage_list, request.GET.get('page'), search)
+
+    context = {"list": page, "page": page, "form": form}
+    return await _arender(request, "footage_list.html", context)
 
 # this is the view for editing footage
-def editFootage(request, footage_id):
+async def editFootage(request, footage_id):
     # get the footage
-    footage = get_object_or_404(Footage, pk=footage_id)
+    footage = await aget_object_or_404(Footage, pk=footage_id)
 
     # save on POST if authenticated
-    if request.method == 'POST' and request.user.is_authenticated:
+    if request.method == 'POST' and (await request.auser()).is_authenticated:
         form = FootageForm(request.POST, instance=footage)
-        simple_save_if_valid(form, request)
+        await sync_to_async(simple_save_if_valid)(form, request)
     else:
         form = FootageForm(instance=footage)
     
@@ -144,46 +254,106 @@ def editFootage(request, footage_id):
     take_to_footage = AddTakeToFootageForm(initial={'footage': footage})
     comment_to_footage = CommentForm(initial={'footage': footage})
 
-    # get all take forms
+    # every take with its start time in one query (joined through FootageTake)
+    # only the row being edited (?edit_take= / ?edit_comment=) gets a full form
+    edit_take = request.GET.get('edit_take')
+    takes = (Take.objects.filter(footagetake__footage=footage)
+             .annotate(start_time=F('footagetake__start_time'))
+             .order_by('shot_scene', 'shot_name', 'take_no'))
     all_takes = []
-    for take in footage.take_set.all():
-        start = FootageTake.objects.get(footage=footage, take=take).start_time
-        newTakeForm = TakeInFootageForm(instance=take, initial={"start_time": start})
-        all_takes.append(newTakeForm)
-    
-    # make all comment forms
-    comment_forms = []
-    for comment in Comment.objects.filter(footage=footage).order_by("time"):
-        newCommentForm = CommentForm(instance=comment)
-        comment_forms.append(newCommentForm)
+    async for take in takes:
+        key = f"{take.shot_scene_id}/{take.shot_name}/{take.take_no}"
+        take_form = None
+        if key == edit_take:
+            take_form = TakeInFootageForm(instance=take, initial={"start_time": take.start_time})
+        all_takes.append({"take": take, "key": key, "form": take_form})
+
+    # all comments in one query
+    edit_comment = request.GET.get('edit_comment')
+    comments = []
+    async for comment in Comment.objects.filter(footage=footage).order_by("time"):
+        comment_form = None
+        if str(comment.pk) == edit_comment:
+            comment_form = CommentForm(instance=comment)
+        comments.append({"comment": comment, "form": comment_form})
 
     context = {'form': form, "take_to_footage": take_to_footage,
                "comment_to_footage": comment_to_footage,
                "takes": all_takes,
-               "comments": comment_forms}
-    return render(request, "footage_edit.html", context)
+               "comments": comments}
+    return await _arender(request, "footage_edit.html", context)
 
 class FootageDeleteView(LoginRequiredMixin, DeleteView):
     model = Footage
     success_url = reverse_lazy('View_Footage')
 
+# sends one of the files made for a footage (preview, poster, sprite sheet)
+def _footage_file_response(request, footage, field_file, content_type):
+    if not field_file:
+        raise Http404("This footage has no such file")
+
+    # links that include the preview version never change, so the browser can keep them forever
+    version = footage.proxy_version if field_file.field.name == 'proxy' else footage.preview_version
+    if request.GET.get('v') == version:
+        cache_control = CACHE_FOREVER
+    else:
+        cache_control = CACHE_REVALIDATE
+
+    etag = f"{version}-{field_file.field.name}"
+    return media_response(request, field_file.path, content_type, etag, cache_control, asynchronous=isinstance(request, ASGIRequest))
+
 # page that sends the preview file for a specific footage
-# allows html pages to pull previews for playback
-def getPreview(request, footage_id):
-    footage = get_object_or_404(Footage, pk=footage_id)
-    if footage.preview:
-        filetype = footage.preview.path.rsplit(".", 1)[-1]
+# allows html pages to pull previews for playback (including seeking with byte ranges)
+# while the preview is being made this sends the proxy instead
+async def getPreview(request, footage_id):
+    footage = await aget_object_or_404(Footage, pk=footage_id)
+    if not footage.playable_preview:
+        raise Http404("This footage has no preview")
+
+    content_types = {'mp4': 'video/mp4', 'mp3': 'audio/mpeg'}
+    content_type = content_types.get(footage.previewtype, 'application/octet-stream')
+    return _footage_file_response(request, footage, footage.playable_preview, content_type)
+
+# sends the poster frame of a footage
+async def getPoster(request, footage_id):
+    footage = await aget_object_or_404(Footage, pk=footage_id)
+    return _footage_file_response(request, footage, footage.poster, 'image/jpeg')
+
+# sends the waveform peaks of a footage (binary, see previewHandler.render_peaks)
+async def getPeaks(request, footage_id):
+    footage = await aget_object_or_404(Footage, pk=footage_id)
+    return _footage_file_response(request, footage, footage.peaks, 'application/octet-stream')
+
+# sends the hover-scrub sprite sheet of a footage
+async def getSprite(request, footage_id):
+    footage = await aget_object_or_404(Footage, pk=footage_id)
+    return _footage_file_response(request, footage, footage.sprite, 'image/jpeg')
+
+# sends the HLS playlist or one of the HLS segments of a preview
+# the version is part of the url so the playlist and the segments it points to can be cached forever
+async def getPreviewSegment(request, footage_id, version, segment="index.m3u8"):
+    footage = await aget_object_or_404(Footage, pk=footage_id)
+    if not footage.preview_segments or version != footage.preview_version:
+        raise Http404("This preview has no segments")
+
+    if segment == "index.m3u8":
+        content_type = 'application/vnd.apple.mpegurl'
+    elif re.fullmatch(r"seg\d+\.ts", segment):
+        content_type = 'video/mp2t'
+    else:
+        raise Http404("Unknown segment")
 
-        if filetype == 'mp4':
-            return FileResponse(footage.preview.open('rb'), content_type='video/mp4')
-        elif filetype == 'mp3':
-            return FileResponse(footage.preview.open('rb'), content_type='audio/mp3')
+    path = os.path.join(footage.preview.storage.path(footage.preview_segments), segment)
+    if not os.path.isfile(path):
+        raise Http404("Unknown segment")
+    return media_response(request, path, content_type, f"{version}-{segment}", CACHE_FOREVER, asynchronous=isinstance(request, ASGIRequest))
 
 # ------------ scene ------------------
 
 def viewScenes(request):
-    # get all scenes
-    scene_list = Scene.objects.order_by("script_number")
+    # get all scenes (cached until a scene changes, see signals.py)
+    scene_list = cached(make_key("scenes", version("scenes")),
+                        lambda: list(Scene.objects.order_by("script_number")))
 
     # creates new scene on POST
     if request.method == 'POST' and request.user.is_authenticated:
@@ -206,9 +376,15 @@ class SceneDeleteView(LoginRequiredMixin, DeleteView):
     model = Scene
     success_url = reverse_lazy('View_Scenes')
 
-def editScene(request, script_number):
+# a scene and its shots (the scene is joined in, every shot prints its number)
+def _load_scene(script_number):
     scene = get_object_or_404(Scene, script_number=script_number)
-    shot_list = Shot.objects.filter(scene=scene).order_by("shot")
+    return scene, list(Shot.objects.filter(scene=scene).select_related("scene").order_by("shot"))
+
+def editScene(request, script_number):
+    # cached until the scene or one of its shots changes (see signals.py)
+    group = f"scene:{script_number}"
+    scene, shot_list = cached(make_key(group, version(group)), lambda: _load_scene(script_number))
 
     if request.method == 'POST' and request.user.is_authenticated:
         form = SceneForm(request.POST, instance=scene)
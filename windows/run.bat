@@ -40,6 +40,9 @@ set pip=%my_path%\venv\Scripts\pip.exe
 @echo [[starting server]]
 cd reel_logger
 
+@echo [[starting preview worker]]
+start "preview worker" %python% manage.py preview_worker
+
 %python% manage.py runserver 0.0.0.0:8000
 
 @echo server is set up